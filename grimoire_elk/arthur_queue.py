@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+"""Consumer of the items collected by Arthur in its Redis queue"""
+
+import logging
+import pickle
+
+from arthur.common import Q_STORAGE_ITEMS
+
+
+logger = logging.getLogger(__name__)
+
+ARTHUR_REDIS_URL = 'redis://localhost/8'
+
+# Move up to ARGV[1] items from the head of the queue KEYS[1] to the
+# tail of the queue KEYS[2], returning them
+MOVE_ITEMS_SCRIPT = """
+local items = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #items > 0 then
+    redis.call('LTRIM', KEYS[1], #items, -1)
+    redis.call('RPUSH', KEYS[2], unpack(items))
+end
+return items
+"""
+
+
+class ArthurQueueConsumer:
+    """Consume the items of a tag collected by Arthur in its Redis queue.
+
+    Items are read from the head of the queue in batches of `batch_size`
+    and moved to a processing queue for the tag in the same atomic
+    operation. The items of the tag are given to `handler`, and the items
+    of other tags are moved to a queue per tag (`<queue>:<tag>`), where the
+    consumers of those tags read them first. The batch is removed from the
+    processing queue only once the handler finished, so if it fails (e.g.
+    ES does not accept the items) the batch is consumed again in the next
+    run. Only one batch is kept in memory.
+
+    :param conn: Redis connection
+    :param tag: tag of the items to consume
+    :param handler: function receiving a list with the items of a batch
+    :param batch_size: max number of items read at once
+    :param queue: Redis queue where Arthur stores the items
+    """
+
+    def __init__(self, conn, tag, handler, batch_size=1000, queue=Q_STORAGE_ITEMS):
+        self.conn = conn
+        self.tag = tag
+        self.handler = handler
+        self.batch_size = batch_size
+        self.queue = queue
+        self.tag_queue = self.get_tag_queue(tag)
+        self.processing_queue = "%s:processing:%s" % (queue, tag)
+        self.consumed = 0  # items given to the handler
+        self.routed = 0  # items moved to the queues of other tags
+
+        self._move_items = conn.register_script(MOVE_ITEMS_SCRIPT)
+
+    def get_tag_queue(self, tag):
+        """Queue with the items of tag read by the consumers of other tags"""
+
+        return "%s:%s" % (self.queue, tag)
+
+    def consume(self):
+        """Consume the items of the tag queued in Arthur.
+
+        Only the items already queued when each queue is started are read,
+        so a busy Arthur does not keep the consumer running forever.
+
+        :returns: number of items given to the handler
+        """
+        # Batch not acknowledged in a previous run
+        self.__consume_batch(self.conn.lrange(self.processing_queue, 0, -1))
+
+        for queue in [self.tag_queue, self.queue]:
+            pending = self.conn.llen(queue)
+            while pending > 0:
+                raw_items = self._move_items(keys=[queue, self.processing_queue],
+                                             args=[min(self.batch_size, pending)])
+                if not raw_items:
+                    break
+                pending -= len(raw_items)
+                self.__consume_batch(raw_items)
+
+        logger.debug("Items consumed from arthur for %s: %i (%i routed to other tags)",
+                     self.tag, self.consumed, self.routed)
+
+        return self.consumed
+
+    def __consume_batch(self, raw_items):
+        if not raw_items:
+            return
+
+        items = []
+        others = {}
+        for raw_item in raw_items:
+            item = pickle.loads(raw_item)
+            if item['tag'] == self.tag:
+                items.append(item)
+            else:
+                others.setdefault(item['tag'], []).append(raw_item)
+
+        if items:
+            self.handler(items)
+
+        # Acknowledge the batch, routing the items of other tags
+        pipe = self.conn.pipeline(transaction=True)
+        for tag, tag_items in others.items():
+            pipe.rpush(self.get_tag_queue(tag), *tag_items)
+        pipe.delete(self.processing_queue)
+        pipe.execute()
+
+        self.consumed += len(items)
+        self.routed += len(raw_items) - len(items)
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+"""Feed and enrich several data sources in the same process (p2o batch mode)"""
+
+import json
+import logging
+import time
+import traceback
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .elastic import ElasticSearch
+from .elk import feed_backend, enrich_backend
+from .errors import ELKError
+
+
+logger = logging.getLogger(__name__)
+
+
+def read_jobs(path):
+    """Read the jobs of a batch from a JSON file.
+
+    The file contains a list of jobs. Each job is a dict with the
+    backend, its params (backend_args) and the raw (index) and
+    enriched (index_enrich) indexes. The project can also be set.
+
+    :param path: path of the JSON file
+    :returns: list of jobs
+    """
+    with open(path) as f:
+        jobs = json.load(f)
+
+    if not isinstance(jobs, list):
+        raise ELKError(cause="Batch file %s must contain a list of jobs" % path)
+
+    for job in jobs:
+        if 'backend' not in job:
+            raise ELKError(cause="Job without backend in batch file %s: %s" % (path, job))
+
+    return jobs
+
+
+def run_job(args, backend, backend_args, index=None, index_enrich=None, project=None,
+            shared_sh_caches=None):
+    """Feed and enrich a data source using the p2o params in args.
+
+    :returns: True if the feed and the enrichment were done without errors
+    """
+    url = args.elastic_url
+
+    clean = args.no_incremental
+    if args.fetch_cache:
+        clean = True
+
+    done = True
+
+    if not args.enrich_only:
+        done = feed_backend(url, clean, args.fetch_cache,
+                            backend, backend_args,
+                            index, index_enrich, project,
+                            args.arthur, args.raw_store)
+        logger.info("Backend feed completed")
+
+    if args.enrich or args.enrich_only:
+        unaffiliated_group = None
+        enriched = enrich_backend(url, clean, backend, backend_args,
+                                  index, index_enrich,
+                                  args.db_projects_map, args.json_projects_map,
+                                  args.db_sortinghat,
+                                  args.no_incremental, args.only_identities,
+                                  args.github_token,
+                                  args.studies, args.only_studies,
+                                  args.elastic_url_enrich, args.events_enrich,
+                                  args.db_user, args.db_password, args.db_host,
+                                  args.refresh_projects,
+                                  args.refresh_identities or args.refresh_identities_incremental,
+                                  args.author_id, args.author_uuid,
+                                  args.filter_raw, args.filters_raw_prefix,
+                                  args.jenkins_rename_file, unaffiliated_group,
+                                  args.pair_programming, args.sh_cache_size,
+                                  args.refresh_identities_incremental,
+                                  args.fused_identities, args.github_logins_cache,
+                                  args.studies_workers, shared_sh_caches,
+                                  args.raw_store if args.replay_raw_store else None,
+                                  args.ceres_workers)
+        done = enriched and done
+        logger.info("Enrich backend completed")
+    elif args.events_enrich:
+        logger.info("Enrich option is needed for events_enrich")
+
+    return done
+
+
+def run_batch(args, jobs, workers=1):
+    """Run the jobs of a batch using a pool of `workers` threads.
+
+    The jobs share the ES version, HTTP sessions and indexes already
+    set up, the JSON projects map and the SortingHat caches of each
+    backend. The params in args are used for all the jobs; the project
+    in a job overrides the one in args.
+
+    :param args: p2o params
+    :param jobs: list of jobs, as returned by `read_jobs`
+    :param workers: number of jobs running at the same time
+    :returns: list with the backend, params, status (done or failed) and time of each job
+    """
+    ElasticSearch.shared = True
+    shared_sh_caches = {}
+
+    def run(job):
+        start = time.time()
+        try:
+            done = run_job(args, job['backend'], job.get('backend_args', []),
+                           job.get('index'), job.get('index_enrich'),
+                           job.get('project', args.project),
+                           shared_sh_caches)
+        except Exception:
+            logger.error("Error running job %s %s", job['backend'], job.get('backend_args'))
+            traceback.print_exc()
+            done = False
+
+        result = {
+            "backend": job['backend'],
+            "backend_args": job.get('backend_args', []),
+            "status": "done" if done else "failed",
+            "time": time.time() - start
+        }
+        logger.info("[batch] %s %s %s in %.2f secs", result['backend'],
+                    " ".join(result['backend_args']), result['status'], result['time'])
+        return result
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        report = list(executor.map(run, jobs))
+
+    failed = len([result for result in report if result['status'] == 'failed'])
+    logger.info("[batch] %i jobs done, %i failed", len(report) - failed, failed)
+
+    return report
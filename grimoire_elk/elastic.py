@@ -27,12 +27,14 @@ from dateutil import parser
 import json
 import logging
 import sys
+import threading
 from time import time
 
 import requests
 
 from grimoire_elk.errors import ELKError
 from grimoire_elk.enriched.utils import unixtime_to_datetime, grimoire_con
+from grimoire_elk.metrics import metrics
 
 
 logger = logging.getLogger(__name__)
@@ -50,6 +52,15 @@ class ElasticSearch(object):
 
     max_items_bulk = 1000
     max_items_clause = 1000  # max items in search clause (refresh identities)
+    max_items_terms = 65536  # max values in a terms query (index.max_terms_count)
+
+    # Share the ES version, HTTP sessions and indexes already set up between
+    # the instances of a process feeding several data sources (p2o batch mode)
+    shared = False
+    _shared_versions = {}  # url -> major version
+    _shared_sessions = {}  # insecure -> requests session
+    _shared_indexes = set()  # (index url, mappings) already set up
+    _shared_lock = threading.Lock()
 
     @classmethod
     def safe_index(cls, unique_id):
@@ -94,7 +105,12 @@ class ElasticSearch(object):
         '''
 
         # Get major version of Elasticsearch instance
-        self.major = self._check_instance(url, insecure)
+        if self.shared and url in self._shared_versions:
+            self.major = self._shared_versions[url]
+        else:
+            self.major = self._check_instance(url, insecure)
+            if self.shared:
+                self._shared_versions[url] = self.major
         logger.debug("Found version of ES instance at %s: %s.",
                      url, self.major)
 
@@ -105,7 +121,24 @@ class ElasticSearch(object):
         self.index_url = self.url + "/" + self.index
         self.wait_bulk_seconds = 2  # time to wait to complete a bulk operation
 
-        self.requests = grimoire_con(insecure)
+        if not self.shared:
+            self.requests = grimoire_con(insecure)
+            self.__setup_index(mappings, clean, analyzers)
+            return
+
+        with self._shared_lock:
+            if insecure not in self._shared_sessions:
+                self._shared_sessions[insecure] = grimoire_con(insecure)
+            self.requests = self._shared_sessions[insecure]
+
+            # Indexes are set up once, and again only to clean them
+            shared_index = (self.index_url, mappings)
+            if clean or shared_index not in self._shared_indexes:
+                self.__setup_index(mappings, clean, analyzers)
+                self._shared_indexes.add(shared_index)
+
+    def __setup_index(self, mappings, clean, analyzers):
+        """ Create the index if it does not exist, or clean it, and its mappings """
 
         res = self.requests.get(self.index_url)
 
@@ -132,26 +165,33 @@ class ElasticSearch(object):
             map_dict = mappings.get_elastic_mappings(es_major=self.major)
             self.create_mappings(map_dict)
 
-    def safe_put_bulk(self, url, bulk_json):
-        """ Bulk PUT controlling unicode issues """
+    def safe_put_bulk(self, url, bulk_json, refresh=True):
+        """ Bulk PUT controlling unicode issues. With refresh, the items
+        are searchable once it returns """
 
         headers = {"Content-Type": "application/x-ndjson"}
 
-        try:
-            res = self.requests.put(url + '?refresh=true', data=bulk_json, headers=headers)
-            res.raise_for_status()
-        except UnicodeEncodeError:
-            # Related to body.encode('iso-8859-1'). mbox data
-            logger.error("Encondig error ... converting bulk to iso-8859-1")
-            bulk_json = bulk_json.encode('iso-8859-1', 'ignore')
-            res = self.requests.put(url, data=bulk_json, headers=headers)
-            res.raise_for_status()
-
-        result = res.json()
+        with metrics.timer('es_bulk', latency='es') as timing:
+            timing.nbytes = len(bulk_json)
+            try:
+                res = self.requests.put(url + '?refresh=true' if refresh else url, data=bulk_json, headers=headers)
+                res.raise_for_status()
+            except UnicodeEncodeError:
+                # Related to body.encode('iso-8859-1'). mbox data
+                logger.error("Encondig error ... converting bulk to iso-8859-1")
+                bulk_json = bulk_json.encode('iso-8859-1', 'ignore')
+                res = self.requests.put(url, data=bulk_json, headers=headers)
+                res.raise_for_status()
+
+            result = res.json()
+            timing.items = len(result['items'])
+
         failed_items = []
         if result['errors']:
             # Due to multiple errors that may be thrown when inserting bulk data, only the first error is returned
-            failed_items = [item['index'] for item in result['items'] if 'error' in item['index']]
+            # Each item result is keyed by its action: index, update ...
+            items_results = [list(item.values())[0] for item in result['items']]
+            failed_items = [item for item in items_results if 'error' in item]
             error = str(failed_items[0]['error'])
 
             logger.error("Failed to insert data to ES: %s, %s", error, url)
@@ -171,6 +211,40 @@ class ElasticSearch(object):
     def bulk_upload(self, items, field_id):
         """Upload in controlled packs items to ES using bulk API"""
 
+        return self.__bulk(items, field_id)
+
+    def bulk_update(self, items, field_id):
+        """Update in controlled packs items to ES using bulk API.
+
+        Only the fields included in each item are sent and updated,
+        the rest of fields of the document already in ES are kept.
+        """
+
+        return self.__bulk(items, field_id, update=True)
+
+    @staticmethod
+    def bulk_body(items, field_id, update=False):
+        """Body of a bulk request adding (or updating) all the items"""
+
+        bulk_json = ""
+        for item in items:
+            if update:
+                data_json = json.dumps({"doc": item})
+                bulk_json += '{"update" : {"_id" : "%s" } }\n' % (item[field_id])
+            else:
+                data_json = json.dumps(item)
+                bulk_json += '{"index" : {"_id" : "%s" } }\n' % (item[field_id])
+            bulk_json += data_json + "\n"  # Bulk document
+
+        return bulk_json
+
+    def bulk_upload_body(self, bulk_json):
+        """Upload a bulk request body built with bulk_body in a single request"""
+
+        return self.safe_put_bulk(self.index_url + '/items/_bulk', bulk_json)
+
+    def __bulk(self, items, field_id, update=False):
+
         current = 0
         new_items = 0  # total items added with bulk
         bulk_json = ""
@@ -180,7 +254,8 @@ class ElasticSearch(object):
 
         url = self.index_url + '/items/_bulk'
 
-        logger.debug("Adding items to %s (in %i packs)" % (url, self.max_items_bulk))
+        action = "Updating" if update else "Adding"
+        logger.debug("%s items to %s (in %i packs)" % (action, url, self.max_items_bulk))
         task_init = time()
 
         for item in items:
@@ -192,9 +267,7 @@ class ElasticSearch(object):
                 logger.debug("bulk packet sent (%.2f sec, %i total, %.2f MB)"
                              % (time() - task_init, new_items, json_size))
                 bulk_json = ""
-            data_json = json.dumps(item)
-            bulk_json += '{"index" : {"_id" : "%s" } }\n' % (item[field_id])
-            bulk_json += data_json + "\n"  # Bulk document
+            bulk_json += self.bulk_body([item], field_id, update)
             current += 1
 
         if current > 0:
@@ -282,6 +355,41 @@ class ElasticSearch(object):
             except requests.exceptions.HTTPError:
                 logger.warning("Can't add mapping %s: %s", url_map, self.global_mapping())
 
+    def get_metadata(self):
+        """Get the metadata stored in the _meta field of the items mapping
+
+        :returns: a dict with the metadata
+        """
+
+        url = self.index_url + "/_mapping/items"
+
+        res = self.requests.get(url)
+        res.raise_for_status()
+
+        metadata = {}
+        # The index could be an alias, so the real index name is not known
+        for index_mappings in res.json().values():
+            items_mapping = index_mappings['mappings'].get('items', {})
+            metadata = items_mapping.get('_meta', {})
+
+        return metadata
+
+    def set_metadata(self, metadata):
+        """Store metadata in the _meta field of the items mapping
+
+        :param metadata: dict with the fields to be added or updated
+        """
+
+        url = self.index_url + "/_mapping/items"
+        headers = {"Content-Type": "application/json"}
+
+        new_metadata = self.get_metadata()
+        new_metadata.update(metadata)
+
+        res = self.requests.put(url, data=json.dumps({"_meta": new_metadata}),
+                                headers=headers)
+        res.raise_for_status()
+
     def get_last_date(self, field, filters_=[]):
         '''
             :field: field with the data
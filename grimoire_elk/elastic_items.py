@@ -30,6 +30,7 @@ import logging
 
 from .enriched.utils import get_repository_filter, grimoire_con
 from .elastic_mapping import Mapping
+from .metrics import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -54,6 +55,7 @@ class ElasticItems():
         self.requests = grimoire_con(insecure)
         self.elastic = None
         self.elastic_url = None
+        self._connector_name = None  # found the first time it is needed
 
     def get_repository_filter_raw(self, term=False):
         """ Returns the filter to be used in queries in a repository items """
@@ -81,20 +83,24 @@ class ElasticItems():
 
     def get_connector_name(self):
         """ Find the name for the current connector """
-        from .utils import get_connector_name
-        return get_connector_name(type(self))
+        if self._connector_name is None:
+            from .utils import get_connector_name
+            self._connector_name = get_connector_name(type(self))
+        return self._connector_name
 
     # Items generator
-    def fetch(self, _filter=None):
+    def fetch(self, _filter=None, _source=None):
         """ Fetch the items from raw or enriched index. An optional _filter
-        could be provided to filter the data collected """
+        (or a list of them, matching any) could be provided to filter the
+        data collected, and an optional _source list to collect only some
+        fields of the items """
 
         logger.debug("Creating a elastic items generator.")
 
         elastic_scroll_id = None
 
         while True:
-            rjson = self.get_elastic_items(elastic_scroll_id, _filter=_filter)
+            rjson = self.get_elastic_items(elastic_scroll_id, _filter=_filter, _source=_source)
 
             if rjson and "_scroll_id" in rjson:
                 elastic_scroll_id = rjson["_scroll_id"]
@@ -115,9 +121,25 @@ class ElasticItems():
                 break
         return
 
-    def get_elastic_items(self, elastic_scroll_id=None, _filter=None):
+    @classmethod
+    def __get_terms_filter(cls, _filter):
+        """ Build a terms query from a {"name": field, "value": values} filter,
+        or a wildcard query if the filter includes "type": "wildcard" and a
+        pattern as value. A list of filters matches the items matching any of them. """
+
+        if isinstance(_filter, list):
+            return {"bool": {"should": [cls.__get_terms_filter(f) for f in _filter],
+                             "minimum_should_match": 1}}
+
+        if _filter.get('type') == 'wildcard':
+            return {"wildcard": {_filter['name']: _filter['value']}}
+
+        return {"terms": {_filter['name']: list(_filter['value'])}}
+
+    def get_elastic_items(self, elastic_scroll_id=None, _filter=None, _source=None):
         """ Get the items from the index related to the backend applying and
-        optional _filter if provided"""
+        optional _filter if provided. If _source is provided, only those
+        fields are included in the items."""
 
         headers = {"Content-Type": "application/json"}
 
@@ -158,14 +180,7 @@ class ElasticItems():
                 ''' % (self.filter_raw['name'], self.filter_raw['value'])
 
             if _filter:
-                filter_str = '''
-                    , {"terms":
-                        { "%s": %s }
-                    }
-                ''' % (_filter['name'], _filter['value'])
-                # List to string conversion uses ' that are not allowed in JSON
-                filter_str = filter_str.replace("'", "\"")
-                filters += filter_str
+                filters += ", " + json.dumps(self.__get_terms_filter(_filter))
 
             if self.from_date:
                 date_field = self.get_incremental_date()
@@ -195,6 +210,9 @@ class ElasticItems():
             if order_field is not None:
                 order_query = ', "sort": { "%s": { "order": "asc" }} ' % order_field
 
+            if _source:
+                order_query += ', "_source": %s ' % json.dumps(_source)
+
             filters_should = ''
             if self.filter_raw_should:
                 filters_should = json.dumps(self.filter_raw_should)[1:-1]
@@ -234,9 +252,12 @@ class ElasticItems():
         items = []
         rjson = None
         try:
-            res = self.requests.post(url, data=query_data, headers=headers)
-            res.raise_for_status()
-            rjson = res.json()
+            with metrics.timer('es_read', latency='es') as timing:
+                res = self.requests.post(url, data=query_data, headers=headers)
+                res.raise_for_status()
+                rjson = res.json()
+                timing.nbytes = len(res.content)
+                timing.items = len(rjson.get('hits', {}).get('hits', []))
         except Exception:
             # The index could not exists yet or it could be empty
             logger.warning("No JSON found in %s" % (res.text))
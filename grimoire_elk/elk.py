@@ -24,18 +24,21 @@
 #
 
 import inspect
+import json
 import logging
-import pickle
+import time
 import traceback
 
-import redis
-
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
 from dateutil import parser
 
-from arthur.common import Q_STORAGE_ITEMS
 from perceval.backend import find_signature_parameters, Archive
 
+from .errors import ELKError
+from .metrics import metrics
+from .profiling import profiler
+from .raw_store import RawStore, ReplayOceanBackend
 from .utils import get_elastic
 from .utils import get_connectors, get_connector_from_name
 from .enriched.sortinghat_gelk import SortingHat
@@ -46,63 +49,44 @@ logger = logging.getLogger(__name__)
 
 requests_ses = grimoire_con()
 
-arthur_items = {}  # Hash with tag list with all items collected from arthur queue
-
-
-def feed_arthur():
-    """ Feed Ocean with backend data collected from arthur redis queue"""
-
-    logger.info("Collecting items from redis queue")
+SH_REFRESH_META = 'sh_last_refresh'  # date of the last identities refresh in enriched index _meta
 
-    db_url = 'redis://localhost/8'
-
-    conn = redis.StrictRedis.from_url(db_url)
-    logger.debug("Redis connection stablished with %s.", db_url)
-
-    # Get and remove queued items in an atomic transaction
-    pipe = conn.pipeline()
-    pipe.lrange(Q_STORAGE_ITEMS, 0, -1)
-    pipe.ltrim(Q_STORAGE_ITEMS, 1, 0)
-    items = pipe.execute()[0]
-
-    for item in items:
-        arthur_item = pickle.loads(item)
-        if arthur_item['tag'] not in arthur_items:
-            arthur_items[arthur_item['tag']] = []
-        arthur_items[arthur_item['tag']].append(arthur_item)
 
-    for tag in arthur_items:
-        logger.debug("Items for %s: %i", tag, len(arthur_items[tag]))
+def feed_backend_arthur(ocean_backend, redis_url=None, batch_size=1000):
+    """ Feed Ocean with the items of its backend collected in the arthur redis queue.
 
+    Items are read and uploaded in batches, and removed from the queue
+    once all of them are stored in ES. Returns the number of items read """
 
-def feed_backend_arthur(backend_name, backend_params):
-    """ Feed Ocean with backend data collected from arthur redis queue"""
+    # redis and arthur are only needed when feeding from arthur
+    import redis
+    from .arthur_queue import ARTHUR_REDIS_URL, ArthurQueueConsumer
 
-    # Always get pending items from arthur for all data sources
-    feed_arthur()
+    redis_url = redis_url if redis_url else ARTHUR_REDIS_URL
+    conn = redis.StrictRedis.from_url(redis_url)
+    logger.debug("Redis connection stablished with %s.", redis_url)
 
-    logger.debug("Items available for %s", arthur_items.keys())
+    tag = ocean_backend.perceval_backend.tag
+    logger.info("Collecting items for %s from redis queue", tag)
 
-    # Get only the items for the backend
-    if not get_connector_from_name(backend_name):
-        raise RuntimeError("Unknown backend %s" % backend_name)
-    connector = get_connector_from_name(backend_name)
-    klass = connector[3]  # BackendCmd for the connector
+    def upload_items(items):
+        # Batches with items not stored are kept in the queue to be read again
+        ocean_backend.feed_items(items, strict=True)
 
-    backend_cmd = init_backend(klass(*backend_params))
+    consumer = ArthurQueueConsumer(conn, tag, upload_items, batch_size)
+    total = consumer.consume()
 
-    tag = backend_cmd.backend.tag
-    logger.debug("Getting items for %s.", tag)
+    logger.info("Items collected for %s from redis queue: %i", tag, total)
 
-    if tag in arthur_items:
-        logger.debug("Found items for %s.", tag)
-        for item in arthur_items[tag]:
-            yield item
+    return total
 
 
 def feed_backend(url, clean, fetch_archive, backend_name, backend_params,
-                 es_index=None, es_index_enrich=None, project=None, arthur=False):
-    """ Feed Ocean with backend data """
+                 es_index=None, es_index_enrich=None, project=None, arthur=False,
+                 raw_store=None):
+    """ Feed Ocean with backend data. Returns False if there were errors.
+
+    If raw_store (a path) is given, the items are also stored in a local RawStore """
 
     backend = None
     repo = {'backend_name': backend_name, 'backend_params': backend_params}  # repository data to be stored in conf
@@ -147,6 +131,12 @@ def feed_backend(url, clean, fetch_archive, backend_name, backend_params,
         ocean_backend = connector[1](backend, fetch_archive=fetch_archive, project=project)
         elastic_ocean = get_elastic(url, es_index, clean, ocean_backend)
         ocean_backend.set_elastic(elastic_ocean)
+        if raw_store:
+            store = RawStore(raw_store)
+            if clean:
+                # The raw index is recreated, so are the stored items
+                store.clear(backend.origin)
+            ocean_backend.set_raw_store(store)
 
         if fetch_archive:
             signature = inspect.signature(backend.fetch_from_archive)
@@ -182,30 +172,29 @@ def feed_backend(url, clean, fetch_archive, backend_name, backend_params,
                 latest_items = backend_cmd.parsed_args.latest_items
 
         # fetch params support
-        if arthur:
-            # If using arthur just provide the items generator to be used
-            # to collect the items and upload to Elasticsearch
-            aitems = feed_backend_arthur(backend_name, backend_params)
-            ocean_backend.feed(arthur_items=aitems)
-        elif latest_items:
-            if category:
-                ocean_backend.feed(latest_items=latest_items, category=category)
-            else:
-                ocean_backend.feed(latest_items=latest_items)
-        elif offset:
-            if category:
-                ocean_backend.feed(from_offset=offset, category=category)
-            else:
-                ocean_backend.feed(from_offset=offset)
-        elif from_date and from_date.replace(tzinfo=None) != parser.parse("1970-01-01"):
-            if category:
-                ocean_backend.feed(from_date, category=category)
+        with profiler.stage('feed', backend_name):
+            if arthur:
+                # If using arthur, the items collected by it are uploaded to Elasticsearch
+                feed_backend_arthur(ocean_backend)
+            elif latest_items:
+                if category:
+                    ocean_backend.feed(latest_items=latest_items, category=category)
+                else:
+                    ocean_backend.feed(latest_items=latest_items)
+            elif offset:
+                if category:
+                    ocean_backend.feed(from_offset=offset, category=category)
+                else:
+                    ocean_backend.feed(from_offset=offset)
+            elif from_date and from_date.replace(tzinfo=None) != parser.parse("1970-01-01"):
+                if category:
+                    ocean_backend.feed(from_date, category=category)
+                else:
+                    ocean_backend.feed(from_date)
+            elif category:
+                ocean_backend.feed(category=category)
             else:
-                ocean_backend.feed(from_date)
-        elif category:
-            ocean_backend.feed(category=category)
-        else:
-            ocean_backend.feed()
+                ocean_backend.feed()
 
     except Exception as ex:
         if backend:
@@ -215,77 +204,90 @@ def feed_backend(url, clean, fetch_archive, backend_name, backend_params,
         else:
             logger.error("Error feeding ocean %s" % ex)
             traceback.print_exc()
+        done = False
+    else:
+        done = True
 
     logger.info("Done %s " % (backend_name))
 
+    return done
 
-def get_items_from_uuid(uuid, enrich_backend, ocean_backend):
-    """ Get all items that include uuid """
 
-    # logger.debug("Getting items for merged uuid %s "  % (uuid))
+def get_items_from_uuid(uuid, enrich_backend, ocean_backend):
+    """ Get all raw items whose enriched items include uuid """
 
-    uuid_fields = enrich_backend.get_fields_uuid()
+    return get_items_from_uuids([uuid], enrich_backend, ocean_backend)
 
-    terms = ""  # all terms with uuids in the enriched item
 
-    for field in uuid_fields:
-        terms += """
-         {"term": {
-           "%s": {
-              "value": "%s"
-           }
-         }}
-         """ % (field, uuid)
-        terms += ","
+def get_items_from_uuids(uuids, enrich_backend, ocean_backend):
+    """ Get all raw items whose enriched items include any of the uuids.
 
-    terms = terms[:-1]  # remove last , for last item
+    Enriched items are read with search_after in a single query for all
+    the uuids, so all of them are included, and the raw items are
+    retrieved with _mget in batches, yielded as each batch arrives.
+    """
 
-    query = """
-    {"query": { "bool": { "should": [%s] }}}
-    """ % (terms)
+    items_ids = set()
+    pending = []
 
-    url_search = enrich_backend.elastic.index_url + "/_search"
-    url_search += "?size=1000"  # TODO get all items
+    for eitem in _get_eitems_from_uuids(uuids, enrich_backend):
+        item_id = enrich_backend.get_item_id(eitem)
+        # For one item several eitems could be generated
+        if item_id in items_ids:
+            continue
+        items_ids.add(item_id)
+        pending.append(item_id)
 
-    r = requests_ses.post(url_search, data=query)
+        if len(pending) >= ocean_backend.elastic.max_items_bulk:
+            yield from _get_items_from_ids(pending, ocean_backend)
+            pending = []
 
-    eitems = r.json()['hits']['hits']
+    if pending:
+        yield from _get_items_from_ids(pending, ocean_backend)
 
-    if len(eitems) == 0:
-        # logger.warning("No enriched items found for uuid: %s " % (uuid))
-        return []
+    logger.debug("Items to be renriched for merged uuids %s: %i", uuids, len(items_ids))
 
-    items_ids = []
 
-    for eitem in eitems:
-        item_id = enrich_backend.get_item_id(eitem)
-        # For one item several eitems could be generated
-        if item_id not in items_ids:
-            items_ids.append(item_id)
+def _get_eitems_from_uuids(uuids, enrich_backend):
+    """ Get all the enriched items including any of the uuids using search_after """
 
-    # Time to get the items
-    logger.debug("Items to be renriched for merged uuids: %s" % (",".join(items_ids)))
-
-    url_mget = ocean_backend.elastic.index_url + "/_mget"
-
-    items_ids_query = ""
+    uuid_fields = enrich_backend.get_fields_uuid()
+    # _uid is the unique field to sort on in ES < 6
+    sort_field = "_id" if enrich_backend.elastic.major not in ['2', '5'] else "_uid"
+    url_search = enrich_backend.elastic.index_url + "/_search"
+    headers = {"Content-Type": "application/json"}
+
+    terms = [{"terms": {field: list(uuids)}} for field in uuid_fields]
+    query = {
+        "size": enrich_backend.elastic.max_items_bulk,
+        "query": {"bool": {"should": terms, "minimum_should_match": 1}},
+        "sort": [{sort_field: "asc"}]
+    }
+
+    while True:
+        r = requests_ses.post(url_search, data=json.dumps(query), headers=headers)
+        r.raise_for_status()
+        eitems = r.json()['hits']['hits']
+        if not eitems:
+            break
+        for eitem in eitems:
+            yield eitem
+        query['search_after'] = eitems[-1]['sort']
 
-    for item_id in items_ids:
-        items_ids_query += '{"_id" : "%s"}' % (item_id)
-        items_ids_query += ","
-    items_ids_query = items_ids_query[:-1]  # remove last , for last item
 
-    query = '{"docs" : [%s]}' % (items_ids_query)
-    r = requests_ses.post(url_mget, data=query)
+def _get_items_from_ids(items_ids, ocean_backend):
+    """ Get the raw items with items_ids using _mget """
 
-    res_items = r.json()['docs']
+    url_mget = ocean_backend.elastic.index_url + "/_mget"
+    headers = {"Content-Type": "application/json"}
 
-    items = []
-    for res_item in res_items:
-        if res_item['found']:
-            items.append(res_item["_source"])
+    query = {"docs": [{"_id": item_id} for item_id in items_ids]}
+    r = requests_ses.post(url_mget, data=json.dumps(query), headers=headers)
+    r.raise_for_status()
 
-    return items
+    for res_item in r.json()['docs']:
+        if res_item.get('found'):
+            yield res_item["_source"]
 
 
 def refresh_projects(enrich_backend):
@@ -302,7 +304,33 @@ def refresh_projects(enrich_backend):
     logger.info("Total eitems refreshed for project field %i", total)
 
 
-def refresh_identities(enrich_backend, filter_author=None):
+def get_identities_fields(enrich_backend):
+    """Get the SortingHat id and uuid fields used in the enriched items
+
+    :param enrich_backend: enriched backend
+    :returns: a tuple with the list of id fields and the list of uuid fields
+    """
+
+    author_field = enrich_backend.get_field_author()
+    if not author_field:
+        return [], []
+
+    try:
+        roles = list(enrich_backend.roles)
+    except AttributeError:
+        roles = []
+
+    for rol in [author_field, 'author']:
+        if rol not in roles:
+            roles.append(rol)
+
+    id_fields = [rol + "_id" for rol in roles]
+    uuid_fields = [rol + "_uuid" for rol in roles]
+
+    return id_fields, uuid_fields
+
+
+def refresh_identities(enrich_backend, filter_author=None, match_item=None):
     """Refresh identities in enriched index.
 
     Retrieve items from the enriched index corresponding to enrich_backend,
@@ -310,24 +338,41 @@ def refresh_identities(enrich_backend, filter_author=None):
     SortingHat database.
 
     Instead of the whole index, only items matching the filter_author
-    filter are fitered, if that parameters is not None.
+    filter are fitered, if that parameters is not None. A list of filters
+    matches the items matching any of them. Items could be also selected
+    using the match_item function, once they are retrieved from the index.
+
+    Only the fields needed to compute the identities are retrieved, and
+    the items generated are partial documents with the unique id field
+    and the identities fields, to be uploaded using bulk updates.
 
     :param enrich_backend: enriched backend to update
     :param  filter_author: filter to use to match items
+    :param match_item: function returning True for the items to refresh
     """
 
+    field_id = enrich_backend.get_field_unique_id()
+
+    roles = None
+    try:
+        roles = enrich_backend.roles
+    except AttributeError:
+        pass
+
+    # Fields needed by get_item_sh_from_id and match_item
+    id_fields, uuid_fields = get_identities_fields(enrich_backend)
+    source = [field_id, enrich_backend.get_field_date()] + id_fields + uuid_fields
+
     def update_items(new_filter_author):
 
-        for eitem in enrich_backend.fetch(new_filter_author):
-            # logger.info(eitem)
-            roles = None
-            try:
-                roles = enrich_backend.roles
-            except AttributeError:
-                pass
+        for eitem in enrich_backend.fetch(new_filter_author, _source=source):
+            if match_item and not match_item(eitem):
+                continue
             new_identities = enrich_backend.get_item_sh_from_id(eitem, roles)
-            eitem.update(new_identities)
-            yield eitem
+            if not new_identities:
+                continue
+            new_identities[field_id] = eitem[field_id]
+            yield new_identities
 
     logger.debug("Refreshing identities fields from %s", enrich_backend.elastic.index_url)
 
@@ -335,9 +380,9 @@ def refresh_identities(enrich_backend, filter_author=None):
 
     max_ids = enrich_backend.elastic.max_items_clause
 
-    if filter_author is None:
-        # No filter, update all items
-        for item in update_items(None):
+    if filter_author is None or isinstance(filter_author, list):
+        # No filter, update all items, or several filters in one query
+        for item in update_items(filter_author):
             yield item
             total += 1
     else:
@@ -359,11 +404,90 @@ def refresh_identities(enrich_backend, filter_author=None):
     logger.info("Total eitems refreshed for identities fields %i", total)
 
 
+def get_last_identities_refresh(enrich_backend):
+    """Get the date of the last identities refresh in the enriched index"""
+
+    last_refresh = enrich_backend.elastic.get_metadata().get(SH_REFRESH_META)
+
+    if last_refresh:
+        last_refresh = parser.parse(last_refresh)
+
+    return last_refresh
+
+
+def set_last_identities_refresh(enrich_backend, refresh_date):
+    """Store the date of the last identities refresh in the enriched index"""
+
+    enrich_backend.elastic.set_metadata({SH_REFRESH_META: refresh_date.isoformat()})
+    logger.info("Identities refresh date for %s: %s", enrich_backend.elastic.index_url,
+                refresh_date.isoformat())
+
+
+def refresh_identities_incremental(enrich_backend):
+    """Refresh the identities modified in SortingHat since the last refresh.
+
+    The unique identities (including changes in their profiles and
+    enrollments) and the identities modified in SortingHat since the
+    last refresh are used to select the enriched items to refresh. Using
+    the identities ids, the items with uuids merged into other ones are
+    also refreshed. If there is no previous refresh, all the items are
+    refreshed.
+
+    When there are too many changes to include them in a query, the
+    enriched index is read just once, matching the items to refresh
+    while reading them.
+
+    :param enrich_backend: enriched backend to update
+    """
+
+    last_refresh = get_last_identities_refresh(enrich_backend)
+
+    if not last_refresh:
+        logger.info("No previous identities refresh in %s. Refreshing all items.",
+                    enrich_backend.elastic.index_url)
+        for eitem in refresh_identities(enrich_backend):
+            yield eitem
+        return
+
+    uuids, ids = SortingHat.get_modified_identities(enrich_backend.sh_db, last_refresh)
+
+    logger.info("Identities modified since %s: %i unique identities, %i identities",
+                last_refresh.isoformat(), len(uuids), len(ids))
+
+    if not uuids and not ids:
+        return
+
+    id_fields, uuid_fields = get_identities_fields(enrich_backend)
+
+    if len(uuids) + len(ids) <= enrich_backend.elastic.max_items_terms:
+        filters = []
+        if uuids:
+            filters += [{"name": field, "value": uuids} for field in uuid_fields]
+        if ids:
+            filters += [{"name": field, "value": ids} for field in id_fields]
+
+        for eitem in refresh_identities(enrich_backend, filters):
+            yield eitem
+    else:
+        uuids = set(uuids)
+        ids = set(ids)
+
+        def match_item(eitem):
+            return any(eitem.get(field) in uuids for field in uuid_fields) or \
+                any(eitem.get(field) in ids for field in id_fields)
+
+        logger.info("Too many identities to filter them in Elasticsearch. Matching them while reading.")
+        for eitem in refresh_identities(enrich_backend, match_item=match_item):
+            yield eitem
+
+
 def load_identities(ocean_backend, enrich_backend):
     # First we add all new identities to SH
+    start = time.time()
     items_count = 0
     identities_count = 0
     new_identities = []
+    batch = []
 
     # Support that ocean_backend is a list of items (old API)
     if isinstance(ocean_backend, list):
@@ -371,15 +495,22 @@ def load_identities(ocean_backend, enrich_backend):
     else:
         items = ocean_backend.fetch()
 
+    def get_batch_identities(batch):
+        # Get identities from new items to be added to SortingHat
+        enrich_backend.prepare_identities(batch)
+        for item in batch:
+            identities = enrich_backend.get_identities(item)
+            for identity in identities:
+                if identity not in new_identities:
+                    new_identities.append(identity)
+
     for item in items:
         items_count += 1
-        # Get identities from new items to be added to SortingHat
-        identities = enrich_backend.get_identities(item)
-        for identity in identities:
-            if identity not in new_identities:
-                new_identities.append(identity)
+        batch.append(item)
 
         if items_count % 500 == 0:
+            get_batch_identities(batch)
+            batch = []
             inserted_identities = load_bulk_identities(items_count,
                                                        new_identities,
                                                        enrich_backend.sh_db,
@@ -387,6 +518,9 @@ def load_identities(ocean_backend, enrich_backend):
             identities_count += inserted_identities
             new_identities = []
 
+    if batch:
+        get_batch_identities(batch)
+
     if new_identities:
         inserted_identities = load_bulk_identities(items_count,
                                                    new_identities,
@@ -394,9 +528,72 @@ def load_identities(ocean_backend, enrich_backend):
                                                    enrich_backend.get_connector_name())
         identities_count += inserted_identities
 
+    metrics.add('load_identities', time.time() - start, items_count)
+
     return identities_count
 
 
+class IdentitiesOceanBackend:
+    """ Ocean backend which loads the identities of the items in SortingHat while fetching them.
+
+    Raw items are read in batches. The new identities of each batch are
+    added to SortingHat before the items are returned, so the enrichment
+    reads the raw index once instead of twice (load_identities + enrich).
+    The rest of the attributes are taken from the wrapped ocean backend.
+
+    :param ocean_backend: ocean backend to read the raw items from
+    :param enrich_backend: enrich backend with SortingHat active
+    :param batch_size: number of raw items per batch
+    """
+
+    def __init__(self, ocean_backend, enrich_backend, batch_size=500):
+        self.ocean_backend = ocean_backend
+        self.enrich_backend = enrich_backend
+        self.batch_size = batch_size
+        self.identities_count = 0
+        # Identities already added in this run
+        self.loaded = set()
+
+    def __getattr__(self, name):
+        return getattr(self.ocean_backend, name)
+
+    def fetch(self, *args, **kwargs):
+        """ Fetch the raw items loading their new identities before returning them """
+
+        items_count = 0
+        batch = []
+
+        for item in self.ocean_backend.fetch(*args, **kwargs):
+            items_count += 1
+            batch.append(item)
+
+            if len(batch) >= self.batch_size:
+                self.__load_identities(batch, items_count)
+                yield from batch
+                batch = []
+
+        if batch:
+            self.__load_identities(batch, items_count)
+            yield from batch
+
+    def __load_identities(self, items, items_count):
+        new_identities = []
+
+        self.enrich_backend.prepare_identities(items)
+        for item in items:
+            for identity in self.enrich_backend.get_identities(item):
+                identity_key = tuple(sorted(identity.items()))
+                if identity_key not in self.loaded:
+                    self.loaded.add(identity_key)
+                    new_identities.append(identity)
+
+        if new_identities:
+            self.identities_count += load_bulk_identities(items_count,
+                                                          new_identities,
+                                                          self.enrich_backend.sh_db,
+                                                          self.enrich_backend.get_connector_name())
+
+
 def load_bulk_identities(items_count, new_identities, sh_db, connector_name):
     identities_count = len(new_identities)
 
@@ -411,10 +608,16 @@ def load_bulk_identities(items_count, new_identities, sh_db, connector_name):
 def enrich_items(ocean_backend, enrich_backend, events=False):
     total = 0
 
-    if not events:
-        total = enrich_backend.enrich_items(ocean_backend)
-    else:
-        total = enrich_backend.enrich_events(ocean_backend)
+    with metrics.timer('enrich') as timing, profiler.stage('enrich', enrich_backend.get_connector_name()):
+        if not events:
+            total = enrich_backend.enrich_items(ocean_backend)
+        else:
+            total = enrich_backend.enrich_events(ocean_backend)
+        timing.items = total or 0
+
+    if enrich_backend.sortinghat:
+        enrich_backend.log_sh_caches_stats()
+
     return total
 
 
@@ -466,14 +669,69 @@ def get_ocean_backend(backend_cmd, enrich_backend, no_incremental,
     return ocean_backend
 
 
-def do_studies(enrich_backend, no_incremental=False):
-    try:
-        for study in enrich_backend.studies:
-            logger.info("Starting study: %s (no_incremental %s)", study, no_incremental)
-            study(enrich_backend, no_incremental)
-    except Exception as e:
-        logger.error("Problem executing study %s", study)
-        traceback.print_exc()
+def do_studies(enrich_backend, no_incremental=False, workers=1):
+    """Execute the studies of enrich_backend, up to `workers` of them at the same time.
+
+    A study is started once the studies it depends on (`enrich_backend.studies_deps`)
+    have finished, and it is skipped if any of them failed. Errors in a study
+    don't stop the rest.
+
+    :param enrich_backend: enricher with the studies to execute
+    :param no_incremental: execute the studies from scratch
+    :param workers: max number of studies executed concurrently
+    :return: dict with the status (done, failed or skipped) and time of each study
+    """
+    studies = {study.__name__: study for study in enrich_backend.studies}
+    deps = getattr(enrich_backend, 'studies_deps', {})
+
+    for name in studies:
+        for dep in deps.get(name, []):
+            if dep not in studies:
+                raise ELKError(cause="Study %s depends on unknown study %s" % (name, dep))
+
+    report = {}
+    pending = list(studies)
+    running = {}
+
+    def run_study(name):
+        logger.info("Starting study: %s (no_incremental %s)", name, no_incremental)
+        start = time.time()
+        try:
+            with profiler.stage('study', name):
+                studies[name](enrich_backend, no_incremental)
+            status = 'done'
+        except Exception:
+            logger.error("Problem executing study %s", name)
+            traceback.print_exc()
+            status = 'failed'
+        return status, time.time() - start
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while pending or running:
+            for name in list(pending):
+                name_deps = deps.get(name, [])
+                if any(report.get(dep, {}).get('status') in ('failed', 'skipped') for dep in name_deps):
+                    logger.warning("Study %s skipped, a study it depends on was not done", name)
+                    report[name] = {'status': 'skipped', 'time': 0}
+                    pending.remove(name)
+                elif all(dep in report for dep in name_deps):
+                    running[executor.submit(run_study, name)] = name
+                    pending.remove(name)
+
+            if not running:
+                if pending:
+                    raise ELKError(cause="Circular dependencies in studies %s" % pending)
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                status, seconds = future.result()
+                report[name] = {'status': status, 'time': seconds}
+                metrics.add('study:' + name, seconds)
+                logger.info("Study %s %s in %.2f secs", name, status, seconds)
+
+    return report
 
 
 def enrich_backend(url, clean, backend_name, backend_params, ocean_index=None,
@@ -487,8 +745,17 @@ def enrich_backend(url, clean, backend_name, backend_params, ocean_index=None,
                    do_refresh_projects=False, do_refresh_identities=False,
                    author_id=None, author_uuid=None, filter_raw=None,
                    filters_raw_prefix=None, jenkins_rename_file=None,
-                   unaffiliated_group=None, pair_programming=False):
-    """ Enrich Ocean index """
+                   unaffiliated_group=None, pair_programming=False,
+                   sh_cache_size=None, incremental_identities=False,
+                   fused_identities=False, github_logins_cache=None, studies_workers=1,
+                   shared_sh_caches=None, replay_raw_store=None, ceres_workers=1):
+    """ Enrich Ocean index. Returns False if there were errors.
+
+    shared_sh_caches is a dict to share the SortingHat caches between the
+    enrichers of the same backend, by backend name. If replay_raw_store
+    (a path) is given, raw items are read from that RawStore instead of
+    the raw index. ceres_workers is the number of threads used by the ceres
+    studies (areas of code and onion) """
 
     backend = None
     enrich_index = None
@@ -531,12 +798,18 @@ def enrich_backend(url, clean, backend_name, backend_params, ocean_index=None,
         enrich_backend.set_elastic(elastic_enrich)
         if github_token and backend_name == "git":
             enrich_backend.set_github_token(github_token)
+            enrich_backend.set_github_logins_cache(github_logins_cache)
         if jenkins_rename_file and backend_name == "jenkins":
             enrich_backend.set_jenkins_rename_file(jenkins_rename_file)
         if unaffiliated_group:
             enrich_backend.unaffiliated_group = unaffiliated_group
         if pair_programming:
             enrich_backend.pair_programming = pair_programming
+        enrich_backend.ceres_workers = ceres_workers
+        if shared_sh_caches is not None:
+            enrich_backend.share_sh_caches(shared_sh_caches.setdefault(backend_name, {}))
+        if sh_cache_size:
+            enrich_backend.set_sh_cache_size(sh_cache_size)
 
         # filter_raw must be converted from the string param to a dict
         filter_raw_dict = {}
@@ -563,7 +836,7 @@ def enrich_backend(url, clean, backend_name, backend_params, ocean_index=None,
 
         if only_studies:
             logger.info("Running only studies (no SH and no enrichment)")
-            do_studies(enrich_backend, no_incremental)
+            do_studies(enrich_backend, no_incremental, studies_workers)
         elif do_refresh_projects:
             logger.info("Refreshing project field in %s", enrich_backend.elastic.index_url)
             field_id = enrich_backend.get_field_unique_id()
@@ -581,19 +854,39 @@ def enrich_backend(url, clean, backend_name, backend_params, ocean_index=None,
 
             logger.info("Refreshing identities fields in %s", enrich_backend.elastic.index_url)
 
+            # SortingHat changes done during the refresh are included in the next one
+            refresh_date = datetime.utcnow()
+
             field_id = enrich_backend.get_field_unique_id()
-            eitems = refresh_identities(enrich_backend, filter_author)
-            enrich_backend.elastic.bulk_upload(eitems, field_id)
+            if incremental_identities and not filter_author:
+                eitems = refresh_identities_incremental(enrich_backend)
+            else:
+                eitems = refresh_identities(enrich_backend, filter_author)
+            enrich_backend.elastic.bulk_update(eitems, field_id)
+            enrich_backend.log_sh_caches_stats()
+
+            if not filter_author:
+                set_last_identities_refresh(enrich_backend, refresh_date)
         else:
             clean = False  # Don't remove ocean index when enrich
             elastic_ocean = get_elastic(url, ocean_index, clean, ocean_backend)
             ocean_backend.set_elastic(elastic_ocean)
 
+            if replay_raw_store and filter_raw_should:
+                logger.warning("Raw items can't be replayed from %s with prefix filters, reading raw index",
+                               replay_raw_store)
+            elif replay_raw_store:
+                ocean_backend = ReplayOceanBackend(ocean_backend, RawStore(replay_raw_store))
+
             logger.info("Adding enrichment data to %s", enrich_backend.elastic.index_url)
 
-            if db_sortinghat:
+            if db_sortinghat and fused_identities and not only_identities:
+                # Identities are loaded while the raw items are enriched
+                ocean_backend = IdentitiesOceanBackend(ocean_backend, enrich_backend)
+            elif db_sortinghat:
                 # FIXME: This step won't be done from enrich in the future
-                total_ids = load_identities(ocean_backend, enrich_backend)
+                with profiler.stage('load_identities', backend_name):
+                    total_ids = load_identities(ocean_backend, enrich_backend)
                 logger.info("Total identities loaded %i ", total_ids)
 
             if only_identities:
@@ -609,8 +902,10 @@ def enrich_backend(url, clean, backend_name, backend_params, ocean_index=None,
                     enrich_count = enrich_items(ocean_backend, enrich_backend, events=True)
                     if enrich_count is not None:
                         logger.info("Total events enriched %i ", enrich_count)
+                if isinstance(ocean_backend, IdentitiesOceanBackend):
+                    logger.info("Total identities loaded %i ", ocean_backend.identities_count)
                 if studies:
-                    do_studies(enrich_backend)
+                    do_studies(enrich_backend, workers=studies_workers)
 
     except Exception as ex:
         logger.error("%s", traceback.format_exc())
@@ -619,9 +914,14 @@ def enrich_backend(url, clean, backend_name, backend_params, ocean_index=None,
                          backend_name, backend.origin, ex)
         else:
             logger.error("Error enriching ocean %s", ex)
+        done = False
+    else:
+        done = True
 
     logger.info("Done %s ", backend_name)
 
+    return done
+
 
 def init_backend(backend_cmd):
     """Init backend within the backend_cmd"""
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+"""Bounded caches with hit/miss/eviction statistics"""
+
+import functools
+import logging
+import threading
+
+from collections import OrderedDict
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_SIZE = 4096
+
+
+class LRUCache:
+    """Least recently used cache with usage statistics.
+
+    Items are kept up to `maxsize`. Once the cache is full, the least
+    recently used item is evicted. A `maxsize` of None means unbounded
+    and 0 disables the cache. Access is thread safe.
+
+    :param name: name of the cache, used in logs and stats
+    :param maxsize: max number of items to keep
+    """
+
+    def __init__(self, name, maxsize=DEFAULT_CACHE_SIZE):
+        self.name = name
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def lookup(self, key, default=None):
+        """Return the value for key updating the stats, or default if not found"""
+
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def store(self, key, value):
+        """Add a new value for key, evicting the oldest ones if needed"""
+
+        if self.maxsize == 0:
+            return
+
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            self.__evict()
+
+    def resize(self, maxsize):
+        """Change the max number of items, evicting the oldest ones if needed"""
+
+        with self._lock:
+            self.maxsize = maxsize
+            if maxsize == 0:
+                self._data.clear()
+            self.__evict()
+
+    def clear(self):
+        """Remove all the items and reset the stats"""
+
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def get_stats(self):
+        """Return a dict with the usage stats of the cache"""
+
+        lookups = self.hits + self.misses
+        hit_ratio = round(self.hits / lookups, 4) if lookups else None
+
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": hit_ratio
+        }
+
+    def __evict(self):
+        if self.maxsize is None:
+            return
+
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+
+_MISSING = object()
+
+
+def cached_method(cache_name):
+    """Memoize a method using the LRUCache `cache_name` of the instance.
+
+    The instance must provide a `get_cache(name)` method returning the
+    LRUCache to be used. Positional args are used as the key, so they
+    must be hashable.
+
+    :param cache_name: name of the cache in the instance
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args):
+            cache = self.get_cache(cache_name)
+            value = cache.lookup(args, _MISSING)
+            if value is _MISSING:
+                value = func(self, *args)
+                cache.store(args, value)
+            return value
+        return wrapper
+    return decorator
+
+
+def log_caches_stats(caches, header="Caches stats"):
+    """Log the stats of a dict of caches"""
+
+    for name in sorted(caches):
+        stats = caches[name].get_stats()
+        logger.info("%s %s: %i/%s items, %i hits, %i misses, %i evictions (hit ratio %s)",
+                    header, name, stats['size'], stats['maxsize'],
+                    stats['hits'], stats['misses'], stats['evictions'],
+                    stats['hit_ratio'])
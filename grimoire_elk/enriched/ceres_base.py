@@ -22,7 +22,10 @@
 #
 
 import logging
+import queue
+import threading
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from grimoirelab.toolkit import datetime
 
 from elasticsearch import helpers
@@ -62,15 +65,18 @@ class CeresBase:
     :param self._in: connector for reading source items from.
     :param self._out: connector to write processed items to.
     :param self._block_size: number of items to retrieve for each processing block.
+    :param self._workers: number of blocks processed in parallel. With more than one worker, blocks
+                          are read, processed and written in a pipeline.
     """
 
     ProcessResults = namedtuple('ProcessResults', ['processed', 'out_items'])
 
-    def __init__(self, in_connector, out_connector, block_size):
+    def __init__(self, in_connector, out_connector, block_size, workers=1):
 
         self._in = in_connector
         self._out = out_connector
         self._block_size = block_size
+        self._workers = workers
 
     def analyze(self):
         """Populate an enriched index by processing input items in blocks.
@@ -83,22 +89,23 @@ class CeresBase:
         else:
             logger.info("Reading items since the beginning of times")
 
+        if self._workers and self._workers > 1:
+            results = self.__analyze_pipeline(from_date)
+        else:
+            results = self.__analyze_sequential(from_date)
+
         cont = 0
         total_processed = 0
         total_written = 0
 
-        for item_block in self._in.read_block(size=self._block_size, from_date=from_date):
-            cont = cont + len(item_block)
-
-            process_results = self.process(item_block)
+        for nread, process_results in results:
+            cont = cont + nread
             total_processed += process_results.processed
-
-            self._out.write(process_results.out_items)
             total_written += len(process_results.out_items)
 
             logger.info(
                 "Items read/to be written/total read/total processed/total written: " +
-                "{0}/{1}/{2}/{3}/{4}".format(str(len(item_block)),
+                "{0}/{1}/{2}/{3}/{4}".format(str(nread),
                                              str(len(process_results.out_items)),
                                              str(cont),
                                              str(total_processed),
@@ -113,6 +120,119 @@ class CeresBase:
 
         return total_written
 
+    def __analyze_sequential(self, from_date):
+        """Read, process and write the blocks one after the other"""
+
+        for item_block in self._in.read_block(size=self._block_size, from_date=from_date):
+            process_results = self.process(item_block)
+            self._out.write(process_results.out_items)
+
+            yield len(item_block), process_results
+
+    def __analyze_pipeline(self, from_date):
+        """Read, process and write the blocks at the same time.
+
+        A reader thread reads the blocks, which are processed in a pool of
+        threads and written by a writer thread. Each block gets a sequence
+        number and they are written in that order, so the latest date in the
+        output is always the one of a block written after all the previous ones.
+
+        Processors are not run in other processes: they can hold objects that
+        can't be pickled, like the GitEnrich (and its SortingHat session) of
+        areas of code.
+        """
+        pool = ThreadPoolExecutor(max_workers=self._workers)
+
+        blocks = queue.Queue(maxsize=self._workers * 2)
+        pending = queue.Queue(maxsize=self._workers * 2)
+        written = queue.Queue()
+        stop = threading.Event()
+        end = object()
+
+        def put(q, value):
+            # Don't block forever if other stage failed
+            while not stop.is_set():
+                try:
+                    q.put(value, timeout=1)
+                    return
+                except queue.Full:
+                    continue
+
+        def get(q):
+            while not stop.is_set():
+                try:
+                    return q.get(timeout=1)
+                except queue.Empty:
+                    continue
+            return end
+
+        def reader():
+            try:
+                for seq, item_block in enumerate(self._in.read_block(size=self._block_size,
+                                                                     from_date=from_date)):
+                    put(blocks, (seq, item_block))
+            except Exception as ex:
+                put(blocks, ex)
+            else:
+                put(blocks, end)
+
+        def writer():
+            try:
+                next_seq = 0
+                while True:
+                    task = get(pending)
+                    if task is end:
+                        break
+                    seq, nread, future = task
+                    if seq != next_seq:
+                        raise RuntimeError("Block %i written out of order" % seq)
+                    process_results = future.result()
+                    self._out.write(process_results.out_items)
+                    written.put((nread, process_results))
+                    next_seq += 1
+            except Exception as ex:
+                stop.set()
+                written.put(ex)
+            else:
+                written.put(end)
+
+        reader_thread = threading.Thread(target=reader, daemon=True)
+        writer_thread = threading.Thread(target=writer, daemon=True)
+        reader_thread.start()
+        writer_thread.start()
+
+        try:
+            with pool:
+                while not stop.is_set():
+                    block = get(blocks)
+                    if block is end:
+                        break
+                    if isinstance(block, Exception):
+                        raise block
+                    seq, item_block = block
+                    put(pending, (seq, len(item_block), pool.submit(self.process, item_block)))
+
+                    while not written.empty():
+                        yield self.__check_result(written.get())
+
+                put(pending, end)
+
+                while True:
+                    result = written.get()
+                    if result is end:
+                        break
+                    yield self.__check_result(result)
+        finally:
+            stop.set()
+            reader_thread.join()
+            writer_thread.join()
+
+    @staticmethod
+    def __check_result(result):
+        if isinstance(result, Exception):
+            raise result
+        return result
+
     def process(self, items_block):
         """Process a sets of items.
 
@@ -139,14 +259,17 @@ class ESConnector(Connector):
     :param self._es_index: ElasticSearch index for reading from/writing to.
     :param self._sort_on_field: date field to sort results, important for incremental process.
     :param self._read_only: True to avoid unwanted writes.
+    :param self._bulk_threads: number of threads to write bulks of items in parallel.
     """
 
-    def __init__(self, es_conn, es_index, sort_on_field='metadata__timestamp', read_only=True):
+    def __init__(self, es_conn, es_index, sort_on_field='metadata__timestamp', read_only=True,
+                 bulk_threads=1):
 
         self._es_conn = es_conn
         self._es_index = es_index
         self._sort_on_field = sort_on_field
         self._read_only = read_only
+        self._bulk_threads = bulk_threads
 
     def read_item(self, from_date=None):
         """Read items and return them one by one.
@@ -211,9 +334,24 @@ class ESConnector(Connector):
             }
             docs.append(doc)
         # TODO exception and error handling
-        helpers.bulk(self._es_conn, docs)
+        self._bulk(docs)
         logger.info("Written: " + str(len(docs)))
 
+    def _bulk(self, docs):
+        """Upload docs to ElasticSearch, using several threads if configured.
+
+        :param docs: iterable of docs in the bulk helpers format.
+        :return: number of docs uploaded.
+        """
+        if self._bulk_threads > 1:
+            written = 0
+            for ok, _ in helpers.parallel_bulk(self._es_conn, docs, thread_count=self._bulk_threads):
+                written += ok
+        else:
+            written, _ = helpers.bulk(self._es_conn, docs)
+
+        return written
+
     def create_index(self, mappings_file, delete=True):
         """Create a new index.
 
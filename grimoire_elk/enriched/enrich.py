@@ -26,20 +26,20 @@
 import json
 import functools
 import logging
+import os
 import sys
+import time
 
 from datetime import datetime as dt
 
 import pkg_resources
 from dateutil import parser
-from functools import lru_cache
-
-from elasticsearch import Elasticsearch
 
 from perceval.backend import find_signature_parameters
 
 from ..elastic_items import ElasticItems
-from .study_ceres_onion import ESOnionConnector, onion_study
+from .cache import LRUCache, cached_method, log_caches_stats
+from ..metrics import metrics, timed
 
 from .utils import grimoire_con
 from .. import __version__
@@ -69,6 +69,8 @@ except ImportError:
 DEFAULT_PROJECT = 'Main'
 DEFAULT_DB_USER = 'root'
 CUSTOM_META_PREFIX = 'cm'
+# Caches used for SortingHat lookups during enrichment
+SH_CACHES = ['enrollments', 'unique_identities', 'uuids', 'sh_ids']
 
 
 def metadata(func):
@@ -81,12 +83,8 @@ def metadata(func):
     @functools.wraps(func)
     def decorator(self, *args, **kwargs):
         eitem = func(self, *args, **kwargs)
-        metadata = {
-            'metadata__gelk_version': self.gelk_version,
-            'metadata__gelk_backend_name': self.__class__.__name__,
-            'metadata__enriched_on': dt.utcnow().isoformat()
-        }
-        eitem.update(metadata)
+        eitem.update(self.metadata_fields)
+        eitem['metadata__enriched_on'] = dt.utcnow().isoformat()
         return eitem
     return decorator
 
@@ -98,6 +96,8 @@ class Enrich(ElasticItems):
     RAW_FIELDS_COPY = ["metadata__updated_on", "metadata__timestamp",
                        "offset", "origin", "tag", "uuid"]
     KEYWORD_MAX_SIZE = 32000  # this control allows to avoid max_bytes_length_exceeded_exception
+    # JSON projects maps already loaded: path -> (modification time, json projects, projects map)
+    json_projects_maps = {}
 
     def __init__(self, db_sortinghat=None, db_projects_map=None, json_projects_map=None,
                  db_user='', db_password='', db_host='', insecure=True):
@@ -120,10 +120,8 @@ class Enrich(ElasticItems):
         self.json_projects = None
 
         if json_projects_map:
-            with open(json_projects_map) as data_file:
-                self.json_projects = json.load(data_file)
-                # If we have JSON projects always use them for mapping
-                self.prjs_map = self.__convert_json_to_projects_map(self.json_projects)
+            # If we have JSON projects always use them for mapping
+            self.json_projects, self.prjs_map = self.__load_json_projects_map(json_projects_map)
         if not self.json_projects:
             if db_projects_map and not MYSQL_LIBS:
                 raise RuntimeError("Projects configured but MySQL libraries not available.")
@@ -138,6 +136,8 @@ class Enrich(ElasticItems):
             pass
 
         self.studies = []
+        # Studies reading the output of other studies: study name -> names of the studies it needs
+        self.studies_deps = {}
 
         self.requests = grimoire_con()
         self.elastic = None
@@ -145,6 +145,13 @@ class Enrich(ElasticItems):
 
         # To add the gelk version to enriched items
         self.gelk_version = __version__
+        # Metadata added to all the enriched items
+        self.metadata_fields = {
+            'metadata__gelk_version': self.gelk_version,
+            'metadata__gelk_backend_name': self.__class__.__name__
+        }
+        # Names of the is_<data source>_<item> fields: item name -> field name
+        self.grimoire_item_fields = {}
 
         # params used to configure the backend
         # in perceval backends managed directly inside the backend
@@ -154,6 +161,10 @@ class Enrich(ElasticItems):
         self.unaffiliated_group = 'Unknown'
         # Label used during enrichment for identities with no gender info
         self.unknown_gender = 'Unknown'
+        # Threads processing and writing the blocks of the ceres studies
+        self.ceres_workers = 1
+        # Caches for SortingHat lookups, owned by this enricher instance
+        self.sh_caches = {name: LRUCache(name) for name in SH_CACHES}
 
     def set_elastic_url(self, url):
         """ Elastic URL """
@@ -162,6 +173,45 @@ class Enrich(ElasticItems):
     def set_elastic(self, elastic):
         self.elastic = elastic
 
+    def get_cache(self, name):
+        """ Return the SortingHat cache with the given name """
+        return self.sh_caches[name]
+
+    def set_sh_cache_size(self, sizes):
+        """
+        Configure the max number of items in the SortingHat caches
+
+        :param sizes: list with entries in the format size (all the caches)
+                      or cache:size (a given cache)
+        """
+        for size in sizes:
+            if ':' in str(size):
+                name, size = size.split(':')
+                if name not in self.sh_caches:
+                    raise RuntimeError("Unknown SortingHat cache %s" % name)
+                names = [name]
+            else:
+                names = self.sh_caches.keys()
+            for name in names:
+                self.sh_caches[name].resize(int(size))
+
+    def share_sh_caches(self, caches):
+        """
+        Use the SortingHat caches in caches, shared with other enrichers
+
+        :param caches: dict with the caches by name. The caches of this
+                       enricher not included are added to it.
+        """
+        for name, cache in self.sh_caches.items():
+            self.sh_caches[name] = caches.setdefault(name, cache)
+
+    def get_sh_caches_stats(self):
+        """ Return the usage stats of the SortingHat caches """
+        return {name: cache.get_stats() for name, cache in self.sh_caches.items()}
+
+    def log_sh_caches_stats(self):
+        log_caches_stats(self.sh_caches, "[%s] SortingHat cache" % self.get_connector_name())
+
     def set_params(self, params):
         from ..utils import get_connector_from_name
 
@@ -183,6 +233,26 @@ class Enrich(ElasticItems):
         backend_cmd.backend = backend_cmd.BACKEND(**init_args)
         self.perceval_backend = backend_cmd.backend
 
+    def __load_json_projects_map(self, json_projects_map):
+        """ Load the JSON projects file and convert it to the projects map format.
+        Files already loaded are reused while they are not modified, so the
+        enrichers of several data sources in the same process share them.
+
+        :param json_projects_map: path of the JSON projects file
+        :returns: tuple with the JSON projects and the projects map
+        """
+        mtime = os.path.getmtime(json_projects_map)
+        cached = Enrich.json_projects_maps.get(json_projects_map)
+        if cached and cached[0] == mtime:
+            return cached[1:]
+
+        with open(json_projects_map) as data_file:
+            json_projects = json.load(data_file)
+        prjs_map = self.__convert_json_to_projects_map(json_projects)
+        Enrich.json_projects_maps[json_projects_map] = (mtime, json_projects, prjs_map)
+
+        return json_projects, prjs_map
+
     def __convert_json_to_projects_map(self, json):
         """ Convert JSON format to the projects map format
         map[ds][repository] = project
@@ -333,6 +403,10 @@ class Enrich(ElasticItems):
         current = 0
         total = 0
         bulk_json = ""
+        # Time spent building and serializing the enriched items
+        rich_time = 0
+        json_time = 0
+        rich_items = 0
 
         items = ocean_backend.fetch()
 
@@ -358,17 +432,26 @@ class Enrich(ElasticItems):
                 bulk_json = ""
                 current = 0
 
+            start = time.perf_counter()
             if not events:
                 rich_item = self.get_rich_item(item)
+                rich_time += time.perf_counter() - start
+                start = time.perf_counter()
                 data_json = json.dumps(rich_item)
+                json_time += time.perf_counter() - start
+                rich_items += 1
                 bulk_json += '{"index" : {"_id" : "%s" } }\n' % \
                     (item[self.get_field_unique_id()])
                 bulk_json += data_json + "\n"  # Bulk document
                 current += 1
             else:
                 rich_events = self.get_rich_events(item)
+                rich_time += time.perf_counter() - start
                 for rich_event in rich_events:
+                    start = time.perf_counter()
                     data_json = json.dumps(rich_event)
+                    json_time += time.perf_counter() - start
+                    rich_items += 1
                     bulk_json += '{"index" : {"_id" : "%s_%s" } }\n' % \
                         (item[self.get_field_unique_id()],
                          rich_event[self.get_field_event_unique_id()])
@@ -378,12 +461,10 @@ class Enrich(ElasticItems):
         if current > 0:
             total += self.elastic.safe_put_bulk(url, bulk_json)
 
-        return total
+        metrics.add('get_rich_events' if events else 'get_rich_item', rich_time, rich_items, calls=rich_items)
+        metrics.add('json_dumps', json_time, rich_items, calls=rich_items)
 
-    def get_connector_name(self):
-        """ Find the name for the current connector """
-        from ..utils import get_connector_name
-        return get_connector_name(type(self))
+        return total
 
     def get_field_author(self):
         """ Field with the author information """
@@ -401,6 +482,10 @@ class Enrich(ElasticItems):
         """ Return the identities from an item """
         raise NotImplementedError
 
+    def prepare_identities(self, items):
+        """ Called with a batch of items before getting their identities """
+        pass
+
     def get_email_domain(self, email):
         domain = None
         try:
@@ -473,7 +558,10 @@ class Enrich(ElasticItems):
         except Exception as ex:
             pass
 
-        name = "is_" + self.get_connector_name() + "_" + item_name
+        name = self.grimoire_item_fields.get(item_name)
+        if not name:
+            name = "is_" + self.get_connector_name() + "_" + item_name
+            self.grimoire_item_fields[item_name] = name
 
         return {
             "grimoire_creation_date": grimoire_date,
@@ -785,15 +873,18 @@ class Enrich(ElasticItems):
 
         return eitem_sh
 
-    @lru_cache()
+    @cached_method('enrollments')
+    @timed('sh_query', latency='sql')
     def get_enrollments(self, uuid):
         return api.enrollments(self.sh_db, uuid)
 
-    @lru_cache()
+    @cached_method('unique_identities')
+    @timed('sh_query', latency='sql')
     def get_unique_identity(self, uuid):
         return api.unique_identities(self.sh_db, uuid)[0]
 
-    @lru_cache()
+    @cached_method('uuids')
+    @timed('sh_query', latency='sql')
     def get_uuid_from_id(self, sh_id):
         """ Get the SH identity uuid from the id """
         return SortingHat.get_uuid_from_id(self.sh_db, sh_id)
@@ -805,7 +896,8 @@ class Enrich(ElasticItems):
         sh_ids = self.__get_sh_ids_cache(identity_tuple, backend_name)
         return sh_ids
 
-    @lru_cache()
+    @cached_method('sh_ids')
+    @timed('sh_query', latency='sql')
     def __get_sh_ids_cache(self, identity_tuple, backend_name):
 
         # Convert tuple to the original dict
@@ -852,6 +944,10 @@ class Enrich(ElasticItems):
     def enrich_onion(self, enrich_backend, in_index, out_index, data_source, contribs_field,
                      timeframe_field, sort_on_field, no_incremental=False):
 
+        # pandas and cereslib are imported only when the study runs
+        from elasticsearch import Elasticsearch
+        from .study_ceres_onion import ESOnionConnector, onion_study
+
         logger.info("[Onion] Starting study")
 
         # Creating connections
@@ -864,20 +960,24 @@ class Enrich(ElasticItems):
                                     contribs_field=contribs_field,
                                     timeframe_field=timeframe_field,
                                     sort_on_field=sort_on_field,
-                                    read_only=False)
-
-        # Onion currently does not support incremental option
-        logger.info("[Onion] Creating out ES index")
-        # Initialize out index
-        filename = pkg_resources.resource_filename('grimoire_elk', 'enriched/mappings/onion.json')
-        out_conn.create_index(filename, delete=out_conn.exists())
-
-        onion_study(in_conn=in_conn, out_conn=out_conn, data_source=data_source)
-
-        # Create alias if output index exists (index is always created from scratch, so
-        # alias need to be created each time)
-        if out_conn.exists():
-            logger.info("[Onion] Creating alias: all_onion")
-            out_conn.create_alias('all_onion')
+                                    read_only=False,
+                                    bulk_threads=self.ceres_workers)
+
+        # Initialize out index. It is kept between runs, so only the quarters with
+        # new items are rewritten and the alias is not removed
+        if not out_conn.exists():
+            logger.info("[Onion] Creating out ES index")
+            filename = pkg_resources.resource_filename('grimoire_elk', 'enriched/mappings/onion.json')
+            out_conn.create_index(filename, delete=False)
+        elif no_incremental:
+            logger.info("[Onion] Deleting all items in out ES index")
+            out_conn.delete_items()
+
+        onion_study(in_conn=in_conn, out_conn=out_conn, data_source=data_source,
+                    workers=self.ceres_workers)
+
+        # Putting an existing alias again is harmless
+        logger.info("[Onion] Creating alias: all_onion")
+        out_conn.create_alias('all_onion')
 
         logger.info("[Onion] This is the end.")
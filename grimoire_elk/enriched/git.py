@@ -30,11 +30,13 @@ import time
 
 import pkg_resources
 import requests
-from elasticsearch import Elasticsearch
+from elasticsearch import Elasticsearch, helpers
 
 from grimoirelab.toolkit.datetime import datetime_to_utc, str_to_datetime
+from .cache import cached_method, LRUCache
 from .enrich import Enrich, metadata
-from .study_ceres_aoc import areas_of_code, ESPandasConnector
+from ..metrics import metrics
+from .github_logins import GitHubLoginResolver, GitHubLoginsCache, GITHUB_API_URL
 from ..elastic_mapping import Mapping as BaseMapping
 
 try:
@@ -110,16 +112,81 @@ class GitEnrich(Enrich):
         # GitHub API management
         self.github_token = None
         self.github_logins = {}
-        self.github_logins_committer_not_found = 0
-        self.github_logins_author_not_found = 0
-        self.rate_limit = None
-        self.rate_limit_reset_ts = None
-        self.min_rate_to_sleep = 100  # if pending rate < 100 sleep
+        self.github_logins_cache = None  # path of the persistent logins cache
+        self.github_api_url = GITHUB_API_URL
+        self.github_resolver = None
         self.pair_programming = pair_programming
 
+        # Parsed git users, sized with the SortingHat caches
+        self.sh_caches['git_users'] = LRUCache('git_users')
+        # SortingHat github-commit identities of git users (None if unknown)
+        self.sh_caches['github_commit_users'] = LRUCache('github_commit_users')
+
     def set_github_token(self, token):
+        """ Set the GitHub API token. A list of tokens can be used too """
+
         self.github_token = token
 
+    def set_github_logins_cache(self, path):
+        """ Set the path of the persistent GitHub logins cache """
+
+        self.github_logins_cache = path
+
+    def get_github_resolver(self):
+        """ Get the resolver of GitHub logins, creating it the first time """
+
+        if not self.github_resolver:
+            tokens = self.github_token
+            if isinstance(tokens, str):
+                tokens = [tokens]
+            cache = GitHubLoginsCache(self.github_logins_cache)
+            self.github_resolver = GitHubLoginResolver(tokens, cache, api_url=self.github_api_url)
+
+        return self.github_resolver
+
+    def close_github_resolver(self):
+        """ Stop the threads of the GitHub logins resolver and close its cache """
+
+        if self.github_resolver:
+            self.github_resolver.close()
+            self.github_resolver = None
+
+    def prepare_identities(self, items):
+        """ Request concurrently the GitHub logins needed by a batch of items.
+
+        Users with a GitHub identity already in SortingHat are not requested.
+        """
+
+        if not self.github_token:
+            return
+
+        commits = []
+        for item in items:
+            if GITHUB not in item['origin']:
+                continue
+            github_repo = item['origin'].replace(GITHUB, '')
+            github_repo = re.sub('.git$', '', github_repo)
+            for user_field, rol in [('Author', 'author'), ('Commit', 'committer')]:
+                user_data = item['data'][user_field]
+                if not user_data or user_data in self.github_logins:
+                    continue
+                if self.sh_db:
+                    sh_identity = self.__get_github_commit_identity(user_data)
+                    if sh_identity:
+                        self.github_logins[user_data] = sh_identity['username']
+                        continue
+                commits.append((user_data, rol, item['data']['commit'], github_repo))
+
+        if commits:
+            self.get_github_resolver().prefetch(commits)
+
+    @cached_method('github_commit_users')
+    def __get_github_commit_identity(self, user_data):
+        """ SortingHat github-commit identity of a git user, None if unknown.
+        Unknown users are remembered too, as they appear in lots of commits """
+
+        return SortingHat.get_github_commit_username(self.sh_db, self.get_sh_identity(user_data), SH_GIT_COMMIT)
+
     def get_field_author(self):
         return "Author"
 
@@ -171,15 +238,19 @@ class GitEnrich(Enrich):
 
             # Try to get the identity from SH
             user_data = item['data'][user_field]
-            sh_identity = SortingHat.get_github_commit_username(self.sh_db, user, SH_GIT_COMMIT)
+            sh_identity = self.__get_github_commit_identity(user_data)
             if not sh_identity:
                 # Get the usename from GitHub
                 gh_username = self.get_github_login(user_data, rol, commit_hash, github_repo)
+                if user_data not in self.github_logins:
+                    # The request failed, it is retried with the next item of the user
+                    return
                 # Create a new SH identity with name, email from git and username from github
                 logger.debug("Adding new identity %s to SH %s: %s", gh_username, SH_GIT_COMMIT, user)
                 user = self.get_sh_identity(user_data)
                 user['username'] = gh_username
                 SortingHat.add_identity(self.sh_db, user, SH_GIT_COMMIT)
+                self.get_cache('github_commit_users').store((user_data,), user)
             else:
                 if user_data not in self.github_logins:
                     self.github_logins[user_data] = sh_identity['username']
@@ -231,17 +302,25 @@ class GitEnrich(Enrich):
         if 'data' in item and type(item) == dict:
             git_user = item['data'][identity_field]
 
+        name, email = self.__parse_git_user(git_user)
+        identity['username'] = None
+        identity['email'] = email
+        identity['name'] = name
+
+        return identity
+
+    @cached_method('git_users')
+    def __parse_git_user(self, git_user):
+        """ Name and email from a git user. The same users appear in lots of commits """
+
         fields = git_user.split("<")
         name = fields[0]
         name = name.strip()  # Remove space between user and email
         email = None
         if len(fields) > 1:
             email = git_user.split("<")[1][:-1]
-        identity['username'] = None
-        identity['email'] = email
-        identity['name'] = name
 
-        return identity
+        return name, email
 
     def get_project_repository(self, eitem):
         return eitem['origin']
@@ -252,65 +331,12 @@ class GitEnrich(Enrich):
         try:
             login = self.github_logins[user]
         except KeyError:
-            # Get the login from github API
-            GITHUB_API_URL = "https://api.github.com"
-            commit_url = GITHUB_API_URL + "/repos/%s/commits/%s" % (repo, commit_hash)
-            headers = {'Authorization': 'token ' + self.github_token}
-
-            r = self.requests.get(commit_url, headers=headers)
-
-            try:
-                r.raise_for_status()
-            except requests.exceptions.ConnectionError as ex:
-                # Connection error
-                logger.error("Can't get github login for %s in %s because a connection error ", repo, commit_hash)
-                return login
-
-            self.rate_limit = int(r.headers['X-RateLimit-Remaining'])
-            self.rate_limit_reset_ts = int(r.headers['X-RateLimit-Reset'])
-            logger.debug("Rate limit pending: %s", self.rate_limit)
-            if self.rate_limit <= self.min_rate_to_sleep:
-                seconds_to_reset = self.rate_limit_reset_ts - int(time.time()) + 1
-                if seconds_to_reset < 0:
-                    seconds_to_reset = 0
-                cause = "GitHub rate limit exhausted."
-                logger.info("%s Waiting %i secs for rate limit reset.", cause, seconds_to_reset)
-                time.sleep(seconds_to_reset)
-                # Retry once we have rate limit
-                r = self.requests.get(commit_url, headers=headers)
-
-            try:
-                r.raise_for_status()
-            except requests.exceptions.HTTPError as ex:
-                # commit not found probably or rate limit exhausted
-                logger.error("Can't find commit %s %s", commit_url, ex)
-                return login
-
-            commit_json = r.json()
-            author_login = None
-            if 'author' in commit_json and commit_json['author']:
-                author_login = commit_json['author']['login']
-            else:
-                self.github_logins_author_not_found += 1
-
-            user_login = None
-            if 'committer' in commit_json and commit_json['committer']:
-                user_login = commit_json['committer']['login']
-            else:
-                self.github_logins_committer_not_found += 1
-
-            if rol == "author":
-                login = author_login
-            elif rol == "committer":
-                login = user_login
-            else:
-                logger.error("Wrong rol: %s" % (rol))
-                raise RuntimeError
-
-            self.github_logins[user] = login
-            logger.debug("%s is %s in github (not found %i authors %i committers )", user, login,
-                         self.github_logins_author_not_found,
-                         self.github_logins_committer_not_found)
+            # Get the login from the cache or the GitHub API
+            resolver = self.get_github_resolver()
+            login = resolver.get_login(user, rol, commit_hash, repo)
+            # Failed requests are not kept, so they are retried
+            if resolver.is_resolved(user):
+                self.github_logins[user] = login
 
         return login
 
@@ -390,9 +416,7 @@ class GitEnrich(Enrich):
         eitem["lines_changed"] = lines_added + lines_removed
 
         # author_name and author_domain are added always
-        identity = self.get_sh_identity(commit["Author"])
-        eitem["author_name"] = identity['name']
-        eitem["author_domain"] = self.get_identity_domain(identity)
+        eitem.update(self.__get_author_fields(commit))
 
         # committer data
         identity = self.get_sh_identity(commit["Commit"])
@@ -414,15 +438,12 @@ class GitEnrich(Enrich):
         if 'project' in item:
             eitem['project'] = item['project']
 
-        # Adding the git author domain
-        author_domain = self.get_identity_domain(self.get_sh_identity(item, 'Author'))
-        eitem['git_author_domain'] = author_domain
-
-        eitem.update(self.get_grimoire_fields(commit["AuthorDate"], "commit"))
+        grimoire_fields = self.get_grimoire_fields(commit["AuthorDate"], "commit")
+        eitem.update(grimoire_fields)
 
         if self.sortinghat:
             # grimoire_creation_date is needed in the item
-            item.update(self.get_grimoire_fields(commit["AuthorDate"], "commit"))
+            item.update(grimoire_fields)
             eitem.update(self.get_item_sh(item, self.roles))
 
         if self.prjs_map:
@@ -433,6 +454,36 @@ class GitEnrich(Enrich):
 
         return eitem
 
+    def __get_author_fields(self, commit):
+        """ Fields of the enriched commit which depend only on its Author """
+
+        identity = self.get_sh_identity(commit["Author"])
+        author_domain = self.get_identity_domain(identity)
+
+        return {
+            "Author": commit["Author"],
+            "author_name": identity['name'],
+            "author_domain": author_domain,
+            # Adding the git author domain
+            "git_author_domain": author_domain
+        }
+
+    def __get_rich_item_author(self, item, eitem, git_uuid):
+        """ Enriched commit for the current Author of item, derived from eitem.
+
+        Only the fields which depend on the author are computed again.
+        """
+        commit = item['data']
+
+        rich_item = dict(eitem)
+        rich_item.update(self.__get_author_fields(commit))
+        if self.sortinghat:
+            rich_item.update(self.get_item_sh(item, ['Author']))
+        rich_item = self.__add_pair_programming_metrics(commit, rich_item)
+        rich_item['git_uuid'] = git_uuid
+
+        return rich_item
+
     def __fix_field_date(self, item, attribute):
         """Fix possible errors in the field date"""
 
@@ -501,6 +552,10 @@ class GitEnrich(Enrich):
 
         total_signed_off = 0
         total_multi_author = 0
+        # Time spent building and serializing the enriched items
+        rich_time = 0
+        json_time = 0
+        rich_items = 0
 
         url = self.elastic.index_url + '/items/_bulk'
 
@@ -544,14 +599,22 @@ class GitEnrich(Enrich):
                 bulk_json = ""
                 current = 0
 
+            start = time.perf_counter()
             rich_item = self.get_rich_item(item)
+            rich_time += time.perf_counter() - start
+            start = time.perf_counter()
             data_json = json.dumps(rich_item)
+            json_time += time.perf_counter() - start
+            rich_items += 1
             unique_field = self.get_field_unique_id()
             bulk_json += '{"index" : {"_id" : "%s" } }\n' % (rich_item[unique_field])
             bulk_json += data_json + "\n"  # Bulk document
             current += 1
 
             if self.pair_programming:
+                # The commits for the rest of authors are derived from the base one
+                base_rich_item = rich_item
+
                 # Multi author support
                 if 'authors' in item['data']:
                     # First author already added in the above commit
@@ -560,17 +623,15 @@ class GitEnrich(Enrich):
                         # logger.debug('Adding a new commit for %s', authors[i])
                         item['data']['Author'] = authors[i]
                         item['data']['is_git_commit_multi_author'] = 1
-                        rich_item = self.get_rich_item(item)
-                        item['data']['is_git_commit_multi_author'] = 1
-                        data_json = json.dumps(rich_item)
                         commit_id = item["uuid"] + "_" + str(i - 1)
-                        rich_item['git_uuid'] = commit_id
+                        rich_item = self.__get_rich_item_author(item, base_rich_item, commit_id)
+                        data_json = json.dumps(rich_item)
                         bulk_json += '{"index" : {"_id" : "%s" } }\n' % rich_item['git_uuid']
                         bulk_json += data_json + "\n"  # Bulk document
                         current += 1
                         total_multi_author += 1
 
-                if rich_item['Signed-off-by_number'] > 0:
+                if base_rich_item['Signed-off-by_number'] > 0:
                     nsg = 0
                     # Remove duplicates and the already added Author if exists
                     authors = list(set(item['data']['Signed-off-by']))
@@ -582,9 +643,8 @@ class GitEnrich(Enrich):
                         # a new enriched item with it
                         item['data']['Author'] = author
                         item['data']['is_git_commit_signed_off'] = 1
-                        rich_item = self.get_rich_item(item)
                         commit_id = item["uuid"] + "_" + str(nsg)
-                        rich_item['git_uuid'] = commit_id
+                        rich_item = self.__get_rich_item_author(item, base_rich_item, commit_id)
                         data_json = json.dumps(rich_item)
                         bulk_json += '{"index" : {"_id" : "%s" } }\n' % rich_item['git_uuid']
                         bulk_json += data_json + "\n"  # Bulk document
@@ -595,6 +655,12 @@ class GitEnrich(Enrich):
         if current > 0:
             total += self.elastic.safe_put_bulk(url, bulk_json)
 
+        # All the identities of the items have been loaded
+        self.close_github_resolver()
+
+        metrics.add('get_rich_item', rich_time, rich_items, calls=rich_items)
+        metrics.add('json_dumps', json_time, rich_items, calls=rich_items)
+
         if total == 0:
             # No items enriched, nothing to upload to ES
             return total
@@ -621,161 +687,189 @@ class GitEnrich(Enrich):
 
         # date_field = self.get_incremental_date()
         date_field = 'utc_commit'
-        filter_last_demography_date = ''
 
-        # Don't use commits before DEMOGRAPHY_COMMIT_MIN_DATE
-        filters = '''
-        {"range":
-            {"%s": {"gte": "%s"}}
-        }
-        ''' % (date_field, DEMOGRAPHY_COMMIT_MIN_DATE)
+        # Only commits not already processed by demography study so it
+        # must not contains the extra fields author_min_date/author_max_date
+        # or it should be included in new commits
+        should = [
+            {"bool": {
+                "must_not": [
+                    {"exists": {"field": "author_min_date"}},
+                    {"exists": {"field": "author_max_date"}}
+                ]
+            }}
+        ]
 
         # Include also commits received since the last demography study
         if from_date:
-            from_date = from_date.isoformat()
+            should.append({"range": {date_field: {"gte": from_date.isoformat()}}})
 
-            filter_last_demography_date = '''
-            , {"range":
-                {"%s": {"gte": "%s"}}
-            }
-            ''' % (date_field, from_date)
-
-        # Only commits not already processed by demography study so it
-        # must not contains the extra fields author_min_date/author_max_date
-        # or it should be included in new commits
-        query = """
-        "query": {
+        # Don't use commits before DEMOGRAPHY_COMMIT_MIN_DATE
+        query = {
             "bool": {
                 "must": [
-                    %s,
-                    {"bool":
-                        {"should": [
-                            {"bool": {
-                                "must_not": [
-                                    {"exists": {
-                                        "field": "author_min_date"
-                                    }},
-                                    {"exists": {
-                                        "field": "author_max_date"
-                                    }}
-                                ]}
-                            }
-                            %s
-                            ]
-                        }
-                    }
+                    {"range": {date_field: {"gte": DEMOGRAPHY_COMMIT_MIN_DATE}}},
+                    {"bool": {"should": should}}
                 ]
             }
-        },
-        """ % (filters, filter_last_demography_date)
-
-        # First, get the min and max commit date for all the authors
-        # Limit aggregations: https://github.com/elastic/elasticsearch/issues/18838
-        # 10000 seems to be a sensible number of the number of people in git
-        es_query = """
-        {
-          %s
-          "size": 0,
-          "aggs": {
-            "author": {
-              "terms": {
-                "field": "Author",
-                "size": 10000
-              },
-              "aggs": {
-                "min": {
-                  "min": {
-                    "field": "%s"
-                  }
-                },
-                "max": {
-                  "max": {
-                    "field": "%s"
-                  }
-                }
-              }
-            }
-          }
         }
-        """ % (query, date_field, date_field)
-
-        logger.debug(es_query)
 
-        r = self.requests.post(self.elastic.index_url + "/_search",
-                               data=es_query, headers=HEADER_JSON,
-                               verify=False)
+        # First, find the authors with commits to process
         try:
-            r.raise_for_status()
+            composite = self.__composite_supported()
+            authors = list(self.__get_authors_dates(query, date_field, composite))
         except requests.exceptions.HTTPError as ex:
-            logger.error("Error getting authors mix and max date. Demography aborted.")
+            logger.error("Error getting authors with new commits. Demography aborted.")
             logger.error(ex)
             return
 
-        authors = r.json()['aggregations']['author']['buckets']
+        logger.info("Authors to be processed %i", len(authors))
+
+        es = Elasticsearch([self.elastic.url], timeout=100)
+        nitems_done = 0
+        chunk_size = self.elastic.max_items_clause
+
+        for i in range(0, len(authors), chunk_size):
+            authors_chunk = authors[i:i + chunk_size]
+            authors_filter = {"terms": {"Author": authors_chunk}}
 
-        author_items = []  # items from author with new date fields added
-        nauthors_done = 0
-        author_query = """
-        {
-            "query": {
+            # The min and max commit date of these authors, from all their commits
+            query = {
                 "bool": {
                     "must": [
-                        {"term":
-                            { "Author" : ""  }
-                        }
-                        ]
+                        {"range": {date_field: {"gte": DEMOGRAPHY_COMMIT_MIN_DATE}}},
+                        authors_filter
+                    ]
                 }
             }
+            try:
+                authors_dates = self.__get_authors_dates(query, date_field, composite)
+            except requests.exceptions.HTTPError as ex:
+                logger.error("Error getting authors min and max date. Demography aborted.")
+                logger.error(ex)
+                return
 
-        }
-        """
-        author_query_json = json.loads(author_query)
-
-        for author in authors:
-            # print("%s: %s %s" % (author['key'], author['min']['value_as_string'], author['max']['value_as_string']))
-            # Time to add all the commits (items) from this author
-            author_query_json['query']['bool']['must'][0]['term']['Author'] = author['key']
-            author_query_str = json.dumps(author_query_json)
-            r = self.requests.post(self.elastic.index_url + "/_search?size=10000",
-                                   data=author_query_str, headers=HEADER_JSON,
-                                   verify=False)
+            # Then, add the dates to all the commits (items) of these authors
+            # in a single pass, updating only the demography fields
+            hits = helpers.scan(es, query={"query": {"bool": {"must": [authors_filter]}}},
+                                index=self.elastic.index, _source=["Author"])
 
-            if "hits" not in r.json():
-                logger.error("Can't find commits for %s", author['key'])
-                logger.error(r.json())
-                logger.error(author_query)
-                continue
-            for item in r.json()["hits"]["hits"]:
-                new_item = item['_source']
-                new_item["author_max_date"] = author['max']['value_as_string']
-                if "author_min_date" not in new_item or not new_item['author_min_date']:
-                    new_item["author_min_date"] = author['min']['value_as_string']
+            author_items = []  # partial items with the new date fields
+            for hit in hits:
+                author = hit['_source'].get('Author')
+                if author not in authors_dates:
+                    continue
+                min_date, max_date = authors_dates[author]
+
+                new_item = {"author_min_date": min_date, "author_max_date": max_date}
                 # In p2p the ids are created during enrichment
-                new_item["_item_id"] = item['_id']
+                new_item["_item_id"] = hit['_id']
                 author_items.append(new_item)
 
-            if len(author_items) >= self.elastic.max_items_bulk:
-                self.elastic.bulk_upload(author_items, "_item_id")
-                author_items = []
+                if len(author_items) >= self.elastic.max_items_bulk:
+                    nitems_done += self.elastic.bulk_update(author_items, "_item_id")
+                    author_items = []
 
-            nauthors_done += 1
-            logger.debug("%s: %s %s", author['key'],
-                         author['min']['value_as_string'],
-                         author['max']['value_as_string'])
-            logger.info("Authors processed %i/%i", nauthors_done, len(authors))
+            if author_items:
+                nitems_done += self.elastic.bulk_update(author_items, "_item_id")
 
-        self.elastic.bulk_upload(author_items, "_item_id")
+            logger.info("Authors processed %i/%i", i + len(authors_chunk), len(authors))
 
-        logger.debug("Completed demography enrich from %s" % (self.elastic.index_url))
+        logger.debug("Completed demography enrich from %s (%i items)",
+                     self.elastic.index_url, nitems_done)
+
+    def __get_authors_dates(self, query, date_field, composite):
+        """ Min and max commit date of the authors of the commits matching query """
+
+        if composite:
+            return self.__get_authors_dates_composite(query, date_field)
+        else:
+            return self.__get_authors_dates_scan(query, date_field)
+
+    def __composite_supported(self):
+        """ Composite aggregations are available since ES 6.1 """
+
+        if self.elastic.major in ['2', '5']:
+            return False
+
+        r = self.requests.get(self.elastic.url, verify=False)
+        r.raise_for_status()
+        version = r.json()['version']['number']
+        major, minor = [int(number) for number in version.split('.')[:2]]
+
+        return (major, minor) >= (6, 1)
+
+    def __get_authors_dates_composite(self, query, date_field):
+        """ Min and max commit date per author using a composite aggregation """
+
+        authors = {}
+        es_query = {
+            "query": query,
+            "size": 0,
+            "aggs": {
+                "author": {
+                    "composite": {
+                        "size": self.elastic.max_items_bulk,
+                        "sources": [{"author": {"terms": {"field": "Author"}}}]
+                    },
+                    "aggs": {
+                        "min": {"min": {"field": date_field}},
+                        "max": {"max": {"field": date_field}}
+                    }
+                }
+            }
+        }
+
+        while True:
+            r = self.requests.post(self.elastic.index_url + "/_search",
+                                   data=json.dumps(es_query), headers=HEADER_JSON,
+                                   verify=False)
+            r.raise_for_status()
+            agg = r.json()['aggregations']['author']
+
+            for bucket in agg['buckets']:
+                authors[bucket['key']['author']] = (bucket['min']['value_as_string'],
+                                                    bucket['max']['value_as_string'])
+
+            if not agg['buckets']:
+                break
+            # after_key is only returned since ES 6.3
+            es_query['aggs']['author']['composite']['after'] = agg.get('after_key', agg['buckets'][-1]['key'])
+
+        return authors
+
+    def __get_authors_dates_scan(self, query, date_field):
+        """ Min and max commit date per author reading the commits once (ES < 6) """
+
+        authors = {}
+        es = Elasticsearch([self.elastic.url], timeout=100)
+        hits = helpers.scan(es, query={"query": query}, index=self.elastic.index,
+                            _source=["Author", date_field])
+
+        for hit in hits:
+            author = hit['_source'].get('Author')
+            commit_date = hit['_source'].get(date_field)
+            if author is None or not commit_date:
+                continue
+            if author not in authors:
+                authors[author] = (commit_date, commit_date)
+            else:
+                min_date, max_date = authors[author]
+                authors[author] = (min(min_date, commit_date), max(max_date, commit_date))
+
+        return authors
 
     def enrich_areas_of_code(self, enrich_backend, no_incremental=False):
+        # pandas and cereslib are imported only when the study runs
+        from .study_ceres_aoc import areas_of_code, ESPandasConnector
+
         logger.info("[Areas of Code] Starting study")
 
         # Creating connections
         es = Elasticsearch([self.elastic.url], timeout=100)
         in_conn = ESPandasConnector(es_conn=es, es_index="git_aoc-raw", sort_on_field='metadata__timestamp')
         out_conn = ESPandasConnector(es_conn=es, es_index="git_aoc-enriched", sort_on_field='metadata__timestamp',
-                                     read_only=False)
+                                     read_only=False, bulk_threads=self.ceres_workers)
 
         exists_index = out_conn.exists()
         if no_incremental or not exists_index:
@@ -784,7 +878,8 @@ class GitEnrich(Enrich):
             filename = pkg_resources.resource_filename('grimoire_elk', 'enriched/mappings/git_aoc.json')
             out_conn.create_index(filename, delete=exists_index)
 
-        areas_of_code(git_enrich=enrich_backend, in_conn=in_conn, out_conn=out_conn)
+        areas_of_code(git_enrich=enrich_backend, in_conn=in_conn, out_conn=out_conn,
+                      workers=self.ceres_workers)
 
         # Create alias if output index exists and alias does not
         if out_conn.exists():
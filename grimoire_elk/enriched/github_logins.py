@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+"""Resolution of git users to GitHub logins using the GitHub commits API"""
+
+import logging
+import sqlite3
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from .utils import grimoire_con
+
+
+logger = logging.getLogger(__name__)
+
+GITHUB_API_URL = "https://api.github.com"
+
+# Negative results (user without GitHub login) are retried after this time
+NEGATIVE_TTL = 30 * 24 * 3600
+
+
+class GitHubLoginsCache:
+    """Persistent cache of the GitHub logins of git users.
+
+    Logins are kept in memory and, if `path` is given, in a SQLite
+    database so they are reused in later runs. Users without login are
+    stored too (negative results) and expire after `negative_ttl` seconds.
+
+    :param path: path of the SQLite database, None for a memory only cache
+    :param negative_ttl: seconds to keep the negative results
+    """
+
+    def __init__(self, path=None, negative_ttl=NEGATIVE_TTL):
+        self.path = path
+        self.negative_ttl = negative_ttl
+        self._logins = {}
+        self._lock = threading.Lock()
+        self._db = None
+
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS logins "
+                             "(user TEXT PRIMARY KEY, login TEXT, updated REAL)")
+            self._db.commit()
+            self.__load()
+
+    def get(self, user):
+        """Return a (found, login) tuple for user"""
+
+        with self._lock:
+            if user not in self._logins:
+                return False, None
+            login, updated = self._logins[user]
+            if login is None and self.negative_ttl is not None and \
+                    updated + self.negative_ttl < time.time():
+                del self._logins[user]
+                return False, None
+            return True, login
+
+    def set(self, user, login):
+        """Store the login of user, None if the user has no login"""
+
+        updated = time.time()
+        with self._lock:
+            self._logins[user] = (login, updated)
+            if self._db:
+                self._db.execute("INSERT OR REPLACE INTO logins VALUES (?, ?, ?)",
+                                 (user, login, updated))
+                self._db.commit()
+
+    def close(self):
+        with self._lock:
+            if self._db:
+                self._db.close()
+                self._db = None
+
+    def __len__(self):
+        return len(self._logins)
+
+    def __load(self):
+        for user, login, updated in self._db.execute("SELECT user, login, updated FROM logins"):
+            self._logins[user] = (login, updated)
+        logger.debug("%i GitHub logins loaded from %s", len(self._logins), self.path)
+
+
+class GitHubTokens:
+    """Pool of GitHub API tokens honoring the X-RateLimit-* headers.
+
+    The token with more pending requests is used. When all of them
+    are below `min_rate_to_sleep`, it waits until the first reset.
+
+    :param tokens: list of GitHub API tokens
+    :param min_rate_to_sleep: don't use a token with less pending requests
+    """
+
+    def __init__(self, tokens, min_rate_to_sleep=100):
+        if not tokens:
+            raise ValueError("At least one GitHub token is needed")
+
+        self.min_rate_to_sleep = min_rate_to_sleep
+        # token -> [rate limit remaining, rate limit reset ts]
+        self.rates = {token: [None, None] for token in tokens}
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Return a token with rate limit, waiting for it if needed"""
+
+        while True:
+            with self._lock:
+                now = time.time()
+                for rate in self.rates.values():
+                    # The rate limit has been reset
+                    if rate[1] is not None and rate[1] < now:
+                        rate[0] = None
+                token = max(self.rates, key=self.__pending)
+                remaining, reset = self.rates[token]
+                if remaining is None or remaining > self.min_rate_to_sleep:
+                    if remaining is not None:
+                        self.rates[token][0] -= 1
+                    return token
+                seconds_to_reset = max(min(rate[1] for rate in self.rates.values()) - now + 1, 0)
+
+            logger.info("GitHub rate limit exhausted. Waiting %i secs for rate limit reset.",
+                        seconds_to_reset)
+            time.sleep(seconds_to_reset)
+
+    def update(self, token, headers):
+        """Update the rate limit of token from the response headers"""
+
+        if 'X-RateLimit-Remaining' not in headers:
+            return
+
+        with self._lock:
+            self.rates[token] = [int(headers['X-RateLimit-Remaining']),
+                                 int(headers['X-RateLimit-Reset'])]
+        logger.debug("Rate limit pending: %s", headers['X-RateLimit-Remaining'])
+
+    def __pending(self, token):
+        remaining = self.rates[token][0]
+        return float('inf') if remaining is None else remaining
+
+
+class GitHubLoginResolver:
+    """Get the GitHub logins of git users from the commits in GitHub.
+
+    Logins are read from a persistent cache and the missing ones are
+    requested to the GitHub API (`api_url`, which can point to a local
+    server for testing) using a pool of `workers` threads and several
+    tokens. The rate limit of each token is respected.
+
+    :param tokens: list of GitHub API tokens
+    :param cache: GitHubLoginsCache to use, a memory one by default
+    :param api_url: URL of the GitHub API
+    :param workers: max number of concurrent requests
+    :param min_rate_to_sleep: don't use a token with less pending requests
+    """
+
+    def __init__(self, tokens, cache=None, api_url=GITHUB_API_URL, workers=4,
+                 min_rate_to_sleep=100):
+        self.tokens = GitHubTokens(tokens, min_rate_to_sleep)
+        self.cache = cache if cache is not None else GitHubLoginsCache()
+        self.api_url = api_url
+        self.authors_not_found = 0
+        self.committers_not_found = 0
+
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def get_login(self, user, rol, commit_hash, repo):
+        """Return the GitHub login of user, waiting for the API if needed.
+
+        :param user: git user ("name <email>")
+        :param rol: author or committer
+        :param commit_hash: commit of the user in repo
+        :param repo: GitHub repository (owner/name)
+        """
+        found, login = self.cache.get(user)
+        if found:
+            return login
+
+        return self.submit(user, rol, commit_hash, repo).result()
+
+    def submit(self, user, rol, commit_hash, repo):
+        """Queue the retrieval of the login of user, returning a Future.
+
+        A user is requested only once even if it is submitted several
+        times before the response is received.
+        """
+        if rol not in ['author', 'committer']:
+            logger.error("Wrong rol: %s" % (rol))
+            raise RuntimeError
+
+        with self._lock:
+            future = self._pending.get(user)
+            if not future:
+                future = self._executor.submit(self.__resolve, user, rol, commit_hash, repo)
+                self._pending[user] = future
+        return future
+
+    def is_resolved(self, user):
+        """Whether the login of user is known, including users without login.
+        Users whose request failed are not, so they are requested again."""
+
+        return self.cache.get(user)[0]
+
+    def prefetch(self, commits):
+        """Queue the retrieval of the logins not in the cache.
+
+        :param commits: iterable of (user, rol, commit_hash, repo) tuples
+        """
+        for user, rol, commit_hash, repo in commits:
+            found, _ = self.cache.get(user)
+            if not found:
+                self.submit(user, rol, commit_hash, repo)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.cache.close()
+
+    def __resolve(self, user, rol, commit_hash, repo):
+        try:
+            found, login = self.cache.get(user)
+            if found:
+                return login
+
+            commit_json = self.__fetch_commit(commit_hash, repo)
+            if commit_json is False:
+                # Transient error, not cached
+                return None
+
+            author_login = None
+            if commit_json and commit_json.get('author'):
+                author_login = commit_json['author']['login']
+            else:
+                self.authors_not_found += 1
+
+            committer_login = None
+            if commit_json and commit_json.get('committer'):
+                committer_login = commit_json['committer']['login']
+            else:
+                self.committers_not_found += 1
+
+            login = author_login if rol == 'author' else committer_login
+            self.cache.set(user, login)
+
+            logger.debug("%s is %s in github (not found %i authors %i committers )", user, login,
+                         self.authors_not_found, self.committers_not_found)
+            return login
+        finally:
+            with self._lock:
+                self._pending.pop(user, None)
+
+    def __fetch_commit(self, commit_hash, repo):
+        """Get the commit from the API: None if not found (404), False on other errors"""
+
+        commit_url = self.api_url + "/repos/%s/commits/%s" % (repo, commit_hash)
+
+        # Retry once when the rate limit is exhausted by other clients
+        for _ in range(2):
+            token = self.tokens.acquire()
+            headers = {'Authorization': 'token ' + token}
+            try:
+                r = self.__session().get(commit_url, headers=headers)
+            except requests.exceptions.ConnectionError:
+                logger.error("Can't get github login for %s in %s because a connection error ",
+                             repo, commit_hash)
+                return False
+
+            self.tokens.update(token, r.headers)
+
+            if r.status_code == 403 and r.headers.get('X-RateLimit-Remaining') == '0':
+                continue
+            if r.status_code == 404:
+                logger.error("Can't find commit %s", commit_url)
+                return None
+            try:
+                r.raise_for_status()
+            except requests.exceptions.HTTPError as ex:
+                logger.error("Can't find commit %s %s", commit_url, ex)
+                return False
+            return r.json()
+
+        return False
+
+    def __session(self):
+        # requests sessions are not thread safe
+        if not hasattr(self._local, 'session'):
+            self._local.session = grimoire_con(insecure=False)
+        return self._local.session
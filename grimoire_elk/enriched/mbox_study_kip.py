@@ -34,6 +34,9 @@ logger = logging.getLogger(__name__)
 
 MAX_LINES_FOR_VOTE = 10
 
+# Fields of the messages read to compute the kip fields
+KIP_SOURCE_FIELDS = ["Subject", "email_date", "body_extract"]
+
 
 def kafka_kip(enrich):
 
@@ -221,12 +224,12 @@ def kafka_kip(enrich):
 
         return result
 
-    def add_kip_final_status_field(enrich):
+    def add_kip_final_status_field(enrich, eitems):
         """ Add kip final status field """
 
         total = 0
 
-        for eitem in enrich.fetch():
+        for eitem in eitems:
             if "kip" not in eitem:
                 # It is not a KIP message
                 continue
@@ -242,7 +245,7 @@ def kafka_kip(enrich):
 
         logger.info("Total eitems with kafka final status kip field %i", total)
 
-    def add_kip_time_status_fields(enrich):
+    def add_kip_time_status_fields(enrich, eitems):
         """ Add kip fields with final status and times """
 
         total = 0
@@ -250,7 +253,7 @@ def kafka_kip(enrich):
 
         enrich.kips_final_status = {}  # final status for each kip
 
-        for eitem in enrich.fetch():
+        for eitem in eitems:
             # kip_status: adopted (closed), discussion (open), voting (open),
             #             inactive (open), discarded (closed)
             # kip_start_end: discuss_start, discuss_end, voting_start, voting_end
@@ -349,7 +352,7 @@ def kafka_kip(enrich):
 
         logger.info("Total eitems with kafka extra kip fields %i", total)
 
-    def add_kip_fields(enrich):
+    def add_kip_fields(enrich, eitems):
         """ Add extra fields needed for kip analysis"""
 
         total = 0
@@ -365,8 +368,7 @@ def kafka_kip(enrich):
 
         enrich.kips_scores = {}
 
-        # First iteration
-        for eitem in enrich.fetch():
+        for eitem in eitems:
             kip_fields = {
                 "kip_is_vote": 0,
                 "kip_is_discuss": 0,
@@ -437,14 +439,21 @@ def kafka_kip(enrich):
 
     logger.debug("Doing kafka_kip study from %s", enrich.elastic.index_url)
 
-    # First iteration with the basic fields
-    eitems = add_kip_fields(enrich)
-    enrich.elastic.bulk_upload(eitems, enrich.get_field_unique_id())
+    field_id = enrich.get_field_unique_id()
+
+    # Only the messages with KIP in the subject are read, with the fields needed
+    kip_filter = {"name": "Subject", "value": "*KIP*", "type": "wildcard"}
+    eitems = enrich.fetch(kip_filter, _source=[field_id] + KIP_SOURCE_FIELDS)
+
+    # The KIP messages are kept in memory to compute the per KIP fields:
+    # first the basic fields, then the time and status fields
+    eitems = list(add_kip_fields(enrich, eitems))
+    eitems = list(add_kip_time_status_fields(enrich, eitems))
 
-    # Second iteration with the final time and status fields
-    eitems = add_kip_time_status_fields(enrich)
-    enrich.elastic.bulk_upload(eitems, enrich.get_field_unique_id())
+    # And the end status field for all KIPs
+    eitems = add_kip_final_status_field(enrich, eitems)
 
-    # Third iteration to compute the end status field for all KIPs
-    eitems = add_kip_final_status_field(enrich)
-    enrich.elastic.bulk_upload(eitems, enrich.get_field_unique_id())
+    # Only the kip fields are updated
+    kip_eitems = ({field: value for field, value in eitem.items() if field not in KIP_SOURCE_FIELDS}
+                  for eitem in eitems)
+    enrich.elastic.bulk_update(kip_eitems, field_id)
@@ -31,6 +31,8 @@ from sortinghat import api
 from sortinghat.db.model import Identity
 from sortinghat.exceptions import AlreadyExistsError, WrappedValueError
 
+from ..metrics import timed
+
 
 logger = logging.getLogger(__name__)
 
@@ -49,6 +51,13 @@ class SortingHat(object):
                 uuid = identities[0].uuid
         return uuid
 
+    @classmethod
+    def get_modified_identities(cls, db, after):
+        """ uuids of the unique identities (profiles and enrollments included) and
+        ids of the identities (or moved to other unique identity) modified since after """
+
+        return api.search_last_modified_identities(db, after)
+
     @classmethod
     def get_github_commit_username(cls, db, identity, source):
         user = None
@@ -80,6 +89,7 @@ class SortingHat(object):
         return user
 
     @classmethod
+    @timed('sh_add_identity', latency='sql')
     def add_identity(cls, db, identity, backend):
         """ Load and identity list from backend in Sorting Hat """
         uuid = None
@@ -21,10 +21,10 @@
 
 import logging
 
-from elasticsearch import helpers
+import numpy
+import pandas
 
-from cereslib.dfutils.filter import FilterRows
-from cereslib.enrich.enrich import FileType, FilePath, ToUTF8
+from cereslib.enrich.enrich import FileType, ToUTF8
 from cereslib.events.events import Git, Events
 
 from grimoire_elk.enriched.ceres_base import ESConnector, CeresBase
@@ -40,9 +40,15 @@ class ESPandasConnector(ESConnector):
     nstead of using the hit as it comes from ES. This intends to ease the
     process of building a pandas dataframe.
 
+    Items are read in `sort_on_field` order using search_after, with `uuid`
+    to break ties, instead of an ordered scroll.
+
     Writing is also ready to work directly with Pandas dataframes.
     """
 
+    TIE_BREAKER_FIELD = 'uuid'
+    READ_SIZE = 1000
+
     def read_item(self, from_date=None):
         """Read items one by one.
 
@@ -52,13 +58,9 @@ class ESPandasConnector(ESConnector):
         :raises NotFoundError: index not found in ElasticSearch
         """
 
-        search_query = self._build_search_query(from_date)
-        for hit in helpers.scan(self._es_conn,
-                                search_query,
-                                scroll='300m',
-                                index=self._es_index,
-                                preserve_order=True):
-            yield hit["_source"]
+        for hits_block in self.read_block(self.READ_SIZE, from_date=from_date):
+            for hit in hits_block:
+                yield hit
 
     def read_block(self, size, from_date=None):
         """Read items block by block.
@@ -71,50 +73,50 @@ class ESPandasConnector(ESConnector):
         """
 
         search_query = self._build_search_query(from_date)
-        hits_block = []
-        for hit in helpers.scan(self._es_conn,
-                                search_query,
-                                scroll='300m',
-                                index=self._es_index,
-                                preserve_order=True):
-
-            hits_block.append(hit["_source"])
+        search_query['sort'].append({self.TIE_BREAKER_FIELD: {"order": "asc"}})
+        search_query['size'] = size
 
-            if len(hits_block) % size == 0:
-                yield hits_block
+        while True:
+            response = self._es_conn.search(index=self._es_index, body=search_query)
+            hits = response['hits']['hits']
+            if not hits:
+                break
 
-                # Reset hits block
-                hits_block = []
+            yield [hit["_source"] for hit in hits]
 
-        if len(hits_block) > 0:
-            yield hits_block
+            search_query['search_after'] = hits[-1]['sort']
 
     def write(self, items):
         """Write items into ElasticSearch.
 
+        Bulk actions are generated from the columns of the DataFrame
+        while they are uploaded.
+
         :param items: Pandas DataFrame
         """
 
         if self._read_only:
             raise IOError("Cannot write, Connector created as Read Only")
 
+        if len(items) == 0:
+            logger.info("Written: 0")
+            return
+
         # Uploading info to the new ES
-        rows = items.to_dict("index")
-        docs = []
-        for row_index in rows.keys():
-            row = rows[row_index]
-            item_id = row[Events.PERCEVAL_UUID] + "_" + row[Git.FILE_PATH] +\
-                "_" + row[Git.FILE_EVENT]
-            doc = {
-                "_index": self._es_index,
-                "_type": "item",
-                "_id": item_id,
-                "_source": row
-            }
-            docs.append(doc)
+        columns = list(items.columns)
+        items_ids = items[Events.PERCEVAL_UUID] + "_" + items[Git.FILE_PATH] + "_" + items[Git.FILE_EVENT]
+        rows = zip(*[items[column].tolist() for column in columns])
+
+        docs = ({
+            "_index": self._es_index,
+            "_type": "item",
+            "_id": item_id,
+            "_source": dict(zip(columns, row))
+        } for item_id, row in zip(items_ids.tolist(), rows))
+
         # TODO exception and error handling
-        helpers.bulk(self._es_conn, docs)
-        logger.info("Written: " + str(len(docs)))
+        written = self._bulk(docs)
+        logger.info("Written: " + str(written))
 
 
 class AreasOfCode(CeresBase):
@@ -129,9 +131,9 @@ class AreasOfCode(CeresBase):
     :param self._git_enrich: GitEnrich object to manage SortingHat affiliations.
     """
 
-    def __init__(self, in_connector, out_connector, block_size, git_enrich):
+    def __init__(self, in_connector, out_connector, block_size, git_enrich, workers=1):
 
-        super().__init__(in_connector, out_connector, block_size)
+        super().__init__(in_connector, out_connector, block_size, workers)
 
         self._git_enrich = git_enrich
 
@@ -147,49 +149,117 @@ class AreasOfCode(CeresBase):
 
         logger.info("New commits: " + str(len(items_block)))
 
-        # Create events from commits
-        git_events = Git(items_block, self._git_enrich)
-        events_df = git_events.eventize(2)
+        events_df = self.__eventize(items_block)
 
         logger.info("New events: " + str(len(events_df)))
 
+        if len(events_df) == 0:
+            return self.ProcessResults(processed=0, out_items=events_df)
+
         # Filter information
-        data_filtered = FilterRows(events_df)
-        events_df = data_filtered.filter_(["filepath"], "-")
+        events_df = events_df[events_df[Git.FILE_PATH] != "-"].copy()
 
         logger.info("New events filtered: " + str(len(events_df)))
 
         # Add filetype info
         enriched_filetype = FileType(events_df)
-        events_df = enriched_filetype.enrich('filepath')
-
-        logger.info("New Filetype events: " + str(len(events_df)))
+        events_df = enriched_filetype.enrich(Git.FILE_PATH)
 
         # Split filepath info
-        enriched_filepath = FilePath(events_df)
-        events_df = enriched_filepath.enrich('filepath')
+        events_df = self.__add_file_path(events_df, Git.FILE_PATH)
+
+        logger.info("Final new events: " + str(len(events_df)))
+
+        return self.ProcessResults(processed=len(events_df), out_items=events_df)
+
+    def __eventize(self, items_block):
+        """Create one event per file in the commits.
+
+        Commit fields (including SortingHat and project ones) are computed
+        once per commit with cereslib and copied to the events of its files.
+        """
+
+        # Merges and commits without files don't generate events
+        commits = [item for item in items_block if item['data'].get('files')]
+        if not commits:
+            return pandas.DataFrame()
 
-        logger.info("New Filepath events: " + str(len(events_df)))
+        # Commit fields, using a single empty file per commit
+        commits_items = []
+        for item in commits:
+            commit_item = dict(item)
+            commit_item['data'] = dict(item['data'], files=[{}])
+            commits_items.append(commit_item)
+
+        commits_df = Git(commits_items, self._git_enrich).eventize(2)
 
         # Deal with surrogates
-        convert = ToUTF8(events_df)
-        events_df = convert.enrich(["owner"])
+        convert = ToUTF8(commits_df)
+        commits_df = convert.enrich(["owner"])
 
-        logger.info("Final new events: " + str(len(events_df)))
+        # Files fields
+        positions = []
+        files = []
+        for position, item in enumerate(commits):
+            for cfile in item['data']['files']:
+                positions.append(position)
+                files.append(cfile)
 
-        return self.ProcessResults(processed=len(events_df), out_items=events_df)
+        files_df = pandas.DataFrame.from_records(files, columns=['action', 'file', 'added', 'removed'])
+        files_df['position'] = positions
+
+        events_df = commits_df.iloc[positions].reset_index(drop=True)
+
+        has_action = files_df['action'].notnull()
+        events_df[Git.FILE_FILES] = has_action.groupby(files_df['position']).transform('sum').astype(int)
+        events_df[Git.FILE_EVENT] = numpy.where(has_action, Git.EVENT_FILE + files_df['action'].fillna(''), "-")
+        events_df[Git.FILE_PATH] = files_df['file'].fillna("-")
+        events_df[Git.FILE_ADDED_LINES] = self.__lines(files_df['added'])
+        events_df[Git.FILE_REMOVED_LINES] = self.__lines(files_df['removed'])
+
+        return events_df
+
+    @staticmethod
+    def __lines(lines):
+        """Number of lines changed ("-" for binary files)"""
+
+        return pandas.to_numeric(lines.replace("-", 0), errors='coerce').fillna(0).astype(int)
+
+    @staticmethod
+    def __add_file_path(events_df, column):
+        """Add file name, extension, dir name and path parts of the files"""
+
+        paths = events_df[column]
+
+        file_name = paths.str.rsplit('/', n=1).str[-1]
+        file_ext = numpy.where(file_name.str.contains('.', regex=False),
+                               file_name.str.rsplit('.', n=1).str[-1], '')
+
+        # Series.replace uses regular expressions in every pandas version,
+        # unlike Series.str.replace (literal by default since pandas 2.0)
+        dir_name = paths.replace('/+', '/', regex=True)
+        dir_name = numpy.where(dir_name.str.startswith('/'), dir_name, '/' + dir_name)
+        dir_name = pandas.Series(dir_name, index=events_df.index).str.rsplit('/', n=1).str[0] + '/'
+
+        path_list = paths.replace(['/+', '^/', '/$'], ['/', '', ''], regex=True)
+
+        return events_df.assign(file_name=file_name,
+                                file_ext=file_ext,
+                                file_dir_name=dir_name,
+                                file_path_list=path_list.str.split('/'))
 
 
-def areas_of_code(git_enrich, in_conn, out_conn, block_size=100):
+def areas_of_code(git_enrich, in_conn, out_conn, block_size=1000, workers=1):
     """Build and index for areas of code from a given Perceval RAW index.
 
     :param block_size: size of items block.
     :param git_enrich: GitEnrich object to deal with SortingHat affiliations.
     :param in_conn: ESPandasConnector to read from.
     :param out_conn: ESPandasConnector to write to.
+    :param workers: number of blocks processed in parallel.
     :return: number of documents written in ElasticSearch enriched index.
     """
     aoc = AreasOfCode(in_connector=in_conn, out_connector=out_conn, block_size=block_size,
-                      git_enrich=git_enrich)
+                      git_enrich=git_enrich, workers=workers)
     ndocs = aoc.analyze()
     return ndocs
@@ -52,81 +52,58 @@ class ESOnionConnector(ESConnector):
     AUTHOR_NAME = 'author_name'
     AUTHOR_ORG = 'author_org_name'
     AUTHOR_UUID = 'author_uuid'
+    AUTHORS = 'authors'
     CONTRIBUTIONS = 'contributions'
     LATEST_TS = 'latest_ts'
     TIMEFRAME = 'timeframe'
     TIMESTAMP = 'metadata__timestamp'
     PROJECT = 'project'
 
+    # Buckets per page of the authors composite aggregation
+    COMPOSITE_SIZE = 1000
+    # Group key of the authors without org or project when scanning
+    # (groupby drops the null keys in the supported pandas versions)
+    MISSING_KEY = '__missing__'
+
     def __init__(self, es_conn, es_index, contribs_field,
                  timeframe_field='grimoire_creation_date',
-                 sort_on_field='metadata__timestamp', read_only=True):
+                 sort_on_field='metadata__timestamp', read_only=True, bulk_threads=1):
 
-        super().__init__(es_conn, es_index, sort_on_field, read_only)
+        super().__init__(es_conn, es_index, sort_on_field, read_only, bulk_threads)
 
         self.contribs_field = contribs_field
         self._timeframe_field = timeframe_field
+        self._composite = None
+        # Quarters already refreshed when writing
+        self._refreshed_timeframes = set()
 
     def read_block(self, size=None, from_date=None):
-        """Read author commits by Quarter, Org and Project.
+        """Read author contributions by Quarter, Org and Project.
+
+        Each quarter is read with a single aggregation by author, org and
+        project, and all its slices (global, by org, by project and by project
+        and org) are computed from it.
 
-        :param from_date: not used here. Incremental mode not supported yet.
+        :param from_date: only quarters with items modified since this date are read,
+            they must be fully rewritten.
         :param size: not used here.
-        :return: DataFrame with commit count per author, split by quarter, org and project.
+        :return: DataFrame with contributions per author, one per quarter and slice.
         """
+        quarters = self.__quarters(from_date)
 
-        # Get quarters corresponding to All items (Incremental mode NOT SUPPORTED)
-        quarters = self.__quarters()
-
-        for quarter in quarters:
+        for quarter, timeframe in quarters:
 
             logger.info("[Onion] Quarter: " + str(quarter))
 
             date_range = {self._timeframe_field: {'gte': quarter.start_time, 'lte': quarter.end_time}}
 
-            orgs = self.__list_uniques(date_range, self.AUTHOR_ORG)
-            projects = self.__list_uniques(date_range, self.PROJECT)
-
-            # Get global data
-            s = self.__build_search(date_range)
-            response = s.execute()
-
-            for timing in response.aggregations[self.TIMEFRAME].buckets:
-                yield self.__build_dataframe(timing).copy()
-
-            # Get global data by Org
-            for org_name in orgs:
-
-                logger.info("[Onion] Quarter: " + str(quarter) + "  Org: " + org_name)
-
-                s = self.__build_search(date_range, org_name=org_name)
-                response = s.execute()
-
-                for timing in response.aggregations[self.TIMEFRAME].buckets:
-                    yield self.__build_dataframe(timing, org_name=org_name).copy()
-
-            # Get project specific data
-            for project in projects:
+            authors = self.__read_authors(date_range)
+            if authors.empty:
+                continue
 
-                logger.info("[Onion] Quarter: " + str(quarter) + "  Project: " + project)
-
-                # Global project
-                s = self.__build_search(date_range, project_name=project)
-                response = s.execute()
-
-                for timing in response.aggregations[self.TIMEFRAME].buckets:
-                    yield self.__build_dataframe(timing, project_name=project).copy()
-
-                # Split by Org
-                for org_name in orgs:
-
-                    logger.info("[Onion] Quarter: " + str(quarter) + "  Project: " + project + "  Org: " + org_name)
-
-                    s = self.__build_search(date_range, project_name=project, org_name=org_name)
-                    response = s.execute()
-
-                    for timing in response.aggregations[self.TIMEFRAME].buckets:
-                        yield self.__build_dataframe(timing, project_name=project, org_name=org_name).copy()
+            for project_name, org_name, slice_authors in self.__slices(authors):
+                yield self.__build_dataframe(timeframe, slice_authors,
+                                             project_name=project_name, org_name=org_name)
 
     def write(self, items):
         """Write items into ElasticSearch.
@@ -157,31 +134,41 @@ class ESOnionConnector(ESConnector):
             }
             docs.append(doc)
 
-        # TODO uncomment following lines for incremental version
-        # # Delete old data if exists to ensure refreshing in case of deleted commits
-        # timeframe = docs[0]['_source']['timeframe']
-        # org = docs[0]['_source']['author_org_name']
-        # project = docs[0]['_source']['project']
-        # s = Search(using=self._es_conn, index=self._es_index)
-        # s = s.filter('term', project=project)
-        # s = s.filter('term', author_org_name=org)
-        # s = s.filter('term', timeframe=timeframe)
-        # response = s.execute()
-        #
-        # if response.hits.total > 0:
-        #     response = s.delete()
-        #     logger.info("[Onion] Deleted " + str(response.deleted) + " items for refreshing: " + timeframe + " "
-        #                 + org + " " + project)
+        # Delete old data of the quarter before writing its first slice, to ensure
+        # refreshing in case of deleted items or authors moved to other orgs
+        timeframe = docs[0]['_source'][self.TIMEFRAME]
+        if timeframe not in self._refreshed_timeframes:
+            self._refreshed_timeframes.add(timeframe)
+            deleted = self.delete_items(timeframe)
+            logger.info("[Onion] Deleted " + str(deleted) + " items for refreshing: " + timeframe)
 
         # TODO exception and error handling
-        helpers.bulk(self._es_conn, docs)
+        self._bulk(docs)
         logger.info("[Onion] Written: " + str(len(docs)))
 
+    def delete_items(self, timeframe=None):
+        """Delete items from ElasticSearch.
+
+        :param timeframe: delete only the items of this quarter, all of them if None.
+        :return: number of items deleted
+        """
+        if self._read_only:
+            raise IOError("Cannot write, Connector created as Read Only")
+
+        s = Search(using=self._es_conn, index=self._es_index)
+        if timeframe:
+            s = s.filter('term', **{self.TIMEFRAME: timeframe})
+
+        # Refresh, so the items are not read as the latest ones
+        response = s.params(conflicts='proceed', refresh=True).delete()
+
+        return response.deleted
+
     def __quarters(self, from_date=None):
         """Get a set of quarters with available items from a given index date.
 
         :param from_date:
-        :return: list of `pandas.Period` corresponding to quarters
+        :return: list of (`pandas.Period`, timeframe) tuples corresponding to quarters
         """
         s = Search(using=self._es_conn, index=self._es_index)
         if from_date:
@@ -200,82 +187,171 @@ class ESOnionConnector(ESConnector):
         quarters = []
         for quarter in response.aggregations[self.TIMEFRAME].buckets:
             period = pandas.Period(quarter.key_as_string, 'Q')
-            quarters.append(period)
+            quarters.append((period, quarter.key_as_string))
 
         return quarters
 
-    def __list_uniques(self, date_range, field_name):
-        """Retrieve a list of unique values in a given field within a date range.
+    def __read_authors(self, date_range):
+        """Read the contributions of each author by org and project within a date range.
 
         :param date_range:
-        :param field_name:
-        :return: list  of unique values.
+        :return: DataFrame with one row per author, org and project. Org and
+            project are None for the items without them.
         """
-        # Get project list
-        s = Search(using=self._es_conn, index=self._es_index)
-        s = s.filter('range', **date_range)
-        # from:to parameters (=> from: 0, size: 0)
-        s = s[0:0]
-        s.aggs.bucket('uniques', 'terms', field=field_name, size=1000)
-        response = s.execute()
-        uniques_list = []
-        for item in response.aggregations.uniques.buckets:
-            uniques_list.append(item.key)
-
-        return uniques_list
-
-    def __build_search(self, date_range, project_name=None, org_name=None):
-        s = Search(using=self._es_conn, index=self._es_index)
-        s = s.filter('range', **date_range)
-        if project_name:
-            s = s.filter('term', project=project_name)
-        if org_name:
-            s = s.filter('term', author_org_name=org_name)
+        if self.__composite_supported():
+            rows = self.__aggregate_authors(date_range)
+        else:
+            rows = self.__scan_authors(date_range)
+
+        return pandas.DataFrame(rows, columns=[self.AUTHOR_UUID, self.AUTHOR_ORG, self.PROJECT,
+                                               self.AUTHOR_NAME, self.CONTRIBUTIONS, self.LATEST_TS])
+
+    def __aggregate_authors(self, date_range):
+        """Read authors using a composite aggregation, paging over all of them"""
+
+        # Get author_name and most recent metadata__timestamp per author, org and project
+        # (latest timestamp is summarized by slice, as we are going to recalculate the whole quarter)
+        composite = {
+            "size": self.COMPOSITE_SIZE,
+            "sources": [
+                {self.AUTHOR_UUID: {"terms": {"field": self.AUTHOR_UUID}}},
+                {self.AUTHOR_ORG: {"terms": {"field": self.AUTHOR_ORG, "missing_bucket": True}}},
+                {self.PROJECT: {"terms": {"field": self.PROJECT, "missing_bucket": True}}}
+            ]
+        }
+        query = {
+            "size": 0,
+            "query": {"bool": {"filter": [{"range": date_range}]}},
+            "aggs": {
+                self.AUTHORS: {
+                    "composite": composite,
+                    "aggs": {
+                        self.CONTRIBUTIONS: {"cardinality": {"field": self.contribs_field,
+                                                             "precision_threshold": 40000}},
+                        self.LATEST_TS: {"max": {"field": self._sort_on_field}},
+                        self.AUTHOR_NAME: {"terms": {"field": self.AUTHOR_NAME, "size": 1}}
+                    }
+                }
+            }
+        }
+
+        rows = []
+        while True:
+            response = self._es_conn.search(index=self._es_index, body=query)
+            authors = response['aggregations'][self.AUTHORS]
+            if not authors['buckets']:
+                break
+
+            for bucket in authors['buckets']:
+                names = bucket[self.AUTHOR_NAME]['buckets']
+                rows.append((bucket['key'][self.AUTHOR_UUID],
+                             bucket['key'][self.AUTHOR_ORG],
+                             bucket['key'][self.PROJECT],
+                             names[0]['key'] if names else None,
+                             bucket[self.CONTRIBUTIONS]['value'],
+                             bucket[self.LATEST_TS]['value_as_string']))
+
+            # after_key is only returned since ES 6.3
+            composite['after'] = authors.get('after_key', authors['buckets'][-1]['key'])
+
+        return rows
+
+    def __scan_authors(self, date_range):
+        """Read authors scanning all the items, for ES versions without the composite
+        aggregations needed (with missing_bucket)"""
+
+        fields = [self.AUTHOR_UUID, self.AUTHOR_ORG, self.PROJECT, self.AUTHOR_NAME,
+                  self.contribs_field, self._sort_on_field]
+        query = {"query": {"bool": {"filter": [{"range": date_range}]}}}
+
+        hits = helpers.scan(self._es_conn, query=query, index=self._es_index, _source=fields)
+        items = pandas.DataFrame([[hit['_source'].get(field) for field in fields] for hit in hits],
+                                 columns=fields)
+        items = items[items[self.AUTHOR_UUID].notnull()]
+        if items.empty:
+            return []
+
+        keys = [self.AUTHOR_ORG, self.PROJECT]
+        items = items.fillna({key: self.MISSING_KEY for key in keys})
+
+        grouped = items.groupby([self.AUTHOR_UUID] + keys, sort=False)
+        authors = grouped.agg({
+            self.AUTHOR_NAME: self.__most_frequent,
+            self.contribs_field: 'nunique',
+            self._sort_on_field: 'max'
+        }).reset_index()
+        authors = authors.rename(columns={self.contribs_field: self.CONTRIBUTIONS,
+                                          self._sort_on_field: self.LATEST_TS})
+        authors[keys] = authors[keys].where(authors[keys] != self.MISSING_KEY)
+
+        columns = [self.AUTHOR_UUID, self.AUTHOR_ORG, self.PROJECT,
+                   self.AUTHOR_NAME, self.CONTRIBUTIONS, self.LATEST_TS]
+        authors = authors[columns].astype(object)
+        authors = authors.where(authors.notnull(), None)
+        return list(authors.itertuples(index=False, name=None))
+
+    @staticmethod
+    def __most_frequent(values):
+        counts = values.value_counts()
+        return counts.index[0] if len(counts) else None
+
+    def __composite_supported(self):
+        """Composite aggregations are available since ES 6.1, but missing_bucket
+        (needed for the items without org or project) only since ES 6.4"""
+
+        if self._composite is None:
+            version = self._es_conn.info()['version']['number']
+            major, minor = [int(number) for number in version.split('.')[:2]]
+            self._composite = (major, minor) >= (6, 4)
+
+        return self._composite
+
+    def __slices(self, authors):
+        """Split the authors of a quarter in global, org, project and project and org slices.
+
+        :param authors: DataFrame with the contributions per author, org and project
+        :return: generator of (project_name, org_name, authors) tuples, with None for global values
+        """
+        yield None, None, authors
 
-        # from:to parameters (=> from: 0, size: 0)
-        s = s[0:0]
+        with_org = authors[authors[self.AUTHOR_ORG].notnull()]
+        for org_name, org_authors in with_org.groupby(self.AUTHOR_ORG):
+            yield None, org_name, org_authors
 
-        # Get author_name and most recent metadata__timestamp for quarter (should be enough per quarter,
-        # computing it by user probably is not needed as we are going to recalculate the whole quarter)
+        with_project = authors[authors[self.PROJECT].notnull()]
+        for project_name, project_authors in with_project.groupby(self.PROJECT):
+            yield project_name, None, project_authors
 
-        # We are not keeping all metadata__* fields because we are grouping commits by author, so we can only
-        # store one value per author.
-        s.aggs.bucket(self.TIMEFRAME, 'date_histogram', field=self._timeframe_field, interval='quarter') \
-            .metric(self.LATEST_TS, 'max', field=self._sort_on_field)\
-            .bucket(self.AUTHOR_UUID, 'terms', field=self.AUTHOR_UUID, size=1000) \
-            .metric(self.CONTRIBUTIONS, 'cardinality', field=self.contribs_field, precision_threshold=40000)\
-            .bucket(self.AUTHOR_NAME, 'terms', field=self.AUTHOR_NAME, size=1)
+            with_org = project_authors[project_authors[self.AUTHOR_ORG].notnull()]
+            for org_name, org_authors in with_org.groupby(self.AUTHOR_ORG):
+                yield project_name, org_name, org_authors
 
-        return s
+    def __build_dataframe(self, timeframe, authors, project_name=None, org_name=None):
+        """Build a DataFrame with the contributions per author in a slice.
 
-    def __build_dataframe(self, timing, project_name=None, org_name=None):
-        """Build a DataFrame from a time bucket.
+        Contributions of an author are added up along the orgs and projects of
+        the slice, as each contribution belongs to a single org and project.
 
-        :param timing:
+        :param timeframe: quarter of the slice
+        :param authors: DataFrame with the contributions per author, org and project in the slice
         :param project_name:
         :param org_name:
         :return:
         """
-        date_list = []
-        uuid_list = []
-        name_list = []
-        contribs_list = []
-        latest_ts_list = []
-        logger.debug("[Onion] timing: " + timing.key_as_string)
-
-        for author in timing[self.AUTHOR_UUID].buckets:
-            latest_ts_list.append(timing[self.LATEST_TS].value_as_string)
-            date_list.append(timing.key_as_string)
-            uuid_list.append(author.key)
-            name_list.append(author[self.AUTHOR_NAME].buckets[0].key)
-            contribs_list.append(author[self.CONTRIBUTIONS].value)
+        logger.debug("[Onion] timing: " + timeframe)
+
+        # Name of the author is taken from the org and project with more contributions
+        authors = authors.sort_values(self.CONTRIBUTIONS, ascending=False, kind='mergesort')
+        grouped = authors.groupby(self.AUTHOR_UUID, sort=False)
+        contribs = grouped[self.CONTRIBUTIONS].sum()
+        names = grouped[self.AUTHOR_NAME].first()
 
         df = pandas.DataFrame()
-        df[self.TIMEFRAME] = date_list
-        df[self.AUTHOR_UUID] = uuid_list
-        df[self.AUTHOR_NAME] = name_list
-        df[self.CONTRIBUTIONS] = contribs_list
-        df[self.TIMESTAMP] = latest_ts_list
+        df[self.TIMEFRAME] = [timeframe] * len(contribs)
+        df[self.AUTHOR_UUID] = list(contribs.index)
+        df[self.AUTHOR_NAME] = list(names.reindex(contribs.index))
+        df[self.CONTRIBUTIONS] = list(contribs)
+        df[self.TIMESTAMP] = authors[self.LATEST_TS].max()
 
         if not project_name:
             project_name = "_Global_"
@@ -298,9 +374,9 @@ class OnionStudy(CeresBase):
     :param self._out: ESOnionConnector to write processed items to.
     """
 
-    def __init__(self, in_connector, out_connector, data_source):
+    def __init__(self, in_connector, out_connector, data_source, workers=1):
 
-        super().__init__(in_connector, out_connector, None)
+        super().__init__(in_connector, out_connector, None, workers)
 
         self.data_source = data_source
 
@@ -329,14 +405,16 @@ class OnionStudy(CeresBase):
         return self.ProcessResults(processed=len(df_onion), out_items=df_onion)
 
 
-def onion_study(in_conn, out_conn, data_source):
+def onion_study(in_conn, out_conn, data_source, workers=1):
     """Build and index for onion from a given Git index.
 
     :param in_conn: ESPandasConnector to read from.
     :param out_conn: ESPandasConnector to write to.
     :param data_source: name of the date source to generate onion from.
+    :param workers: number of blocks processed in parallel.
     :return: number of documents written in ElasticSearch enriched index.
     """
-    onion = OnionStudy(in_connector=in_conn, out_connector=out_conn, data_source=data_source)
+    onion = OnionStudy(in_connector=in_conn, out_connector=out_conn, data_source=data_source,
+                       workers=workers)
     ndocs = onion.analyze()
     return ndocs
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+"""Timing and throughput of the stages of a run"""
+
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the buckets of the latency histograms
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+PROMETHEUS_PREFIX = 'grimoire_elk'
+
+
+class StageTiming:
+    """Items and bytes processed inside a Metrics.timer block"""
+
+    def __init__(self):
+        self.items = 0
+        self.nbytes = 0
+
+
+class Metrics:
+    """Wall time, items and bytes of each stage of a run, and latency
+    histograms of the calls to external services (ES, SortingHat).
+
+    Stages are accumulated by name, so a stage run several times (e.g.
+    one per bulk request) is reported once with the number of calls.
+    It can be used from several threads.
+
+    :param buckets: upper bounds of the buckets of the latency histograms
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}  # stage -> {calls, time, items, bytes}
+            self.latencies = {}  # call -> {count, sum, buckets (not cumulative)}
+
+    def add(self, stage, seconds=0, items=0, nbytes=0, calls=1):
+        """Add a run of a stage"""
+
+        with self._lock:
+            stats = self.stages.setdefault(stage, {'calls': 0, 'time': 0, 'items': 0, 'bytes': 0})
+            stats['calls'] += calls
+            stats['time'] += seconds
+            stats['items'] += items
+            stats['bytes'] += nbytes
+
+    def observe(self, call, seconds):
+        """Add the latency of a call to its histogram"""
+
+        with self._lock:
+            histogram = self.latencies.get(call)
+            if not histogram:
+                histogram = {'count': 0, 'sum': 0, 'buckets': [0] * (len(self.buckets) + 1)}
+                self.latencies[call] = histogram
+            histogram['count'] += 1
+            histogram['sum'] += seconds
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    break
+            else:
+                i = len(self.buckets)
+            histogram['buckets'][i] += 1
+
+    @contextmanager
+    def timer(self, stage, latency=None):
+        """Time the block as a run of stage, and as a call to latency if given.
+
+        The block can set the items and bytes processed in the StageTiming
+        yielded.
+        """
+        timing = StageTiming()
+        start = time.perf_counter()
+        try:
+            yield timing
+        finally:
+            seconds = time.perf_counter() - start
+            self.add(stage, seconds, timing.items, timing.nbytes)
+            if latency:
+                self.observe(latency, seconds)
+
+    def summary(self):
+        """Dict with the stages and the latency histograms. The buckets of
+        each histogram are a list of [bound, cumulative count] pairs in
+        increasing bound order."""
+
+        with self._lock:
+            stages = {stage: dict(stats) for stage, stats in self.stages.items()}
+            latencies = {}
+            for call, histogram in self.latencies.items():
+                cumulative = 0
+                buckets = []
+                for bound, count in zip(list(self.buckets) + ['+Inf'], histogram['buckets']):
+                    cumulative += count
+                    buckets.append([str(bound), cumulative])
+                latencies[call] = {'count': histogram['count'], 'sum': histogram['sum'],
+                                   'buckets': buckets}
+
+        return {'stages': stages, 'latencies': latencies}
+
+    def log_summary(self):
+        summary = self.summary()
+
+        if not summary['stages']:
+            return
+
+        logger.info("Stages summary:")
+        for stage, stats in sorted(summary['stages'].items(), key=lambda s: -s[1]['time']):
+            rate = stats['items'] / stats['time'] if stats['time'] else 0
+            logger.info("  %s: %.2f s, %i calls, %i items (%.1f items/s), %.2f MB",
+                        stage, stats['time'], stats['calls'], stats['items'], rate,
+                        stats['bytes'] / (1024 * 1024))
+        for call, histogram in sorted(summary['latencies'].items()):
+            mean = histogram['sum'] / histogram['count'] * 1000
+            logger.info("  %s latency: %i calls, mean %.1f ms", call, histogram['count'], mean)
+
+    def write_json(self, path):
+        """Write the summary to a JSON file"""
+
+        self.__write(path, json.dumps(self.summary(), indent=4, sort_keys=True))
+
+    def write_prometheus(self, path, prefix=PROMETHEUS_PREFIX):
+        """Write the summary to a file in the Prometheus text format (for the
+        node exporter textfile collector)"""
+
+        summary = self.summary()
+        lines = []
+
+        for metric, field, help_text in [('stage_seconds_total', 'time', 'Wall time of the stage'),
+                                         ('stage_calls_total', 'calls', 'Runs of the stage'),
+                                         ('stage_items_total', 'items', 'Items processed in the stage'),
+                                         ('stage_bytes_total', 'bytes', 'Bytes processed in the stage')]:
+            lines.append('# HELP %s_%s %s' % (prefix, metric, help_text))
+            lines.append('# TYPE %s_%s counter' % (prefix, metric))
+            for stage, stats in sorted(summary['stages'].items()):
+                lines.append('%s_%s{stage="%s"} %s' % (prefix, metric, stage, stats[field]))
+
+        metric = prefix + '_latency_seconds'
+        lines.append('# HELP %s Latency of the calls to external services' % metric)
+        lines.append('# TYPE %s histogram' % metric)
+        for call, histogram in sorted(summary['latencies'].items()):
+            for bound, count in histogram['buckets']:
+                lines.append('%s_bucket{call="%s",le="%s"} %i' % (metric, call, bound, count))
+            lines.append('%s_sum{call="%s"} %s' % (metric, call, histogram['sum']))
+            lines.append('%s_count{call="%s"} %i' % (metric, call, histogram['count']))
+
+        self.__write(path, "\n".join(lines) + "\n")
+
+    @staticmethod
+    def __write(path, data):
+        # Collectors must not read a partial file
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as fd:
+            fd.write(data)
+        os.replace(tmp_path, path)
+        logger.info("Metrics written to %s", path)
+
+
+# Metrics of the current process
+metrics = Metrics()
+
+
+def timed(stage, latency=None):
+    """Decorator timing each call of a function as a run of stage"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with metrics.timer(stage, latency):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+"""Profiling of the stages of a run (feed, identities, enrich and studies)"""
+
+import cProfile
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+
+from collections import Counter
+from contextlib import contextmanager
+
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ['cpu', 'sample', 'memory']
+PROFILE_ENV = 'GRIMOIRE_ELK_PROFILE'
+PROFILE_DIR_ENV = 'GRIMOIRE_ELK_PROFILE_DIR'
+PROFILE_DIR = 'gelk-profile'
+
+SAMPLE_INTERVAL = 0.005  # seconds between samples in sample mode
+MEMORY_FRAMES = 10  # frames stored by tracemalloc for each allocation
+MEMORY_TOP = 25  # allocation sites written for each stage
+MEMORY_INTERVAL = 0.5  # seconds between checks of the traced memory
+MEMORY_GROWTH = 1.1  # growth of the traced memory to take a new snapshot
+
+
+class Sampler(threading.Thread):
+    """Thread sampling the stack of other thread every `interval` seconds.
+
+    The stacks are counted in the collapsed format ("frame;frame;frame N")
+    used by flamegraph.pl, speedscope and similar tools.
+    """
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame:
+                code = frame.f_code
+                stack.append("%s (%s:%i)" % (code.co_name, os.path.basename(code.co_filename), frame.f_lineno))
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    def collapsed(self):
+        return "".join("%s %i\n" % (stack, count) for stack, count in self.stacks.most_common())
+
+
+class MemoryWatcher(threading.Thread):
+    """Thread taking a tracemalloc snapshot each time the traced memory
+    grows over the last one by `growth`, so the snapshot of the peak shows
+    the allocations (e.g. large lists of items) freed before the end"""
+
+    def __init__(self, interval=MEMORY_INTERVAL, growth=MEMORY_GROWTH):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.growth = growth
+        self.peak = 0
+        self.snapshot = None
+        self.snapshot_size = 0
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.check()
+
+    def check(self):
+        current = tracemalloc.get_traced_memory()[0]
+        if current > self.peak:
+            if not self.snapshot or current > self.snapshot_size * self.growth:
+                self.snapshot = tracemalloc.take_snapshot()
+                self.snapshot_size = current
+            self.peak = current
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+        self.check()
+
+
+class Profiler:
+    """Profile the stages of a run, writing a file per stage in `directory`.
+
+    Modes:
+      - cpu: deterministic profile with cProfile, in `<stage>.pstats`
+      - sample: sampled stacks in `<stage>.folded`, for flame graphs
+      - memory: top allocation sites (tracemalloc) in `<stage>.txt`
+
+    Without a mode, stages run without any overhead. cpu and sample modes
+    profile only the thread running the stage, so concurrent stages (batch
+    jobs, studies) get their own profile. tracemalloc traces all the threads,
+    so memory stages running at the same time include each other allocations.
+    """
+
+    def __init__(self, mode=None, directory=PROFILE_DIR):
+        self._lock = threading.Lock()
+        self.configure(mode, directory)
+
+    def configure(self, mode=None, directory=PROFILE_DIR):
+        if mode and mode not in PROFILE_MODES:
+            raise ValueError("Unknown profile mode %s (%s)" % (mode, ", ".join(PROFILE_MODES)))
+
+        self.mode = mode
+        self.directory = directory
+        self._files = set()
+        self._memory_stages = 0
+
+    @contextmanager
+    def stage(self, stage, name=None):
+        """Profile the block as a run of stage (for data source `name`)"""
+
+        if not self.mode:
+            yield
+            return
+
+        path = self.__get_path(stage if not name else "%s_%s" % (stage, name))
+        if self.mode == 'cpu':
+            profile = self.__cpu(path)
+        elif self.mode == 'sample':
+            profile = self.__sample(path)
+        else:
+            profile = self.__memory(path)
+
+        with profile:
+            yield
+
+    @contextmanager
+    def __cpu(self, path):
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError as ex:
+            # Python >= 3.12 doesn't support several profilers at the same time
+            logger.warning("Stage not profiled (%s): %s", path, ex)
+            yield
+            return
+
+        try:
+            yield
+        finally:
+            profile.disable()
+            profile.dump_stats(path + '.pstats')
+            logger.info("CPU profile written to %s.pstats", path)
+
+    @contextmanager
+    def __sample(self, path):
+        sampler = Sampler(threading.get_ident())
+        sampler.start()
+        try:
+            yield
+        finally:
+            sampler.stop()
+            with open(path + '.folded', 'w') as fd:
+                fd.write(sampler.collapsed())
+            logger.info("Sampled stacks written to %s.folded", path)
+
+    @contextmanager
+    def __memory(self, path):
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(MEMORY_FRAMES)
+            self._memory_stages += 1
+            before = tracemalloc.take_snapshot()
+
+        watcher = MemoryWatcher()
+        watcher.start()
+        start = time.time()
+        try:
+            yield
+        finally:
+            watcher.stop()
+            with self._lock:
+                self._memory_stages -= 1
+                if not self._memory_stages:
+                    tracemalloc.stop()
+
+            stats = watcher.snapshot.compare_to(before, 'traceback') if watcher.snapshot else []
+            self.__write_memory(path, stats, watcher.peak, time.time() - start)
+
+    @staticmethod
+    def __write_memory(path, stats, peak, seconds):
+        mb = 1024 * 1024
+        lines = ["Peak traced memory: %.2f MB in %.2f s" % (peak / mb, seconds),
+                 "Allocations alive at the peak since the start of the stage:", ""]
+        for n, stat in enumerate(stats[:MEMORY_TOP], 1):
+            lines.append("#%i: %+.2f MB (%+i blocks)" % (n, stat.size_diff / mb, stat.count_diff))
+            lines.extend(stat.traceback.format())
+            lines.append("")
+
+        with open(path + '.txt', 'w') as fd:
+            fd.write("\n".join(lines))
+
+        logger.info("Memory profile written to %s.txt (peak %.2f MB)", path, peak / mb)
+        for stat in stats[:5]:
+            frame = stat.traceback[-1]  # where the memory was allocated
+            logger.info("  %+.2f MB at %s:%i", stat.size_diff / mb, frame.filename, frame.lineno)
+
+    def __get_path(self, name):
+        name = re.sub(r'[^\w.-]+', '_', name)
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            # Stages run several times (e.g. batch jobs) don't overwrite their profiles
+            path = os.path.join(self.directory, name)
+            n = 1
+            while path in self._files:
+                n += 1
+                path = os.path.join(self.directory, "%s-%i" % (name, n))
+            self._files.add(path)
+        return path
+
+
+# Profiler of the current process, disabled until configured
+profiler = Profiler()
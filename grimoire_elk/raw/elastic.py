@@ -28,11 +28,16 @@
 
 import inspect
 import logging
+import queue
+import threading
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from ..enriched.utils import unixtime_to_datetime, get_repository_filter
 from ..elastic_items import ElasticItems
 from ..elastic_mapping import Mapping
+from ..errors import ELKError
+from ..metrics import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -41,6 +46,10 @@ class ElasticOcean(ElasticItems):
 
     mapping = Mapping
 
+    # Threads serializing packs of items while items are fetched (packs are
+    # uploaded in order by another thread), 0 to upload them in the fetching thread
+    feed_workers = 0
+
     @classmethod
     def add_params(cls, cmdline_parser):
         """ Shared params in all backends """
@@ -60,6 +69,7 @@ class ElasticOcean(ElasticItems):
 
         self.fetch_archive = fetch_archive  # fetch from archive
         self.project = project  # project to be used for this data source
+        self.raw_store = None  # local RawStore to keep a copy of the items
 
     def set_elastic_url(self, url):
         """ Elastic URL """
@@ -69,6 +79,10 @@ class ElasticOcean(ElasticItems):
         """ Elastic used to store last data source state """
         self.elastic = elastic
 
+    def set_raw_store(self, raw_store):
+        """ RawStore where the items fed are also appended """
+        self.raw_store = raw_store
+
     def get_field_date(self):
         """ Field with the update in the JSON items. Now the same in all. """
         return "metadata__updated_on"
@@ -94,11 +108,6 @@ class ElasticOcean(ElasticItems):
 
         return last_update
 
-    def get_connector_name(self):
-        """ Find the name for the current connector """
-        from ..utils import get_connector_name
-        return get_connector_name(type(self))
-
     @classmethod
     def get_p2o_params_from_url(cls, url):
         """ Get the p2o params given a URL for the data source """
@@ -203,40 +212,138 @@ class ElasticOcean(ElasticItems):
 
         self.feed_items(items)
 
-    def feed_items(self, items):
+    def feed_items(self, items, strict=False):
+        """ Feed the items to the raw index. With strict, an ELKError is
+        raised if ES does not store all of them, so they can be fed again """
+
         task_init = datetime.now()
 
+        try:
+            if self.feed_workers > 0:
+                added, drop = self.__feed_items_threaded(items, strict)
+            else:
+                added, drop = self.__feed_items(items, strict)
+        finally:
+            if self.raw_store:
+                self.raw_store.flush()
+
+        total_time = (datetime.now() - task_init).total_seconds()
+        total_time_min = total_time / 60
+        metrics.add('feed', total_time, added)
+
+        logger.debug("Added %i items to ocean", added)
+        logger.debug("Dropped %i items using drop_item filter" % (drop))
+        logger.info("Finished in %.2f min" % (total_time_min))
+
+        return self
+
+    def __prepare_item(self, item):
+        """Prepare item to be stored, returning False if it must be dropped"""
+
+        # print("%s %s" % (item['url'], item['lastUpdated_date']))
+        # Add date field for incremental analysis if needed
+        self.add_update_date(item)
+        self._fix_item(item)
+        if self.project:
+            item['project'] = self.project
+
+        if self.drop_item(item):
+            return False
+
+        if self.raw_store:
+            self.raw_store.append(item)
+
+        return True
+
+    def __feed_items(self, items, strict=False):
         items_pack = []  # to feed item in packs
         drop = 0
         added = 0
 
         for item in items:
-            # print("%s %s" % (item['url'], item['lastUpdated_date']))
-            # Add date field for incremental analysis if needed
-            self.add_update_date(item)
-            self._fix_item(item)
-            if self.project:
-                item['project'] = self.project
             if len(items_pack) >= self.elastic.max_items_bulk:
-                self._items_to_es(items_pack)
+                self._items_to_es(items_pack, strict=strict)
                 items_pack = []
-            if not self.drop_item(item):
+            if self.__prepare_item(item):
                 items_pack.append(item)
                 added += 1
             else:
                 drop += 1
-        self._items_to_es(items_pack)
-
-        total_time_min = (datetime.now() - task_init).total_seconds() / 60
-
-        logger.debug("Added %i items to ocean", added)
-        logger.debug("Dropped %i items using drop_item filter" % (drop))
-        logger.info("Finished in %.2f min" % (total_time_min))
-
-        return self
+        self._items_to_es(items_pack, strict=strict)
+
+        return added, drop
+
+    def __feed_items_threaded(self, items, strict=False):
+        """Feed items serializing the packs in feed_workers threads.
+
+        Items are fetched and prepared in this thread while the packs
+        already completed are serialized and uploaded. A single thread
+        uploads the packs in the order they were fetched, so the items
+        in ES after a crash are always the first ones and an incremental
+        run (from the latest date in the index) doesn't skip any of them.
+        At most two packs per worker are waiting to be uploaded, so
+        fetching is paused when ES is slower. Errors uploading stop the
+        fetching; errors fetching are raised once the pending packs are
+        uploaded.
+        """
+        field_id = self.get_field_unique_id()
+        pool = ThreadPoolExecutor(max_workers=self.feed_workers)
+        packs = queue.Queue(maxsize=2 * self.feed_workers)
+        errors = []
+
+        def upload_packs():
+            while True:
+                pack = packs.get()
+                if pack is None:
+                    break
+                if errors:
+                    # Discard the pending packs, the feed is stopping
+                    continue
+                items_pack, bulk_json = pack
+                try:
+                    self._items_to_es(items_pack, bulk_json.result(), strict)
+                except Exception as ex:
+                    logger.error("Error adding items to Ocean for %s: %s", self, ex)
+                    errors.append(ex)
+
+        uploader = threading.Thread(target=upload_packs, name="feed-uploader", daemon=True)
+        uploader.start()
+
+        def put_pack(items_pack):
+            packs.put((items_pack, pool.submit(self.elastic.bulk_body, items_pack, field_id)))
+
+        items_pack = []
+        drop = 0
+        added = 0
 
-    def _items_to_es(self, json_items):
-        """ Append items JSON to ES (data source state) """
+        try:
+            for item in items:
+                if errors:
+                    break
+                if len(items_pack) >= self.elastic.max_items_bulk:
+                    put_pack(items_pack)
+                    items_pack = []
+                if self.__prepare_item(item):
+                    items_pack.append(item)
+                    added += 1
+                else:
+                    drop += 1
+            if items_pack and not errors:
+                put_pack(items_pack)
+        finally:
+            packs.put(None)
+            uploader.join()
+            pool.shutdown()
+
+        if errors:
+            raise errors[0]
+
+        return added, drop
+
+    def _items_to_es(self, json_items, bulk_json=None, strict=False):
+        """ Append items JSON to ES (data source state). bulk_json is the
+        body of the bulk request for the items, if already built. With
+        strict, an ELKError is raised if any item is not stored """
 
         if len(json_items) == 0:
             return
@@ -246,7 +353,10 @@ class ElasticOcean(ElasticItems):
 
         field_id = self.get_field_unique_id()
 
-        inserted = self.elastic.bulk_upload(json_items, field_id)
+        if bulk_json is None:
+            inserted = self.elastic.bulk_upload(json_items, field_id)
+        else:
+            inserted = self.elastic.bulk_upload_body(bulk_json)
 
         if len(json_items) != inserted:
             missing = len(json_items) - inserted
@@ -256,6 +366,10 @@ class ElasticOcean(ElasticItems):
             version = info['backend_version']
             origin = info['origin']
 
+            if strict:
+                raise ELKError(cause="%i/%i JSON items not stored for backend %s [ver. %s], origin %s"
+                               % (missing, len(json_items), name, version, origin))
+
             logger.warning("%s/%s missing JSON items for backend %s [ver. %s], origin %s",
                            str(missing),
                            str(len(json_items)),
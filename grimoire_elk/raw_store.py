@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+"""Local store of raw items, to enrich them again without reading the raw index"""
+
+import gzip
+import json
+import logging
+import mmap
+import os
+import shutil
+import threading
+
+from datetime import datetime
+from urllib.parse import quote, unquote
+
+from grimoirelab.toolkit.datetime import datetime_to_utc, str_to_datetime
+
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = '.ndjson.gz'
+UUIDS_SUFFIX = '.uuids'
+STORE_DATE_FIELD = 'metadata__timestamp'
+
+
+class RawStore:
+    """Store of raw items in compressed NDJSON files.
+
+    Items are partitioned by origin and month of retrieval
+    (metadata__timestamp) in `path/<origin>/<YYYY-MM>/`. Each partition
+    has several segments with up to `segment_items` items. Segments are
+    never modified once written: new items go to new segments, named
+    after the time they are created so they are read in the same order.
+    The uuids of the items of each segment are also written in a plain
+    text file next to it, to find the items stored again without reading
+    the segments twice. Access is thread safe.
+
+    :param path: directory of the store
+    :param segment_items: max number of items per segment
+    :param compresslevel: gzip compression level of the segments
+    """
+
+    def __init__(self, path, segment_items=10000, compresslevel=6):
+        self.path = path
+        self.segment_items = segment_items
+        self.compresslevel = compresslevel
+
+        self._buffers = {}  # (origin, month) -> items not written yet
+        self._segments = 0
+        self._run_id = "%s-%07i" % (datetime.utcnow().strftime('%Y%m%dT%H%M%S%f'), os.getpid())
+        self._lock = threading.Lock()
+
+    def append(self, item):
+        """Add a raw item to the store"""
+
+        origin = item.get('origin', '')
+        month = item[STORE_DATE_FIELD][:7]
+        line = json.dumps(item)
+
+        with self._lock:
+            buffer = self._buffers.setdefault((origin, month), [])
+            buffer.append((item['uuid'], line))
+            if len(buffer) >= self.segment_items:
+                self.__write_segment(origin, month, buffer)
+                self._buffers[(origin, month)] = []
+
+    def flush(self):
+        """Write the items pending in new segments"""
+
+        with self._lock:
+            for (origin, month), buffer in self._buffers.items():
+                if buffer:
+                    self.__write_segment(origin, month, buffer)
+            self._buffers = {}
+
+    def origins(self):
+        """Return the origins with items in the store"""
+
+        if not os.path.isdir(self.path):
+            return []
+
+        return [unquote(origin_dir) for origin_dir in sorted(os.listdir(self.path))]
+
+    def clear(self, origin=None):
+        """Remove the items of an origin, or all of them"""
+
+        origins = [origin] if origin else self.origins()
+
+        with self._lock:
+            self._buffers = {key: buffer for key, buffer in self._buffers.items()
+                             if origin and key[0] != origin}
+            for origin in origins:
+                origin_path = os.path.join(self.path, quote(origin, safe=''))
+                if os.path.isdir(origin_path):
+                    shutil.rmtree(origin_path)
+                    logger.info("Removed items of %s from raw store %s", origin, self.path)
+
+    def read(self, origin=None, from_date=None, date_field=STORE_DATE_FIELD):
+        """Read the items of an origin, or all of them, in the order they were stored.
+
+        Items fed several times (e.g. fetched again in incremental runs)
+        are read once, in the position of their last version.
+
+        :param origin: origin of the items, None for all the origins
+        :param from_date: only items with `date_field` since this date are read
+        :param date_field: date of the items compared with from_date
+        """
+        origins = [origin] if origin else self.origins()
+
+        from_month = None
+        if from_date:
+            from_date = datetime_to_utc(from_date)
+            # Partitions are skipped only when filtering by the retrieval date
+            if date_field == STORE_DATE_FIELD:
+                from_month = from_date.strftime('%Y-%m')
+
+        for origin in origins:
+            origin_path = os.path.join(self.path, quote(origin, safe=''))
+            if not os.path.isdir(origin_path):
+                logger.debug("No items in raw store %s for %s", self.path, origin)
+                continue
+
+            segments = []
+            for month in sorted(os.listdir(origin_path)):
+                if from_month and month < from_month:
+                    continue
+                month_path = os.path.join(origin_path, month)
+                segments.extend(os.path.join(month_path, name)
+                                for name in sorted(os.listdir(month_path)) if name.endswith(SEGMENT_SUFFIX))
+
+            superseded = self.__superseded(segments)
+            for segment, old_lines in zip(segments, superseded):
+                for nline, item in enumerate(self.__read_segment(segment)):
+                    if nline in old_lines:
+                        continue
+                    if from_date:
+                        date = item.get(date_field)
+                        if not date or str_to_datetime(date) < from_date:
+                            continue
+                    yield item
+
+    def __superseded(self, segments):
+        """Lines of each segment with items stored again in a later line"""
+
+        seen = set()
+        superseded = []
+        for segment in reversed(segments):
+            old_lines = set()
+            uuids = self.__read_uuids(segment)
+            for nline in range(len(uuids) - 1, -1, -1):
+                if uuids[nline] in seen:
+                    old_lines.add(nline)
+                else:
+                    seen.add(uuids[nline])
+            superseded.append(old_lines)
+        superseded.reverse()
+
+        return superseded
+
+    def __read_uuids(self, segment_path):
+        uuids_path = segment_path[:-len(SEGMENT_SUFFIX)] + UUIDS_SUFFIX
+        if os.path.exists(uuids_path):
+            with open(uuids_path, 'r') as f:
+                return f.read().split()
+
+        # Segments written before the uuids files
+        return [item['uuid'] for item in self.__read_segment(segment_path)]
+
+    def __write_segment(self, origin, month, lines):
+        partition_path = os.path.join(self.path, quote(origin, safe=''), month)
+        os.makedirs(partition_path, exist_ok=True)
+
+        self._segments += 1
+        name = "%s-%06i%s" % (self._run_id, self._segments, SEGMENT_SUFFIX)
+        segment_path = os.path.join(partition_path, name)
+
+        # The uuids are written first, segments being written are not read
+        uuids_path = segment_path[:-len(SEGMENT_SUFFIX)] + UUIDS_SUFFIX
+        with open(uuids_path, 'w') as f:
+            f.write("\n".join(uuid for uuid, _ in lines))
+            f.write("\n")
+
+        tmp_path = os.path.join(partition_path, "." + name + ".tmp")
+        with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=self.compresslevel) as f:
+            f.write("\n".join(line for _, line in lines))
+            f.write("\n")
+        os.rename(tmp_path, segment_path)
+
+        logger.debug("Written %i items to raw store segment %s", len(lines), segment_path)
+
+    @staticmethod
+    def __read_segment(segment_path):
+        with open(segment_path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                with gzip.GzipFile(fileobj=data, mode='rb') as segment:
+                    for line in segment:
+                        # json.loads accepts bytes only since Python 3.6
+                        yield json.loads(line.decode('utf-8'))
+
+
+class ReplayOceanBackend:
+    """ Ocean backend which reads the raw items from a local raw store.
+
+    The items of the origin of the wrapped ocean backend are read from the
+    store instead of the raw index, honoring its from_date (compared with
+    its incremental date field), offset and filter_raw, as when they are
+    read from the raw index. The rest of the attributes are taken from the
+    wrapped ocean backend.
+
+    :param ocean_backend: ocean backend to replay the raw items of
+    :param store: RawStore with the raw items
+    """
+
+    def __init__(self, ocean_backend, store):
+        self.ocean_backend = ocean_backend
+        self.store = store
+
+    def __getattr__(self, name):
+        return getattr(self.ocean_backend, name)
+
+    def fetch(self, *args, **kwargs):
+        """ Fetch the raw items from the store """
+
+        perceval_backend = self.ocean_backend.perceval_backend
+        origin = perceval_backend.origin if perceval_backend else None
+        from_date = self.ocean_backend.from_date
+        # As in the raw index, the offset is used only without from_date
+        offset = self.ocean_backend.offset if not from_date else None
+        filter_raw = self.ocean_backend.filter_raw
+
+        logger.info("Replaying raw items of %s from %s", origin if origin else "all origins", self.store.path)
+
+        items = self.store.read(origin, from_date, date_field=self.ocean_backend.get_incremental_date())
+        for item in items:
+            if offset and item.get('offset', 0) < offset:
+                continue
+            if filter_raw and self.__get_field(item, filter_raw['name']) != filter_raw['value']:
+                continue
+            yield item
+
+    @staticmethod
+    def __get_field(item, name):
+        value = item
+        for field in name.split('.'):
+            if not isinstance(value, dict):
+                return None
+            value = value.get(field)
+        return value
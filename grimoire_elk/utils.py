@@ -24,203 +24,290 @@
 #
 
 import argparse
+import importlib
 import logging
+import os
 import sys
 
+from collections.abc import Mapping
+
 import requests
 from dateutil import parser
 
 from grimoire_elk.elastic import ElasticConnectException
 from grimoire_elk.elastic import ElasticSearch
-# Connectors for Perceval
-from grimoire_elk.raw.hyperkitty import HyperKittyOcean
-from perceval.backends.core.askbot import Askbot, AskbotCommand
-from perceval.backends.core.bugzilla import Bugzilla, BugzillaCommand
-from perceval.backends.core.bugzillarest import BugzillaREST, BugzillaRESTCommand
-from perceval.backends.core.confluence import Confluence, ConfluenceCommand
-from perceval.backends.core.discourse import Discourse, DiscourseCommand
-from perceval.backends.core.dockerhub import DockerHub, DockerHubCommand
-from perceval.backends.core.gerrit import Gerrit, GerritCommand
-from perceval.backends.core.git import Git, GitCommand
-from perceval.backends.core.github import GitHub, GitHubCommand
-from perceval.backends.core.gitlab import GitLab, GitLabCommand
-from perceval.backends.core.hyperkitty import HyperKitty, HyperKittyCommand
-from perceval.backends.core.jenkins import Jenkins, JenkinsCommand
-from perceval.backends.core.jira import Jira, JiraCommand
-from perceval.backends.core.mbox import MBox, MBoxCommand
-from perceval.backends.core.mediawiki import MediaWiki, MediaWikiCommand
-from perceval.backends.core.meetup import Meetup, MeetupCommand
-from perceval.backends.core.nntp import NNTP, NNTPCommand
-from perceval.backends.core.phabricator import Phabricator, PhabricatorCommand
-from perceval.backends.core.pipermail import Pipermail, PipermailCommand
-from perceval.backends.puppet.puppetforge import PuppetForge, PuppetForgeCommand
-from perceval.backends.core.redmine import Redmine, RedmineCommand
-from perceval.backends.core.rss import RSS, RSSCommand
-from perceval.backends.core.slack import Slack, SlackCommand
-from perceval.backends.core.stackexchange import StackExchange, StackExchangeCommand
-from perceval.backends.core.supybot import Supybot, SupybotCommand
-from perceval.backends.core.telegram import Telegram, TelegramCommand
-from perceval.backends.mozilla.crates import Crates, CratesCommand
-from perceval.backends.mozilla.kitsune import Kitsune, KitsuneCommand
-from perceval.backends.mozilla.mozillaclub import MozillaClub, MozillaClubCommand
-from perceval.backends.mozilla.remo import ReMo, ReMoCommand
-from perceval.backends.opnfv.functest import Functest, FunctestCommand
-# Connectors for EnrichOcean
-from .enriched.askbot import AskbotEnrich
-from .enriched.bugzilla import BugzillaEnrich
-from .enriched.bugzillarest import BugzillaRESTEnrich
-from .enriched.confluence import ConfluenceEnrich
-from .enriched.crates import CratesEnrich
-from .enriched.discourse import DiscourseEnrich
-from .enriched.dockerhub import DockerHubEnrich
-from .enriched.functest import FunctestEnrich
-from .enriched.gerrit import GerritEnrich
-from .enriched.git import GitEnrich
-from .enriched.github import GitHubEnrich
-from .enriched.gitlab import GitLabEnrich
-from .enriched.hyperkitty import HyperKittyEnrich
-from .enriched.jenkins import JenkinsEnrich
-from .enriched.jira import JiraEnrich
-from .enriched.kitsune import KitsuneEnrich
-from .enriched.mbox import MBoxEnrich
-from .enriched.mediawiki import MediaWikiEnrich
-from .enriched.meetup import MeetupEnrich
-from .enriched.mozillaclub import MozillaClubEnrich
-from .enriched.nntp import NNTPEnrich
-from .enriched.phabricator import PhabricatorEnrich
-from .enriched.pipermail import PipermailEnrich
-from .enriched.puppetforge import PuppetForgeEnrich
-from .enriched.redmine import RedmineEnrich
-from .enriched.remo import ReMoEnrich
-from .enriched.rss import RSSEnrich
-from .enriched.slack import SlackEnrich
-from .enriched.stackexchange import StackExchangeEnrich
-from .enriched.supybot import SupybotEnrich
-from .enriched.telegram import TelegramEnrich
-from .enriched.twitter import TwitterEnrich
-# Connectors for Ocean
-from .raw.askbot import AskbotOcean
-from .raw.bugzilla import BugzillaOcean
-from .raw.bugzillarest import BugzillaRESTOcean
-from .raw.confluence import ConfluenceOcean
-from .raw.crates import CratesOcean
-from .raw.discourse import DiscourseOcean
-from .raw.dockerhub import DockerHubOcean
+from .profiling import PROFILE_DIR, PROFILE_DIR_ENV, PROFILE_ENV, PROFILE_MODES
 from .raw.elastic import ElasticOcean
-from .raw.functest import FunctestOcean
-from .raw.gerrit import GerritOcean
-from .raw.git import GitOcean
-from .raw.github import GitHubOcean
-from .raw.gitlab import GitLabOcean
-from .raw.jenkins import JenkinsOcean
-from .raw.jira import JiraOcean
-from .raw.kitsune import KitsuneOcean
-from .raw.mbox import MBoxOcean
-from .raw.mediawiki import MediaWikiOcean
-from .raw.meetup import MeetupOcean
-from .raw.mozillaclub import MozillaClubOcean
-from .raw.nntp import NNTPOcean
-from .raw.phabricator import PhabricatorOcean
-from .raw.pipermail import PipermailOcean
-from .raw.puppetforge import PuppetForgeOcean
-from .raw.redmine import RedmineOcean
-from .raw.remo import ReMoOcean
-from .raw.rss import RSSOcean
-from .raw.slack import SlackOcean
-from .raw.stackexchange import StackExchangeOcean
-from .raw.supybot import SupybotOcean
-from .raw.telegram import TelegramOcean
-from .raw.twitter import TwitterOcean
 
 logger = logging.getLogger(__name__)
 
 kibiter_version = None
 
 
+# Entry point group where other packages register their connectors. Each
+# entry point is named as the data source and loads a list like the ones in
+# CONNECTORS, with classes or "module:class" paths
+CONNECTORS_ENTRY_POINT = 'grimoire_elk.connectors'
+
+# Connectors for Perceval, Ocean and EnrichOcean: perceval backend, ocean,
+# enrich and perceval command. Modules are imported the first time used.
+CONNECTORS = {
+    "askbot": ["perceval.backends.core.askbot:Askbot",
+               "grimoire_elk.raw.askbot:AskbotOcean",
+               "grimoire_elk.enriched.askbot:AskbotEnrich",
+               "perceval.backends.core.askbot:AskbotCommand"],
+    "bugzilla": ["perceval.backends.core.bugzilla:Bugzilla",
+                 "grimoire_elk.raw.bugzilla:BugzillaOcean",
+                 "grimoire_elk.enriched.bugzilla:BugzillaEnrich",
+                 "perceval.backends.core.bugzilla:BugzillaCommand"],
+    "bugzillarest": ["perceval.backends.core.bugzillarest:BugzillaREST",
+                     "grimoire_elk.raw.bugzillarest:BugzillaRESTOcean",
+                     "grimoire_elk.enriched.bugzillarest:BugzillaRESTEnrich",
+                     "perceval.backends.core.bugzillarest:BugzillaRESTCommand"],
+    "confluence": ["perceval.backends.core.confluence:Confluence",
+                   "grimoire_elk.raw.confluence:ConfluenceOcean",
+                   "grimoire_elk.enriched.confluence:ConfluenceEnrich",
+                   "perceval.backends.core.confluence:ConfluenceCommand"],
+    "crates": ["perceval.backends.mozilla.crates:Crates",
+               "grimoire_elk.raw.crates:CratesOcean",
+               "grimoire_elk.enriched.crates:CratesEnrich",
+               "perceval.backends.mozilla.crates:CratesCommand"],
+    "discourse": ["perceval.backends.core.discourse:Discourse",
+                  "grimoire_elk.raw.discourse:DiscourseOcean",
+                  "grimoire_elk.enriched.discourse:DiscourseEnrich",
+                  "perceval.backends.core.discourse:DiscourseCommand"],
+    "dockerhub": ["perceval.backends.core.dockerhub:DockerHub",
+                  "grimoire_elk.raw.dockerhub:DockerHubOcean",
+                  "grimoire_elk.enriched.dockerhub:DockerHubEnrich",
+                  "perceval.backends.core.dockerhub:DockerHubCommand"],
+    "functest": ["perceval.backends.opnfv.functest:Functest",
+                 "grimoire_elk.raw.functest:FunctestOcean",
+                 "grimoire_elk.enriched.functest:FunctestEnrich",
+                 "perceval.backends.opnfv.functest:FunctestCommand"],
+    "gerrit": ["perceval.backends.core.gerrit:Gerrit",
+               "grimoire_elk.raw.gerrit:GerritOcean",
+               "grimoire_elk.enriched.gerrit:GerritEnrich",
+               "perceval.backends.core.gerrit:GerritCommand"],
+    "git": ["perceval.backends.core.git:Git",
+            "grimoire_elk.raw.git:GitOcean",
+            "grimoire_elk.enriched.git:GitEnrich",
+            "perceval.backends.core.git:GitCommand"],
+    "github": ["perceval.backends.core.github:GitHub",
+               "grimoire_elk.raw.github:GitHubOcean",
+               "grimoire_elk.enriched.github:GitHubEnrich",
+               "perceval.backends.core.github:GitHubCommand"],
+    "gitlab": ["perceval.backends.core.gitlab:GitLab",
+               "grimoire_elk.raw.gitlab:GitLabOcean",
+               "grimoire_elk.enriched.gitlab:GitLabEnrich",
+               "perceval.backends.core.gitlab:GitLabCommand"],
+    "hyperkitty": ["perceval.backends.core.hyperkitty:HyperKitty",
+                   "grimoire_elk.raw.hyperkitty:HyperKittyOcean",
+                   "grimoire_elk.enriched.hyperkitty:HyperKittyEnrich",
+                   "perceval.backends.core.hyperkitty:HyperKittyCommand"],
+    "jenkins": ["perceval.backends.core.jenkins:Jenkins",
+                "grimoire_elk.raw.jenkins:JenkinsOcean",
+                "grimoire_elk.enriched.jenkins:JenkinsEnrich",
+                "perceval.backends.core.jenkins:JenkinsCommand"],
+    "jira": ["perceval.backends.core.jira:Jira",
+             "grimoire_elk.raw.jira:JiraOcean",
+             "grimoire_elk.enriched.jira:JiraEnrich",
+             "perceval.backends.core.jira:JiraCommand"],
+    "kitsune": ["perceval.backends.mozilla.kitsune:Kitsune",
+                "grimoire_elk.raw.kitsune:KitsuneOcean",
+                "grimoire_elk.enriched.kitsune:KitsuneEnrich",
+                "perceval.backends.mozilla.kitsune:KitsuneCommand"],
+    "mbox": ["perceval.backends.core.mbox:MBox",
+             "grimoire_elk.raw.mbox:MBoxOcean",
+             "grimoire_elk.enriched.mbox:MBoxEnrich",
+             "perceval.backends.core.mbox:MBoxCommand"],
+    "mediawiki": ["perceval.backends.core.mediawiki:MediaWiki",
+                  "grimoire_elk.raw.mediawiki:MediaWikiOcean",
+                  "grimoire_elk.enriched.mediawiki:MediaWikiEnrich",
+                  "perceval.backends.core.mediawiki:MediaWikiCommand"],
+    "meetup": ["perceval.backends.core.meetup:Meetup",
+               "grimoire_elk.raw.meetup:MeetupOcean",
+               "grimoire_elk.enriched.meetup:MeetupEnrich",
+               "perceval.backends.core.meetup:MeetupCommand"],
+    "mozillaclub": ["perceval.backends.mozilla.mozillaclub:MozillaClub",
+                    "grimoire_elk.raw.mozillaclub:MozillaClubOcean",
+                    "grimoire_elk.enriched.mozillaclub:MozillaClubEnrich",
+                    "perceval.backends.mozilla.mozillaclub:MozillaClubCommand"],
+    "nntp": ["perceval.backends.core.nntp:NNTP",
+             "grimoire_elk.raw.nntp:NNTPOcean",
+             "grimoire_elk.enriched.nntp:NNTPEnrich",
+             "perceval.backends.core.nntp:NNTPCommand"],
+    "phabricator": ["perceval.backends.core.phabricator:Phabricator",
+                    "grimoire_elk.raw.phabricator:PhabricatorOcean",
+                    "grimoire_elk.enriched.phabricator:PhabricatorEnrich",
+                    "perceval.backends.core.phabricator:PhabricatorCommand"],
+    "pipermail": ["perceval.backends.core.pipermail:Pipermail",
+                  "grimoire_elk.raw.pipermail:PipermailOcean",
+                  "grimoire_elk.enriched.pipermail:PipermailEnrich",
+                  "perceval.backends.core.pipermail:PipermailCommand"],
+    "puppetforge": ["perceval.backends.puppet.puppetforge:PuppetForge",
+                    "grimoire_elk.raw.puppetforge:PuppetForgeOcean",
+                    "grimoire_elk.enriched.puppetforge:PuppetForgeEnrich",
+                    "perceval.backends.puppet.puppetforge:PuppetForgeCommand"],
+    "redmine": ["perceval.backends.core.redmine:Redmine",
+                "grimoire_elk.raw.redmine:RedmineOcean",
+                "grimoire_elk.enriched.redmine:RedmineEnrich",
+                "perceval.backends.core.redmine:RedmineCommand"],
+    "remo": ["perceval.backends.mozilla.remo:ReMo",
+             "grimoire_elk.raw.remo:ReMoOcean",
+             "grimoire_elk.enriched.remo:ReMoEnrich",
+             "perceval.backends.mozilla.remo:ReMoCommand"],
+    "rss": ["perceval.backends.core.rss:RSS",
+            "grimoire_elk.raw.rss:RSSOcean",
+            "grimoire_elk.enriched.rss:RSSEnrich",
+            "perceval.backends.core.rss:RSSCommand"],
+    "slack": ["perceval.backends.core.slack:Slack",
+              "grimoire_elk.raw.slack:SlackOcean",
+              "grimoire_elk.enriched.slack:SlackEnrich",
+              "perceval.backends.core.slack:SlackCommand"],
+    "stackexchange": ["perceval.backends.core.stackexchange:StackExchange",
+                      "grimoire_elk.raw.stackexchange:StackExchangeOcean",
+                      "grimoire_elk.enriched.stackexchange:StackExchangeEnrich",
+                      "perceval.backends.core.stackexchange:StackExchangeCommand"],
+    "supybot": ["perceval.backends.core.supybot:Supybot",
+                "grimoire_elk.raw.supybot:SupybotOcean",
+                "grimoire_elk.enriched.supybot:SupybotEnrich",
+                "perceval.backends.core.supybot:SupybotCommand"],
+    "telegram": ["perceval.backends.core.telegram:Telegram",
+                 "grimoire_elk.raw.telegram:TelegramOcean",
+                 "grimoire_elk.enriched.telegram:TelegramEnrich",
+                 "perceval.backends.core.telegram:TelegramCommand"],
+    "twitter": [None,
+                "grimoire_elk.raw.twitter:TwitterOcean",
+                "grimoire_elk.enriched.twitter:TwitterEnrich",
+                None],
+}
+
+
+def import_class(path):
+    """Import the class in path ("module:class")"""
+
+    if path is None:
+        return None
+    module_name, cls_name = path.split(':')
+    return getattr(importlib.import_module(module_name), cls_name)
+
+
+def get_class_path(cls):
+    return "%s:%s" % (cls.__module__, cls.__name__)
+
+
+class ConnectorRegistry(Mapping):
+    """Connectors by data source name, imported on first use.
+
+    The connectors of a data source are imported only when it is read,
+    so importing the registry does not import any backend. Connectors
+    registered in the CONNECTORS_ENTRY_POINT entry point group are
+    discovered only when a data source is not in `connectors`.
+
+    The data source of a class is found in maps by class path and by
+    class name, built when the registry is created.
+
+    :param connectors: dict with the paths of the connectors of each data source
+    :param entry_point: entry point group of the external connectors
+    """
+
+    def __init__(self, connectors=CONNECTORS, entry_point=CONNECTORS_ENTRY_POINT):
+        self._paths = dict(connectors)
+        self._entry_point = entry_point
+        self._entry_points = None
+        self._entry_points_loaded = False
+        self._connectors = {}
+        self._names = {'path': {}, 'name': {}}  # class path or name -> data source name
+
+        for name, paths in self._paths.items():
+            self.__index(name, paths)
+
+    def __getitem__(self, name):
+        if name not in self._connectors:
+            if name in self._paths:
+                connector = [import_class(path) for path in self._paths[name]]
+            elif name in self.__get_entry_points():
+                connector = [import_class(con) if isinstance(con, str) else con
+                             for con in self._entry_points[name].load()]
+                self.__index(name, [get_class_path(con) if con else None for con in connector])
+            else:
+                raise KeyError(name)
+            self._connectors[name] = connector
+        return self._connectors[name]
+
+    def __iter__(self):
+        yield from self._paths
+        for name in self.__get_entry_points():
+            if name not in self._paths:
+                yield name
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+    def __contains__(self, name):
+        return name in self._paths or name in self.__get_entry_points()
+
+    def get_name(self, cls, attr='path'):
+        """Data source name of a connector class, without importing other connectors.
+
+        :param cls: the class, or its name if attr is 'name'
+        :param attr: find the class by its path ('path') or by its name ('name')
+        """
+        key = get_class_path(cls) if attr == 'path' else cls
+        names = self._names[attr]
+
+        if key not in names and not self._entry_points_loaded:
+            # External connectors must be imported to know their classes
+            for name in self.__get_entry_points():
+                if name not in self._paths:
+                    self[name]
+            self._entry_points_loaded = True
+
+        return names.get(key)
+
+    def __index(self, name, paths):
+        for path in paths:
+            if not path:
+                continue
+            cls_name = path.split(':')[1]
+            for attr, key in [('path', path), ('name', cls_name)]:
+                # The canonical name is included in the classname
+                if key not in self._names[attr] or name in cls_name.lower():
+                    self._names[attr][key] = name
+
+    def __get_entry_points(self):
+        if self._entry_points is None:
+            # pkg_resources is slow to import, only needed for external connectors
+            import pkg_resources
+
+            self._entry_points = {ep.name: ep for ep in pkg_resources.iter_entry_points(self._entry_point)}
+        return self._entry_points
+
+
+connectors_registry = ConnectorRegistry()
+
+
 def get_connector_from_name(name):
 
     # Remove extra data from data source section: remo:activities
     name = name.split(":")[0]
-    found = None
-    connectors = get_connectors()
-
-    for cname in connectors:
-        if cname == name:
-            found = connectors[cname]
 
-    return found
+    return connectors_registry.get(name)
 
 
 def get_connector_name(cls):
-    found = None
-    connectors = get_connectors()
 
-    for cname in connectors:
-        for con in connectors[cname]:
-            if cls == con:
-                if found:
-                    # The canonical name is included in the classname
-                    if cname in cls.__name__.lower():
-                        found = cname
-                else:
-                    found = cname
-    return found
+    return connectors_registry.get_name(cls)
 
 
 def get_connector_name_from_cls_name(cls_name):
-    found = None
-    connectors = get_connectors()
 
-    for cname in connectors:
-        for con in connectors[cname]:
-            if not con:
-                continue
-            if cls_name == con.__name__:
-                if found:
-                    # The canonical name is included in the classname
-                    if cname in con.__name__.lower():
-                        found = cname
-                else:
-                    found = cname
-    return found
+    return connectors_registry.get_name(cls_name, attr='name')
 
 
 def get_connectors():
 
-    return {"askbot": [Askbot, AskbotOcean, AskbotEnrich, AskbotCommand],
-            "bugzilla": [Bugzilla, BugzillaOcean, BugzillaEnrich, BugzillaCommand],
-            "bugzillarest": [BugzillaREST, BugzillaRESTOcean, BugzillaRESTEnrich, BugzillaRESTCommand],
-            "confluence": [Confluence, ConfluenceOcean, ConfluenceEnrich, ConfluenceCommand],
-            "crates": [Crates, CratesOcean, CratesEnrich, CratesCommand],
-            "discourse": [Discourse, DiscourseOcean, DiscourseEnrich, DiscourseCommand],
-            "dockerhub": [DockerHub, DockerHubOcean, DockerHubEnrich, DockerHubCommand],
-            "functest": [Functest, FunctestOcean, FunctestEnrich, FunctestCommand],
-            "gerrit": [Gerrit, GerritOcean, GerritEnrich, GerritCommand],
-            "git": [Git, GitOcean, GitEnrich, GitCommand],
-            "github": [GitHub, GitHubOcean, GitHubEnrich, GitHubCommand],
-            "gitlab": [GitLab, GitLabOcean, GitLabEnrich, GitLabCommand],
-            "hyperkitty": [HyperKitty, HyperKittyOcean, HyperKittyEnrich, HyperKittyCommand],
-            "jenkins": [Jenkins, JenkinsOcean, JenkinsEnrich, JenkinsCommand],
-            "jira": [Jira, JiraOcean, JiraEnrich, JiraCommand],
-            "kitsune": [Kitsune, KitsuneOcean, KitsuneEnrich, KitsuneCommand],
-            "mbox": [MBox, MBoxOcean, MBoxEnrich, MBoxCommand],
-            "mediawiki": [MediaWiki, MediaWikiOcean, MediaWikiEnrich, MediaWikiCommand],
-            "meetup": [Meetup, MeetupOcean, MeetupEnrich, MeetupCommand],
-            "mozillaclub": [MozillaClub, MozillaClubOcean, MozillaClubEnrich, MozillaClubCommand],
-            "nntp": [NNTP, NNTPOcean, NNTPEnrich, NNTPCommand],
-            "phabricator": [Phabricator, PhabricatorOcean, PhabricatorEnrich, PhabricatorCommand],
-            "pipermail": [Pipermail, PipermailOcean, PipermailEnrich, PipermailCommand],
-            "puppetforge": [PuppetForge, PuppetForgeOcean, PuppetForgeEnrich, PuppetForgeCommand],
-            "redmine": [Redmine, RedmineOcean, RedmineEnrich, RedmineCommand],
-            "remo": [ReMo, ReMoOcean, ReMoEnrich, ReMoCommand],
-            "rss": [RSS, RSSOcean, RSSEnrich, RSSCommand],
-            "slack": [Slack, SlackOcean, SlackEnrich, SlackCommand],
-            "stackexchange": [StackExchange, StackExchangeOcean,
-                              StackExchangeEnrich, StackExchangeCommand],
-            "supybot": [Supybot, SupybotOcean, SupybotEnrich, SupybotCommand],
-            "telegram": [Telegram, TelegramOcean, TelegramEnrich, TelegramCommand],
-            "twitter": [None, TwitterOcean, TwitterEnrich, None]
-            }  # Will come from Registry
+    return connectors_registry
 
 
 def get_elastic(url, es_index, clean=None, backend=None):
@@ -334,20 +421,59 @@ def get_params_parser():
     parser.add_argument('--refresh-projects', action='store_true', help="Refresh projects in enriched items")
     parser.add_argument('--db-sortinghat', help="SortingHat DB")
     parser.add_argument('--only-identities', action='store_true', help="Only add identities to SortingHat DB")
+    parser.add_argument('--fused-identities', action='store_true',
+                        help="Add identities to SortingHat while enriching, reading raw items once")
     parser.add_argument('--refresh-identities', action='store_true', help="Refresh identities in enriched items")
+    parser.add_argument('--refresh-identities-incremental', action='store_true',
+                        help="Refresh identities modified in SortingHat since the last refresh")
     parser.add_argument('--author_id', nargs='*', help="Field author_ids to be refreshed")
     parser.add_argument('--author_uuid', nargs='*', help="Field author_uuids to be refreshed")
-    parser.add_argument('--github-token', help="If provided, github usernames will be retrieved in git enrich.")
+    parser.add_argument('--sh-cache-size', nargs='+',
+                        help="Max items in SortingHat caches. Format: size (all caches) or "
+                             "cache:size (enrollments, unique_identities, uuids, sh_ids, git_users, github_commit_users)")
+    parser.add_argument('--github-token', nargs='+',
+                        help="If provided, github usernames will be retrieved in git enrich. "
+                             "Several tokens can be used.")
+    parser.add_argument('--github-logins-cache',
+                        help="SQLite file to keep the github usernames retrieved in git enrich between runs.")
     parser.add_argument('--jenkins-rename-file', help="CSV mapping file with nodes renamed schema.")
     parser.add_argument('--studies', action='store_true', help="Execute studies after enrichment.")
     parser.add_argument('--only-studies', action='store_true', help="Execute only studies.")
+    parser.add_argument('--studies-workers', default=1, type=int,
+                        help="Number of studies executed concurrently.")
+    parser.add_argument('--ceres-workers', default=1, type=int,
+                        help="Number of threads processing and writing the blocks of the ceres studies "
+                             "(areas of code and onion).")
     parser.add_argument('--bulk-size', default=1000, type=int,
                         help="Number of items per bulk request to Elasticsearch.")
     parser.add_argument('--scroll-size', default=100, type=int,
                         help="Number of items to get from Elasticsearch when scrolling.")
+    parser.add_argument('--feed-workers', default=0, type=int,
+                        help="Number of threads serializing raw items while they are fetched. "
+                             "Packs of items are uploaded to Elasticsearch in order by another thread.")
     parser.add_argument('--arthur', action='store_true', help="Read items from arthur redis queue")
     parser.add_argument('--pair-programming', action='store_true', help="Do pair programming in git enrich")
-    parser.add_argument('backend', help=argparse.SUPPRESS)
+    parser.add_argument('--raw-store',
+                        help="Directory of a local store where the raw items are also saved when fed.")
+    parser.add_argument('--replay-raw-store', action='store_true',
+                        help="Enrich the raw items saved in --raw-store instead of the ones in the raw index.")
+    parser.add_argument('--batch',
+                        help="JSON file with a list of jobs to run in the same process. Each job is a dict with "
+                             "backend, backend_args, index, index_enrich and optionally project.")
+    parser.add_argument('--batch-workers', default=1, type=int,
+                        help="Number of jobs of the batch running at the same time.")
+    parser.add_argument('--metrics-json',
+                        help="JSON file where the time, items and bytes of each stage of the run are written.")
+    parser.add_argument('--metrics-prometheus',
+                        help="File where the metrics of the run are written in Prometheus text format.")
+    parser.add_argument('--profile', choices=PROFILE_MODES, default=os.environ.get(PROFILE_ENV) or None,
+                        help="Profile feed, identities loading, enrich and each study: cpu (cProfile .pstats), "
+                             "sample (sampled stacks .folded for flame graphs) or memory (top allocation "
+                             "sites with tracemalloc). Default from %s." % PROFILE_ENV)
+    parser.add_argument('--profile-dir', default=os.environ.get(PROFILE_DIR_ENV, PROFILE_DIR),
+                        help="Directory where the profile of each stage is written. Default from %s or %s."
+                             % (PROFILE_DIR_ENV, PROFILE_DIR))
+    parser.add_argument('backend', nargs='?', help=argparse.SUPPRESS)
     parser.add_argument('backend_args', nargs=argparse.REMAINDER,
                         help=argparse.SUPPRESS)
 
@@ -364,7 +490,10 @@ def get_params():
     parser = get_params_parser()
     args = parser.parse_args()
 
-    if not args.enrich_only and not args.only_identities and not args.only_studies:
+    if args.replay_raw_store and not args.raw_store:
+        parser.error("--replay-raw-store needs the store path in --raw-store")
+
+    if not args.batch and not args.enrich_only and not args.only_identities and not args.only_studies:
         if not args.index:
             # Check that the raw index name is defined
             print("[error] --index <name> param is required when collecting items from raw")
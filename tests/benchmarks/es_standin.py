@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+"""Stand-in of the Elasticsearch HTTP API used by feed and enrich"""
+
+import fnmatch
+import itertools
+import json
+import multiprocessing
+import re
+import resource
+import threading
+
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qs
+
+
+ES_VERSION = "6.8.0"
+RAW_MARKER = "\x00raw\x00"
+ISO_DATE = re.compile(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}')
+
+
+class Index:
+    """Documents of an index, in insertion order.
+
+    The source of each document is kept serialized, as received, with
+    its top level scalar fields, which are the ones used in the queries
+    of GrimoireELK (origin, tag, dates, uuids).
+    """
+
+    def __init__(self):
+        self.docs = {}  # id -> (source JSON, top level fields)
+        self.meta = {}
+
+    def put(self, _id, source):
+        doc = json.loads(source)
+        self.docs[_id] = (source, self.__fields(doc))
+
+    def update(self, _id, partial):
+        doc = json.loads(self.docs[_id][0]) if _id in self.docs else {}
+        doc.update(partial)
+        self.docs[_id] = (json.dumps(doc), self.__fields(doc))
+
+    @staticmethod
+    def __fields(doc):
+        return {k: v for k, v in doc.items() if not isinstance(v, (dict, list))}
+
+
+def to_epoch_millis(value):
+    date = datetime.strptime(value[:19], "%Y-%m-%dT%H:%M:%S")
+    return date.replace(tzinfo=timezone.utc).timestamp() * 1000
+
+
+def match(query, fields):
+    """Whether the fields of a document match the query (a subset of the DSL)"""
+
+    if not query or 'match_all' in query:
+        return True
+    if 'bool' in query:
+        clauses = query['bool']
+        for name in ['must', 'filter']:
+            must = clauses.get(name, [])
+            must = must if isinstance(must, list) else [must]
+            if not all(match(clause, fields) for clause in must):
+                return False
+        should = clauses.get('should', [])
+        should = should if isinstance(should, list) else [should]
+        if should and not any(match(clause, fields) for clause in should):
+            return False
+        must_not = clauses.get('must_not', [])
+        must_not = must_not if isinstance(must_not, list) else [must_not]
+        return not any(match(clause, fields) for clause in must_not)
+    if 'term' in query:
+        field, value = next(iter(query['term'].items()))
+        value = value['value'] if isinstance(value, dict) else value
+        return fields.get(field) == value
+    if 'terms' in query:
+        field, values = next(iter(query['terms'].items()))
+        return fields.get(field) in values
+    if 'wildcard' in query:
+        field, pattern = next(iter(query['wildcard'].items()))
+        pattern = pattern['value'] if isinstance(pattern, dict) else pattern
+        return isinstance(fields.get(field), str) and fnmatch.fnmatchcase(fields[field], pattern)
+    if 'exists' in query:
+        return fields.get(query['exists']['field']) is not None
+    if 'range' in query:
+        field, bounds = next(iter(query['range'].items()))
+        value = fields.get(field)
+        if value is None:
+            return False
+        checks = {'gte': lambda b: value >= b, 'gt': lambda b: value > b,
+                  'lte': lambda b: value <= b, 'lt': lambda b: value < b}
+        return all(checks[op](bound) for op, bound in bounds.items() if op in checks)
+    raise ValueError("Query not supported by the ES stand-in: %s" % query)
+
+
+def sort_key(sort):
+    """Field and direction of the sort clause of a search"""
+
+    if isinstance(sort, list):
+        sort = sort[0]
+    if isinstance(sort, str):
+        return sort, False
+    field, order = next(iter(sort.items()))
+    order = order.get('order', 'asc') if isinstance(order, dict) else order
+    return field, order == 'desc'
+
+
+class ESStandIn:
+    """HTTP server implementing the part of the Elasticsearch API used by
+    feed_items and enrich_items: index and mappings management, _bulk,
+    scroll searches, max aggregations and _mget.
+
+    It runs in a thread of the current process. Documents are kept in
+    memory.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.indexes = {}
+        self.scrolls = {}
+        self._scroll_ids = itertools.count()
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self.__handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return "http://%s:%i" % (host, port)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def handle(self, method, path, params, body):
+        """Return the status and the JSON response of a request"""
+
+        parts = [part for part in path.split('/') if part]
+
+        if not parts:
+            return 200, {"version": {"number": ES_VERSION}, "tagline": "You know, for search"}
+        if parts[0] == '_search' and parts[1:] == ['scroll']:
+            return self.__scroll(method, body)
+        if parts[-1] == '_bulk':
+            return self.__bulk(parts[0] if len(parts) > 1 else None, body)
+
+        name = parts[0]
+        index = self.indexes.get(name)
+        if len(parts) == 1:
+            return self.__index(method, name, index)
+        if index is None:
+            return 404, {"error": {"type": "index_not_found_exception", "index": name}, "status": 404}
+        if parts[-1] == '_search':
+            return self.__search(index, params, json.loads(body) if body else {})
+        if parts[-1] == '_mget':
+            return self.__mget(index, json.loads(body))
+        if '_mapping' in parts:
+            return self.__mapping(method, name, index, body)
+        if parts[-1] in ('_refresh', '_flush', '_settings', '_alias', '_aliases'):
+            return 200, {"acknowledged": True}
+
+        return 400, {"error": "%s %s not supported by the ES stand-in" % (method, path)}
+
+    def __index(self, method, name, index):
+        if method in ('GET', 'HEAD'):
+            if index is None:
+                return 404, {"error": {"type": "index_not_found_exception", "index": name}, "status": 404}
+            return 200, {name: {}}
+        if method == 'PUT':
+            if index is not None:
+                return 400, {"error": {"type": "resource_already_exists_exception"}}
+            self.indexes[name] = Index()
+            return 200, {"acknowledged": True}
+        if method == 'DELETE':
+            self.indexes.pop(name, None)
+            return 200, {"acknowledged": True}
+        return 400, {"error": "%s not supported for indexes" % method}
+
+    def __mapping(self, method, name, index, body):
+        if method == 'GET':
+            return 200, {name: {"mappings": {"items": {"_meta": index.meta}}}}
+        if body:
+            mapping = json.loads(body)
+            if '_meta' in mapping:
+                index.meta = mapping['_meta']
+        return 200, {"acknowledged": True}
+
+    def __bulk(self, index_name, body):
+        lines = body.splitlines()
+        results = []
+        errors = False
+        i = 0
+        while i < len(lines):
+            if not lines[i].strip():
+                i += 1
+                continue
+            action, meta = next(iter(json.loads(lines[i]).items()))
+            index = self.indexes.setdefault(meta.get('_index', index_name), Index())
+            _id = str(meta['_id'])
+            if action == 'delete':
+                index.docs.pop(_id, None)
+                i += 1
+            elif action == 'update':
+                index.update(_id, json.loads(lines[i + 1])['doc'])
+                i += 2
+            else:
+                index.put(_id, lines[i + 1])
+                i += 2
+            results.append({action: {"_id": _id, "status": 200}})
+
+        return 200, {"took": 1, "errors": errors, "items": results}
+
+    def __search(self, index, params, query):
+        hits = [(_id, doc) for _id, doc in index.docs.items() if match(query.get('query'), doc[1])]
+
+        if 'sort' in query:
+            field, reverse = sort_key(query['sort'])
+            hits.sort(key=lambda hit: (hit[1][1].get(field) is None, hit[1][1].get(field)), reverse=reverse)
+
+        result = {"took": 1, "hits": {"total": len(hits), "hits": []}}
+
+        aggs = query.get('aggs', query.get('aggregations', {}))
+        if aggs:
+            result['aggregations'] = {name: self.__max(agg, hits) for name, agg in aggs.items()}
+
+        size = int(params.get('size', [query.get('size', 10)])[0])
+        source = query.get('_source')
+        if 'scroll' in params:
+            with self._lock:
+                scroll_id = str(next(self._scroll_ids))
+                self.scrolls[scroll_id] = (hits, size, source, size)
+            result['_scroll_id'] = scroll_id
+        result['hits']['hits'] = _RawList(self.__hit(_id, doc, source) for _id, doc in hits[:size])
+
+        return 200, result
+
+    def __scroll(self, method, body):
+        request = json.loads(body) if body else {}
+        scroll_id = request.get('scroll_id')
+        if method == 'DELETE':
+            self.scrolls.pop(scroll_id, None)
+            return 200, {"succeeded": True}
+
+        with self._lock:
+            hits, size, source, pos = self.scrolls[scroll_id]
+            self.scrolls[scroll_id] = (hits, size, source, pos + size)
+        page = _RawList(self.__hit(_id, doc, source) for _id, doc in hits[pos:pos + size])
+        if not page:
+            self.scrolls.pop(scroll_id, None)
+
+        return 200, {"_scroll_id": scroll_id, "hits": {"total": len(hits), "hits": page}}
+
+    def __mget(self, index, request):
+        ids = request['ids'] if 'ids' in request else [doc['_id'] for doc in request['docs']]
+        docs = []
+        for _id in ids:
+            _id = str(_id)
+            if _id in index.docs:
+                docs.append(self.__hit(_id, index.docs[_id], None, found=True))
+            else:
+                docs.append(json.dumps({"_id": _id, "found": False}))
+        return 200, {"docs": _RawList(docs)}
+
+    @staticmethod
+    def __max(agg, hits):
+        field = agg['max']['field']
+        values = [doc[1].get(field) for _, doc in hits if doc[1].get(field) is not None]
+        if not values:
+            return {"value": None}
+        value = max(values)
+        if isinstance(value, str) and ISO_DATE.match(value):
+            return {"value": to_epoch_millis(value), "value_as_string": value}
+        return {"value": value}
+
+    @staticmethod
+    def __hit(_id, doc, source, found=None):
+        """JSON of a hit. The source is not parsed and serialized again if
+        all the fields are returned"""
+
+        found = '' if found is None else ', "found": %s' % json.dumps(found)
+        if source:
+            fields = json.loads(doc[0])
+            doc_source = json.dumps({k: v for k, v in fields.items() if k in source})
+        else:
+            doc_source = doc[0]
+        return '{"_id": %s, "_source": %s%s}' % (json.dumps(_id), doc_source, found)
+
+    def __handler(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def __respond(self):
+                url = urlparse(self.path)
+                length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(length).decode('utf-8') if length else ''
+                try:
+                    status, response = standin.handle(self.command, url.path, parse_qs(url.query), body)
+                except Exception as ex:
+                    status, response = 500, {"error": str(ex)}
+                data = encode(response).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(data)
+
+            do_GET = do_PUT = do_POST = do_DELETE = do_HEAD = __respond
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def _serve(conn, host, port):
+    """Run a stand-in until it is asked to stop through conn, sending its
+    URL once started and its peak RSS in MB once stopped"""
+
+    standin = ESStandIn(host, port).start()
+    conn.send(standin.url)
+    conn.recv()
+    standin.stop()
+    # KB in Linux, bytes in macOS
+    conn.send(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+    conn.close()
+
+
+class ESStandInProcess:
+    """ESStandIn running in a new process, so the documents it keeps are
+    not counted in the memory of the process using it. Its peak RSS is
+    available in `peak_rss_mb` once stopped.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.host = host
+        self.port = port
+        self.url = None
+        self.peak_rss_mb = None
+        self._conn = None
+        self._process = None
+
+    def start(self):
+        context = multiprocessing.get_context('spawn')
+        self._conn, child_conn = context.Pipe()
+        self._process = context.Process(target=_serve, args=(child_conn, self.host, self.port), daemon=True)
+        self._process.start()
+        child_conn.close()
+        self.url = self._conn.recv()
+        return self
+
+    def stop(self):
+        self._conn.send('stop')
+        self.peak_rss_mb = self._conn.recv()
+        self._conn.close()
+        self._process.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _RawList:
+    """List of items already serialized to JSON"""
+
+    def __init__(self, items):
+        self.items = list(items)
+
+
+def encode(response):
+    """Serialize a response including a _RawList"""
+
+    raw_lists = []
+
+    def default(obj):
+        if isinstance(obj, _RawList):
+            raw_lists.append(obj)
+            return RAW_MARKER
+        raise TypeError(obj)
+
+    data = json.dumps(response, default=default)
+    for raw_list in raw_lists:
+        data = data.replace(json.dumps(RAW_MARKER), "[" + ", ".join(raw_list.items) + "]", 1)
+    return data
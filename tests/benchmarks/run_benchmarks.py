@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+"""Benchmark of feed and enrich with synthetic items and an ES stand-in.
+
+Run it from the tests directory:
+
+    python3 -m benchmarks.run_benchmarks --items 1000000 git github --output bench.json
+
+Each data source runs in a new process, so its peak RSS is not mixed
+with the other ones. The ES stand-in runs in another process too, and
+its peak RSS (it keeps all the documents) is reported apart. Use
+--compare with the output of other commit to see the change in throughput.
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import traceback
+
+from datetime import datetime
+
+import requests
+
+if '..' not in sys.path:
+    sys.path.insert(0, '..')
+
+from grimoire_elk.elastic import ElasticSearch
+from grimoire_elk.elastic_items import ElasticItems
+from grimoire_elk.elk import enrich_items
+from grimoire_elk.metrics import metrics
+from grimoire_elk.utils import get_connector_from_name, get_elastic
+
+from benchmarks.es_standin import ESStandInProcess
+from benchmarks.synthetic import synthetic_items
+
+
+DEFAULT_CONNECTORS = ['git', 'github', 'gerrit', 'jira', 'mbox', 'stackexchange', 'rss']
+
+
+class OfflineAdapter(requests.adapters.BaseAdapter):
+    """Transport answering 503 to all the requests, so enrichers calling
+    external APIs (e.g. geolocation in github) don't need the network"""
+
+    def send(self, request, **kwargs):
+        response = requests.Response()
+        response.status_code = 503
+        response._content = b'{}'
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class TimedIterator:
+    """Iterator adding up the time spent getting the items of iterable"""
+
+    def __init__(self, iterable):
+        self.iterator = iter(iterable)
+        self.time = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            return next(self.iterator)
+        finally:
+            self.time += time.perf_counter() - start
+
+
+def run_backend(connector, total, seed=0, bulk_size=1000, scroll_size=100):
+    """Feed and enrich `total` synthetic items of connector, in this process
+    (with the ES stand-in in another one)"""
+
+    ElasticSearch.max_items_bulk = bulk_size
+    ElasticItems.scroll_size = scroll_size
+    ocean_cls, enrich_cls = get_connector_from_name(connector)[1:3]
+
+    with ESStandInProcess() as es:
+        metrics.reset()
+        ocean_backend = ocean_cls(None)
+        ocean_backend.set_elastic(get_elastic(es.url, connector + '_raw', True, ocean_backend))
+
+        items = TimedIterator(synthetic_items(connector, total, seed))
+        start = time.perf_counter()
+        ocean_backend.feed_items(items)
+        feed_time = time.perf_counter() - start - items.time
+        feed_stats = metrics.summary()['stages']
+
+        metrics.reset()
+        enrich_backend = enrich_cls()
+        # Only the ES stand-in is reachable from the enricher
+        enrich_backend.requests.mount('http://', OfflineAdapter())
+        enrich_backend.requests.mount('https://', OfflineAdapter())
+        enrich_backend.requests.mount(es.url, requests.adapters.HTTPAdapter())
+        enrich_backend.set_elastic(get_elastic(es.url, connector + '_enriched', True, enrich_backend))
+
+        start = time.perf_counter()
+        enriched = enrich_items(ocean_backend, enrich_backend)
+        enrich_time = time.perf_counter() - start
+        enrich_stats = metrics.summary()['stages']
+
+    def stage(stats, name, field):
+        return stats.get(name, {}).get(field, 0)
+
+    return {
+        'items': total,
+        'generate_time': items.time,
+        'feed_time': feed_time,
+        'feed_items_sec': total / feed_time if feed_time else 0,
+        'feed_bytes_written': stage(feed_stats, 'es_bulk', 'bytes'),
+        'enriched': enriched,
+        'enrich_time': enrich_time,
+        'enrich_items_sec': total / enrich_time if enrich_time else 0,
+        'enrich_bytes_read': stage(enrich_stats, 'es_read', 'bytes'),
+        'enrich_bytes_written': stage(enrich_stats, 'es_bulk', 'bytes'),
+        'get_rich_item_time': stage(enrich_stats, 'get_rich_item', 'time'),
+        'json_dumps_time': stage(enrich_stats, 'json_dumps', 'time'),
+        # KB in Linux, bytes in macOS
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'es_peak_rss_mb': es.peak_rss_mb,
+        'status': 'done'
+    }
+
+
+def _run_child(conn, *args):
+    try:
+        result = run_backend(*args)
+    except Exception as ex:
+        traceback.print_exc()
+        result = {'items': args[1], 'status': 'failed', 'error': str(ex)}
+    conn.send(result)
+    conn.close()
+
+
+def run_isolated(connector, total, seed, bulk_size, scroll_size):
+    """Run the benchmark of connector in a new process"""
+
+    context = multiprocessing.get_context('spawn')
+    conn, child_conn = context.Pipe(duplex=False)
+    process = context.Process(target=_run_child,
+                              args=(child_conn, connector, total, seed, bulk_size, scroll_size))
+    process.start()
+    child_conn.close()
+
+    try:
+        result = conn.recv()
+    except EOFError:
+        # The process died without sending the result
+        result = {'items': total, 'status': 'failed', 'error': "exit code %s" % process.exitcode}
+    process.join()
+
+    return result
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, baseline=None):
+    header = "%-15s %10s %12s %12s %10s %10s %12s %12s" % ('backend', 'items', 'feed it/s', 'enrich it/s',
+                                                           'rss MB', 'es rss MB', 'feed MB', 'enrich MB')
+    if baseline:
+        header += " %10s %10s" % ('feed x', 'enrich x')
+    print(header)
+
+    for connector, result in results['backends'].items():
+        if result['status'] != 'done':
+            print("%-15s %10i %s" % (connector, result['items'], result['status']))
+            continue
+        line = "%-15s %10i %12.1f %12.1f %10.1f %10.1f %12.2f %12.2f" % (
+            connector, result['items'], result['feed_items_sec'], result['enrich_items_sec'],
+            result['peak_rss_mb'], result['es_peak_rss_mb'], result['feed_bytes_written'] / (1024 * 1024),
+            result['enrich_bytes_written'] / (1024 * 1024))
+        base = baseline['backends'].get(connector, {}) if baseline else {}
+        if base.get('status') == 'done':
+            line += " %10.2f %10.2f" % (result['feed_items_sec'] / base['feed_items_sec'],
+                                        result['enrich_items_sec'] / base['enrich_items_sec'])
+        print(line)
+
+
+def get_params():
+    parser = argparse.ArgumentParser(description="Benchmark of GrimoireELK feed and enrich")
+    parser.add_argument('connectors', nargs='*', default=DEFAULT_CONNECTORS,
+                        help="Data sources to benchmark (with fixtures in tests/data)")
+    parser.add_argument('--items', type=int, default=100000, help="Synthetic items per data source")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic items")
+    parser.add_argument('--bulk-size', type=int, default=1000, help="Items per bulk request")
+    parser.add_argument('--scroll-size', type=int, default=100, help="Items per scroll page")
+    parser.add_argument('--output', help="JSON file to write the results")
+    parser.add_argument('--compare', help="JSON file with the results of other run to compare with")
+    parser.add_argument('-g', '--debug', action='store_true')
+
+    return parser.parse_args()
+
+
+def main():
+    args = get_params()
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.WARNING,
+                        format='%(asctime)s %(message)s')
+
+    results = {
+        'commit': get_commit(),
+        'date': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'seed': args.seed,
+        'bulk_size': args.bulk_size,
+        'scroll_size': args.scroll_size,
+        'backends': {}
+    }
+
+    for connector in args.connectors:
+        results['backends'][connector] = run_isolated(connector, args.items, args.seed,
+                                                      args.bulk_size, args.scroll_size)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as fd:
+            baseline = json.load(fd)
+
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as fd:
+            json.dump(results, fd, indent=4, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
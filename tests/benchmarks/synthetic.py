@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+"""Synthetic raw items built from the fixtures in tests/data"""
+
+import hashlib
+import json
+import os
+import random
+import re
+
+from datetime import datetime, timedelta
+
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+
+# Items are spread from this date (epoch) over `days`
+BASE_TIMESTAMP = 1420070400  # 2015-01-01
+ISO_DATE = re.compile(r'^(\d{4}-\d{2}-\d{2})([T ])(\d{2}:\d{2}:\d{2})')
+EMAIL = re.compile(r'^[\w.+-]+@[\w-]+(\.[\w-]+)+$')
+USER_EMAIL = re.compile(r'^(.*?)\s*<([^<>\s]+@[^<>\s]+)>$')
+IDENTITY_FIELDS = ['name', 'login', 'username']
+
+
+def load_fixtures(connector):
+    """Raw items of connector in tests/data"""
+
+    with open(os.path.join(DATA_DIR, connector + '.json')) as fd:
+        return json.load(fd)
+
+
+class IdentityPool:
+    """Synthetic identities, with `domains` email domains"""
+
+    def __init__(self, size, domains=50):
+        self.size = size
+        self.domains = domains
+
+    def get(self, n):
+        return {
+            'name': 'User %i' % n,
+            'login': 'user%i' % n,
+            'username': 'user%i' % n,
+            'email': 'user%i@domain%i.example.com' % (n, n % self.domains)
+        }
+
+
+def synthetic_items(connector, total, seed=0, origins=100, identities=1000, days=3650):
+    """Generate `total` raw items of connector from its fixtures.
+
+    Fixtures are used in turn. Each item gets a new uuid, an origin out
+    of `origins`, and dates increasing from BASE_TIMESTAMP over `days`.
+    ISO dates inside the data are moved with the item. The identities
+    (emails, "name <email>" and dicts with an email) are replaced by
+    identities out of `identities`, chosen for each item. The same seed
+    always generates the same items.
+    """
+    rng = random.Random(seed)
+    pool = IdentityPool(identities)
+    templates = [json.dumps(item) for item in load_fixtures(connector)]
+    step = days * 24 * 3600 / max(total, 1)
+
+    for i in range(total):
+        item = json.loads(templates[i % len(templates)])
+
+        timestamp = BASE_TIMESTAMP + i * step
+        shift = timedelta(seconds=timestamp - item.get('updated_on', timestamp))
+        replaced = {}
+
+        def new_identity(original):
+            if original not in replaced:
+                replaced[original] = pool.get(rng.randrange(identities))
+            return replaced[original]
+
+        item['data'] = _rewrite(item.get('data', {}), shift, new_identity)
+        item['uuid'] = hashlib.sha1(('%s-%s-%i' % (connector, seed, i)).encode('utf-8')).hexdigest()
+        item['ocean-unique-id'] = item['uuid']
+        item['updated_on'] = timestamp
+        item['timestamp'] = timestamp
+        item['origin'] = 'https://%s.example.com/repo%i' % (connector, rng.randrange(origins))
+        if 'tag' in item:
+            item['tag'] = item['origin']
+
+        yield item
+
+
+def _rewrite(value, shift, new_identity):
+    if isinstance(value, dict):
+        rewritten = {k: _rewrite(v, shift, new_identity) for k, v in value.items()}
+        if isinstance(value.get('email'), str) and EMAIL.match(value['email']):
+            identity = new_identity(value['email'])
+            for field in ['email'] + IDENTITY_FIELDS:
+                if field in rewritten:
+                    rewritten[field] = identity[field]
+        return rewritten
+    if isinstance(value, list):
+        return [_rewrite(v, shift, new_identity) for v in value]
+    if isinstance(value, str):
+        return _rewrite_str(value, shift, new_identity)
+    return value
+
+
+def _rewrite_str(value, shift, new_identity):
+    user_email = USER_EMAIL.match(value)
+    if user_email:
+        identity = new_identity(user_email.group(2))
+        return "%s <%s>" % (identity['name'], identity['email'])
+    if EMAIL.match(value):
+        return new_identity(value)['email']
+
+    date = ISO_DATE.match(value)
+    if date:
+        try:
+            moved = datetime.strptime(date.group(1) + ' ' + date.group(3), "%Y-%m-%d %H:%M:%S") + shift
+        except (ValueError, OverflowError):
+            return value
+        return moved.strftime("%Y-%m-%d") + date.group(2) + moved.strftime("%H:%M:%S") + value[date.end():]
+
+    return value
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+import pickle
+import sys
+import unittest
+
+from unittest.mock import MagicMock, patch
+
+import fakeredis
+
+from arthur.common import Q_STORAGE_ITEMS
+
+# Make sure we use our code and not any other could we have installed
+sys.path.insert(0, '..')
+
+from grimoire_elk.arthur_queue import ArthurQueueConsumer
+from grimoire_elk.elk import feed_backend_arthur
+from grimoire_elk.errors import ELKError
+from grimoire_elk.raw.elastic import ElasticOcean
+
+QUEUE = 'items'
+
+
+def push_items(conn, tags):
+    for i, tag in enumerate(tags):
+        conn.rpush(QUEUE, pickle.dumps({'tag': tag, 'uuid': str(i)}))
+
+
+class TestArthurQueueConsumer(unittest.TestCase):
+    """Unit tests for the consumer of the Arthur items queue"""
+
+    def setUp(self):
+        self.conn = fakeredis.FakeStrictRedis()
+        self.batches = []
+
+    def handler(self, items):
+        self.batches.append([item['uuid'] for item in items])
+
+    def test_consume(self):
+        """Test whether items are read in batches and other tags are routed"""
+
+        push_items(self.conn, ['git', 'github', 'git', 'git', 'github'])
+
+        consumer = ArthurQueueConsumer(self.conn, 'git', self.handler, batch_size=2, queue=QUEUE)
+        self.assertEqual(consumer.consume(), 3)
+
+        self.assertListEqual(self.batches, [['0'], ['2', '3']])
+        self.assertEqual(consumer.routed, 2)
+        self.assertEqual(self.conn.llen(QUEUE), 0)
+        self.assertEqual(self.conn.llen(consumer.processing_queue), 0)
+
+        # The items routed are read by the consumer of their tag
+        self.batches = []
+        consumer = ArthurQueueConsumer(self.conn, 'github', self.handler, batch_size=2, queue=QUEUE)
+        self.assertEqual(consumer.consume(), 2)
+        self.assertListEqual(self.batches, [['1', '4']])
+        self.assertEqual(self.conn.llen(QUEUE + ':github'), 0)
+
+    def test_handler_error(self):
+        """Test whether a batch not handled is consumed in the next run"""
+
+        push_items(self.conn, ['git', 'git', 'git'])
+
+        def failing_handler(items):
+            raise RuntimeError("ES not available")
+
+        consumer = ArthurQueueConsumer(self.conn, 'git', failing_handler, batch_size=2, queue=QUEUE)
+        with self.assertRaises(RuntimeError):
+            consumer.consume()
+        self.assertEqual(self.conn.llen(consumer.processing_queue), 2)
+        self.assertEqual(self.conn.llen(QUEUE), 1)
+
+        consumer = ArthurQueueConsumer(self.conn, 'git', self.handler, batch_size=2, queue=QUEUE)
+        self.assertEqual(consumer.consume(), 3)
+        self.assertListEqual(self.batches, [['0', '1'], ['2']])
+        self.assertEqual(self.conn.llen(consumer.processing_queue), 0)
+
+    def test_bounded(self):
+        """Test whether items queued while consuming are left for the next run"""
+
+        push_items(self.conn, ['git', 'git'])
+
+        def handler(items):
+            self.handler(items)
+            push_items(self.conn, ['git'])
+
+        consumer = ArthurQueueConsumer(self.conn, 'git', handler, batch_size=1, queue=QUEUE)
+        self.assertEqual(consumer.consume(), 2)
+        self.assertEqual(self.conn.llen(QUEUE), 2)
+
+    def test_feed_items_not_stored(self):
+        """Test whether a batch with items not stored in ES is kept in the processing queue"""
+
+        for i in range(3):
+            item = {'tag': 'git', 'uuid': str(i), 'origin': 'repo',
+                    'backend_name': 'Git', 'backend_version': '0.1',
+                    'updated_on': 1514764800, 'timestamp': 1514764800}
+            self.conn.rpush(Q_STORAGE_ITEMS, pickle.dumps(item))
+
+        ocean = ElasticOcean(None)
+        ocean.perceval_backend = MagicMock(tag='git')
+        ocean.elastic = MagicMock(max_items_bulk=10)
+        # ES rejects one of the items
+        ocean.elastic.bulk_upload.side_effect = lambda items, field_id: len(items) - 1
+
+        with patch('redis.StrictRedis.from_url', return_value=self.conn):
+            with self.assertRaises(ELKError):
+                feed_backend_arthur(ocean, batch_size=3)
+
+        self.assertEqual(self.conn.llen(Q_STORAGE_ITEMS + ':processing:git'), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
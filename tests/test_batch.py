@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import httpretty
+
+from unittest.mock import MagicMock, patch
+
+# Make sure we use our code and not any other could we have installed
+sys.path.insert(0, '..')
+
+from grimoire_elk.batch import read_jobs, run_batch
+from grimoire_elk.elastic import ElasticSearch
+from grimoire_elk.enriched.enrich import Enrich
+from grimoire_elk.errors import ELKError
+
+
+JOBS = [
+    {"backend": "git", "backend_args": ["https://github.com/org/repo1.git"],
+     "index": "git_raw", "index_enrich": "git"},
+    {"backend": "git", "backend_args": ["https://github.com/org/repo2.git"],
+     "index": "git_raw", "index_enrich": "git", "project": "repo2"},
+    {"backend": "mbox", "backend_args": ["list", "/tmp/list"],
+     "index": "mbox_raw", "index_enrich": "mbox"}
+]
+
+
+def p2o_args():
+    args = MagicMock()
+    args.elastic_url = "http://localhost:9200"
+    args.no_incremental = False
+    args.fetch_cache = False
+    args.enrich_only = False
+    args.enrich = True
+    args.project = None
+    args.arthur = False
+    return args
+
+
+class TestBatch(unittest.TestCase):
+    """Unit tests for p2o batch mode"""
+
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp(prefix='gelk_')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+        ElasticSearch.shared = False
+        ElasticSearch._shared_versions.clear()
+        ElasticSearch._shared_sessions.clear()
+        ElasticSearch._shared_indexes.clear()
+
+    def write_jobs(self, jobs):
+        path = os.path.join(self.tmp_path, 'jobs.json')
+        with open(path, 'w') as f:
+            json.dump(jobs, f)
+        return path
+
+    def test_read_jobs(self):
+        """Test whether jobs are read and validated"""
+
+        self.assertListEqual(read_jobs(self.write_jobs(JOBS)), JOBS)
+
+        with self.assertRaises(ELKError):
+            read_jobs(self.write_jobs({"backend": "git"}))
+        with self.assertRaises(ELKError):
+            read_jobs(self.write_jobs([{"index": "git_raw"}]))
+
+    @patch('grimoire_elk.batch.enrich_backend')
+    @patch('grimoire_elk.batch.feed_backend')
+    def test_run_batch(self, mock_feed, mock_enrich):
+        """Test whether all jobs are run sharing the caches and their status is reported"""
+
+        mock_feed.side_effect = lambda url, clean, fetch_cache, backend, backend_args, *args: \
+            backend_args[0] != "list"
+        mock_enrich.return_value = True
+
+        report = run_batch(p2o_args(), JOBS, workers=2)
+
+        self.assertTrue(ElasticSearch.shared)
+        self.assertListEqual([result['status'] for result in report], ["done", "done", "failed"])
+        self.assertListEqual([result['backend_args'] for result in report], [job['backend_args'] for job in JOBS])
+        self.assertEqual(mock_feed.call_count, 3)
+        self.assertEqual(mock_enrich.call_count, 3)
+
+        projects = sorted(str(call[0][7]) for call in mock_feed.call_args_list)
+        self.assertListEqual(projects, ["None", "None", "repo2"])
+        caches = [call[0][-1] for call in mock_enrich.call_args_list]
+        self.assertTrue(all(cache is caches[0] for cache in caches))
+
+    @patch('grimoire_elk.batch.enrich_backend')
+    @patch('grimoire_elk.batch.feed_backend')
+    def test_run_batch_errors(self, mock_feed, mock_enrich):
+        """Test whether an exception in a job doesn't stop the rest"""
+
+        mock_feed.side_effect = [RuntimeError("feed error"), True, True]
+        mock_enrich.return_value = True
+
+        report = run_batch(p2o_args(), JOBS)
+
+        self.assertListEqual([result['status'] for result in report], ["failed", "done", "done"])
+
+    @httpretty.activate
+    def test_shared_elastic(self):
+        """Test whether ES version and indexes are set up once when shared"""
+
+        url = "http://es6.com"
+        httpretty.register_uri(httpretty.GET, url,
+                               body=json.dumps({"version": {"number": "6.1.0"}}))
+        httpretty.register_uri(httpretty.GET, url + "/git_raw", body="{}")
+
+        ElasticSearch.shared = True
+        first = ElasticSearch(url, "git_raw")
+        requests = len(httpretty.latest_requests())
+        second = ElasticSearch(url, "git_raw")
+
+        self.assertEqual(len(httpretty.latest_requests()), requests)
+        self.assertEqual(second.major, '6')
+        self.assertIs(first.requests, second.requests)
+
+    def test_shared_projects_map(self):
+        """Test whether the JSON projects map is loaded once while it is not modified"""
+
+        path = os.path.join(self.tmp_path, 'projects.json')
+        with open(path, 'w') as f:
+            json.dump({"project": {"git": ["https://github.com/org/repo1.git"]}}, f)
+
+        first = Enrich(json_projects_map=path)
+        second = Enrich(json_projects_map=path)
+        self.assertIs(first.prjs_map, second.prjs_map)
+        self.assertDictEqual(first.prjs_map, {"git": {"https://github.com/org/repo1.git": "project"}})
+
+        with open(path, 'w') as f:
+            json.dump({"other": {"git": ["https://github.com/org/repo1.git"]}}, f)
+        os.utime(path, (0, 0))
+
+        third = Enrich(json_projects_map=path)
+        self.assertDictEqual(third.prjs_map, {"git": {"https://github.com/org/repo1.git": "other"}})
+
+
+if __name__ == '__main__':
+    unittest.main()
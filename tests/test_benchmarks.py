@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+import json
+import sys
+import unittest
+
+import requests
+
+# Make sure we use our code and not any other could we have installed
+sys.path.insert(0, '..')
+
+from benchmarks.es_standin import ESStandIn
+from benchmarks.run_benchmarks import run_backend, run_isolated
+from benchmarks.synthetic import synthetic_items
+
+
+class TestESStandIn(unittest.TestCase):
+    """Unit tests for the ES stand-in used in the benchmarks"""
+
+    def setUp(self):
+        self.es = ESStandIn().start()
+        self.index_url = self.es.url + "/test"
+        headers = {"Content-Type": "application/x-ndjson"}
+        bulk = ""
+        for i in range(5):
+            doc = {"uuid": str(i), "origin": "o%i" % (i % 2), "data": {"n": i},
+                   "metadata__timestamp": "2018-01-0%iT00:00:00" % (5 - i)}
+            bulk += '{"index" : {"_id" : "%i" } }\n%s\n' % (i, json.dumps(doc))
+        requests.put(self.index_url, data="{}")
+        res = requests.put(self.index_url + "/items/_bulk", data=bulk, headers=headers).json()
+        self.assertEqual(len(res['items']), 5)
+
+    def tearDown(self):
+        self.es.stop()
+
+    def test_scroll(self):
+        """Test whether searches are filtered, sorted and scrolled"""
+
+        query = {"query": {"bool": {"must": [{"term": {"origin": "o0"}}]}},
+                 "sort": {"metadata__timestamp": {"order": "asc"}}}
+        res = requests.post(self.index_url + "/_search?scroll=10m&size=2", json=query).json()
+        ids = [hit['_id'] for hit in res['hits']['hits']]
+
+        while True:
+            res = requests.post(self.es.url + "/_search/scroll",
+                                json={"scroll": "10m", "scroll_id": res['_scroll_id']}).json()
+            if not res['hits']['hits']:
+                break
+            ids += [hit['_id'] for hit in res['hits']['hits']]
+
+        self.assertListEqual(ids, ["4", "2", "0"])
+
+    def test_max_and_mget(self):
+        """Test whether max aggregations and _mget are supported"""
+
+        query = {"size": 0, "aggs": {"1": {"max": {"field": "metadata__timestamp"}}}}
+        res = requests.post(self.index_url + "/_search", json=query).json()
+        self.assertEqual(res['aggregations']['1']['value_as_string'], "2018-01-05T00:00:00")
+
+        res = requests.post(self.index_url + "/_mget", json={"docs": [{"_id": "1"}, {"_id": "9"}]}).json()
+        self.assertDictEqual(res['docs'][0]['_source']['data'], {"n": 1})
+        self.assertFalse(res['docs'][1]['found'])
+
+        self.assertEqual(requests.get(self.es.url + "/unknown").status_code, 404)
+
+
+class TestBenchmarks(unittest.TestCase):
+    """Unit tests for the synthetic items and the benchmark runs"""
+
+    def test_synthetic_items(self):
+        """Test whether synthetic items are unique, varied and reproducible"""
+
+        items = list(synthetic_items('git', 50, seed=1))
+        self.assertEqual(len({item['uuid'] for item in items}), 50)
+        self.assertGreater(len({item['origin'] for item in items}), 1)
+        self.assertGreater(len({item['data']['Author'] for item in items}), 1)
+        self.assertTrue(all(a['updated_on'] < b['updated_on'] for a, b in zip(items, items[1:])))
+        self.assertListEqual(items, list(synthetic_items('git', 50, seed=1)))
+
+    def test_run_backend(self):
+        """Test whether the synthetic items are fed and enriched"""
+
+        result = run_backend('git', 50, bulk_size=20, scroll_size=20)
+
+        self.assertEqual(result['status'], 'done')
+        self.assertEqual(result['enriched'], 50)
+        self.assertGreater(result['feed_bytes_written'], 0)
+        self.assertGreater(result['enrich_bytes_written'], 0)
+        self.assertGreater(result['peak_rss_mb'], 0)
+        self.assertGreater(result['es_peak_rss_mb'], 0)
+
+    def test_run_isolated(self):
+        """Test whether the benchmark runs in a new process and its errors are reported"""
+
+        result = run_isolated('git', 20, 0, 10, 10)
+        self.assertEqual(result['status'], 'done')
+        self.assertEqual(result['enriched'], 20)
+
+        result = run_isolated('unknown', 20, 0, 10, 10)
+        self.assertEqual(result['status'], 'failed')
+
+
+if __name__ == '__main__':
+    unittest.main()
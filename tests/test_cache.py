@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+import sys
+import unittest
+
+from unittest.mock import MagicMock, patch
+
+# Make sure we use our code and not any other could we have installed
+sys.path.insert(0, '..')
+
+from grimoire_elk.enriched.cache import LRUCache
+from grimoire_elk.enriched.enrich import Enrich
+from grimoire_elk.enriched.git import GitEnrich
+
+
+class TestLRUCache(unittest.TestCase):
+    """Unit tests for LRUCache class"""
+
+    def test_lookup_stats(self):
+        """Test whether hits and misses are counted"""
+
+        cache = LRUCache('test', maxsize=10)
+        self.assertIsNone(cache.lookup('a'))
+        cache.store('a', 1)
+        self.assertEqual(cache.lookup('a'), 1)
+        self.assertEqual(cache.lookup('a'), 1)
+
+        stats = cache.get_stats()
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['evictions'], 0)
+        self.assertEqual(stats['size'], 1)
+        self.assertEqual(stats['hit_ratio'], 0.6667)
+
+    def test_eviction(self):
+        """Test whether the least recently used items are evicted"""
+
+        cache = LRUCache('test', maxsize=2)
+        cache.store('a', 1)
+        cache.store('b', 2)
+        cache.lookup('a')
+        cache.store('c', 3)
+
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIn('c', cache)
+        self.assertEqual(cache.get_stats()['evictions'], 1)
+
+        cache.resize(1)
+        self.assertEqual(len(cache), 1)
+        self.assertIn('c', cache)
+        self.assertEqual(cache.get_stats()['evictions'], 2)
+
+    def test_disabled(self):
+        """Test whether a cache with size 0 does not store items"""
+
+        cache = LRUCache('test', maxsize=0)
+        cache.store('a', 1)
+        self.assertEqual(len(cache), 0)
+        self.assertIsNone(cache.lookup('a'))
+
+
+class TestEnrichCaches(unittest.TestCase):
+    """Unit tests for the SortingHat caches in Enrich"""
+
+    def test_per_instance_caches(self):
+        """Test whether caches are not shared between enrichers"""
+
+        enrich1 = Enrich()
+        enrich2 = Enrich()
+
+        with patch('grimoire_elk.enriched.enrich.api', create=True) as api:
+            api.enrollments = MagicMock(return_value=['enrollment'])
+            enrich1.get_enrollments('uuid1')
+            enrich1.get_enrollments('uuid1')
+            enrich2.get_enrollments('uuid1')
+
+            self.assertEqual(api.enrollments.call_count, 2)
+
+        stats = enrich1.get_sh_caches_stats()
+        self.assertEqual(stats['enrollments']['hits'], 1)
+        self.assertEqual(stats['enrollments']['misses'], 1)
+        stats = enrich2.get_sh_caches_stats()
+        self.assertEqual(stats['enrollments']['hits'], 0)
+        self.assertEqual(stats['enrollments']['misses'], 1)
+
+    def test_set_sh_cache_size(self):
+        """Test whether caches capacity is configured"""
+
+        enrich = Enrich()
+        enrich.set_sh_cache_size(['10', 'uuids:5'])
+
+        stats = enrich.get_sh_caches_stats()
+        self.assertEqual(stats['enrollments']['maxsize'], 10)
+        self.assertEqual(stats['sh_ids']['maxsize'], 10)
+        self.assertEqual(stats['uuids']['maxsize'], 5)
+
+        with self.assertRaises(RuntimeError):
+            enrich.set_sh_cache_size(['unknown:5'])
+
+    def test_git_users_cache(self):
+        """Test whether git users are parsed once"""
+
+        enrich = GitEnrich()
+        enrich.set_sh_cache_size(['git_users:1'])
+
+        identity = enrich.get_sh_identity("John Smith <jsmith@example.com>")
+        identity['username'] = 'jsmith'
+        identity = enrich.get_sh_identity("John Smith <jsmith@example.com>")
+        self.assertDictEqual(identity, {'username': None, 'email': 'jsmith@example.com', 'name': 'John Smith'})
+
+        enrich.get_sh_identity("Jane Doe <jdoe@example.com>")
+        stats = enrich.get_sh_caches_stats()['git_users']
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 2)
+        self.assertEqual(stats['evictions'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+import sys
+import threading
+import unittest
+
+# Make sure we use our code and not any other could we have installed
+sys.path.insert(0, '..')
+
+from grimoire_elk.enriched.ceres_base import CeresBase, Connector
+
+
+class ListConnector(Connector):
+    """Connector reading from and writing to lists"""
+
+    def __init__(self, items=None, fail_on=None):
+        self.items = items or []
+        self.written = []
+        self.fail_on = fail_on
+
+    def read_block(self, size, from_date=None):
+        for i in range(0, len(self.items), size):
+            yield self.items[i:i + size]
+
+    def write(self, items):
+        if self.fail_on is not None and self.fail_on in items:
+            raise IOError("Write failed")
+        self.written.extend(items)
+
+    def latest_date(self):
+        return None
+
+
+class Double(CeresBase):
+    """Processor generating two items per item"""
+
+    def process(self, items_block):
+        out_items = []
+        for item in items_block:
+            out_items.extend([item * 2, item * 2 + 1])
+        return self.ProcessResults(processed=len(items_block), out_items=out_items)
+
+
+class DoubleWithLock(Double):
+    """Processor sharing state (e.g. a SortingHat session) among its blocks"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+        self.threads = set()
+
+    def process(self, items_block):
+        with self.lock:
+            self.threads.add(threading.get_ident())
+        return super().process(items_block)
+
+
+class TestCeresBase(unittest.TestCase):
+    """Unit tests for CeresBase"""
+
+    def test_sequential(self):
+        """Test whether blocks are processed one after the other"""
+
+        out_conn = ListConnector()
+        total = Double(ListConnector(list(range(10))), out_conn, 3).analyze()
+
+        self.assertEqual(total, 20)
+        self.assertListEqual(out_conn.written, list(range(20)))
+
+    def test_pipeline(self):
+        """Test whether blocks are processed in a pool of threads and written in order"""
+
+        out_conn = ListConnector()
+        total = Double(ListConnector(list(range(100))), out_conn, 7, workers=3).analyze()
+
+        self.assertEqual(total, 200)
+        self.assertListEqual(out_conn.written, list(range(200)))
+
+    def test_pipeline_threads(self):
+        """Test whether the blocks are processed by the same processor in several threads"""
+
+        out_conn = ListConnector()
+        processor = DoubleWithLock(ListConnector(list(range(100))), out_conn, 7, workers=3)
+        total = processor.analyze()
+
+        self.assertEqual(total, 200)
+        self.assertListEqual(out_conn.written, list(range(200)))
+        self.assertNotIn(threading.get_ident(), processor.threads)
+
+    def test_pipeline_write_error(self):
+        """Test whether write errors are raised and the blocks after it are not written"""
+
+        out_conn = ListConnector(fail_on=50)
+        with self.assertRaises(IOError):
+            DoubleWithLock(ListConnector(list(range(100))), out_conn, 5, workers=2).analyze()
+
+        self.assertListEqual(out_conn.written, list(range(50)))
+
+
+if __name__ == '__main__':
+    unittest.main()
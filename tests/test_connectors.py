@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+import subprocess
+import sys
+import unittest
+
+from unittest.mock import MagicMock, patch
+
+# Make sure we use our code and not any other could we have installed
+sys.path.insert(0, '..')
+
+from grimoire_elk.utils import (ConnectorRegistry,
+                                get_connector_from_name,
+                                get_connector_name,
+                                get_connector_name_from_cls_name,
+                                get_connectors)
+from grimoire_elk.raw.rss import RSSOcean
+from grimoire_elk.enriched.rss import RSSEnrich
+from grimoire_elk.enriched.enrich import metadata
+
+
+class TestConnectorRegistry(unittest.TestCase):
+    """Unit tests for the lazy registry of connectors"""
+
+    def test_lazy_import(self):
+        """Test whether importing the connectors does not import the backends nor the studies"""
+
+        code = "import sys; sys.path.insert(0, '..'); " \
+               "from grimoire_elk.utils import get_connector_from_name; " \
+               "get_connector_from_name('rss'); " \
+               "print(' '.join(sorted(sys.modules)))"
+        modules = subprocess.check_output([sys.executable, '-c', code]).decode('utf-8').split()
+
+        self.assertIn('grimoire_elk.enriched.rss', modules)
+        self.assertNotIn('perceval.backends.core.git', modules)
+        self.assertNotIn('grimoire_elk.enriched.git', modules)
+        self.assertNotIn('pandas', modules)
+        self.assertNotIn('cereslib', modules)
+
+    def test_get_connector(self):
+        """Test whether connectors are found by name and by class"""
+
+        connector = get_connector_from_name('rss:feed')
+        self.assertEqual(connector[1], RSSOcean)
+        self.assertEqual(connector[2], RSSEnrich)
+        self.assertIsNone(get_connector_from_name('unknown'))
+
+        self.assertEqual(get_connector_name(RSSEnrich), 'rss')
+        self.assertEqual(get_connector_name(RSSOcean), 'rss')
+        self.assertEqual(get_connector_name_from_cls_name('RSSEnrich'), 'rss')
+        self.assertIsNone(get_connector_name(MagicMock))
+
+        self.assertIn('git', get_connectors())
+        self.assertIsNone(get_connectors()['twitter'][0])
+
+    def test_entry_points(self):
+        """Test whether connectors registered in entry points are found"""
+
+        entry_point = MagicMock()
+        entry_point.name = 'myrss'
+        entry_point.load.return_value = [None, 'grimoire_elk.raw.rss:RSSOcean', RSSEnrich, None]
+
+        registry = ConnectorRegistry(connectors={})
+        with patch('pkg_resources.iter_entry_points', return_value=[entry_point]) as iter_entry_points:
+            self.assertListEqual(list(registry), ['myrss'])
+            self.assertListEqual(registry['myrss'], [None, RSSOcean, RSSEnrich, None])
+            self.assertEqual(registry.get_name(RSSEnrich), 'myrss')
+            iter_entry_points.assert_called_once_with('grimoire_elk.connectors')
+
+
+class TestConnectorName(unittest.TestCase):
+    """Unit tests for the per run constants of the connectors"""
+
+    @patch('grimoire_elk.utils.get_connector_name', return_value='rss')
+    def test_connector_name_cached(self, mock_get_name):
+        """Test whether the connector name and its fields are found once"""
+
+        enrich = RSSEnrich()
+        fields = enrich.get_grimoire_fields("2018-01-01", "entry")
+        fields = enrich.get_grimoire_fields("2018-01-02", "entry")
+        self.assertDictEqual(fields, {"grimoire_creation_date": "2018-01-02T00:00:00",
+                                      "is_rss_entry": 1})
+        self.assertEqual(enrich.get_connector_name(), 'rss')
+        mock_get_name.assert_called_once_with(RSSEnrich)
+
+    def test_metadata(self):
+        """Test whether metadata fields are added to the enriched items"""
+
+        enrich = RSSEnrich()
+        eitem = metadata(lambda self, item: dict(item))(enrich, {"uuid": "1"})
+        self.assertEqual(eitem['metadata__gelk_version'], enrich.gelk_version)
+        self.assertEqual(eitem['metadata__gelk_backend_name'], 'RSSEnrich')
+        self.assertIn('metadata__enriched_on', eitem)
+        self.assertNotIn('metadata__enriched_on', enrich.metadata_fields)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -21,6 +21,7 @@
 #     Jesus M. Gonzalez-Barahona <jgb@bitergia.com>
 #
 
+import json
 import logging
 import sys
 import unittest
@@ -98,6 +99,33 @@ class TestElasticSearch(unittest.TestCase):
         with self.assertRaises(ElasticConnectException):
             major = ElasticSearch._check_instance(self.url_es6_err, False)
 
+    def test_bulk_update(self):
+        """Test whether bulk_update sends partial documents"""
+
+        index_url = self.url_es6 + '/test'
+        bulk_url = index_url + '/items/_bulk'
+        bulk_res = {
+            "errors": False,
+            "items": [{"update": {"_id": "1", "status": 200}},
+                      {"update": {"_id": "2", "status": 200}}]
+        }
+
+        httpretty.register_uri(httpretty.GET, index_url, body="{}")
+        httpretty.register_uri(httpretty.PUT, bulk_url, body=json.dumps(bulk_res))
+
+        elastic = ElasticSearch(self.url_es6, 'test')
+        items = [{"uuid": "1", "author_name": "John"},
+                 {"uuid": "2", "author_name": "Jane"}]
+        updated = elastic.bulk_update(items, "uuid")
+        self.assertEqual(updated, 2)
+
+        lines = httpretty.last_request().body.decode('utf-8').splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertDictEqual(json.loads(lines[0]), {"update": {"_id": "1"}})
+        self.assertDictEqual(json.loads(lines[1]), {"doc": items[0]})
+        self.assertDictEqual(json.loads(lines[2]), {"update": {"_id": "2"}})
+        self.assertDictEqual(json.loads(lines[3]), {"doc": items[1]})
+
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+import json
+import sys
+import unittest
+
+from unittest.mock import MagicMock, patch
+
+import httpretty
+
+# Make sure we use our code and not any other could we have installed
+sys.path.insert(0, '..')
+
+from grimoire_elk.enriched.git import GitEnrich
+
+
+INDEX_URL = "http://localhost:9200/git_enrich"
+
+COMMITS = [
+    {"_id": "c1", "_source": {"Author": "A"}},
+    {"_id": "c2", "_source": {"Author": "B"}},
+    {"_id": "c3", "_source": {"Author": "A"}}
+]
+
+
+def composite_page(buckets, after_key=None):
+    agg = {"buckets": buckets}
+    if after_key:
+        agg["after_key"] = after_key
+    return json.dumps({"aggregations": {"author": agg}})
+
+
+class TestGitDemography(unittest.TestCase):
+    """Unit tests for the demography study of git"""
+
+    def setUp(self):
+        self.enrich = GitEnrich()
+        self.enrich.elastic = MagicMock()
+        self.enrich.elastic.major = '6'
+        self.enrich.elastic.url = "http://localhost:9200"
+        self.enrich.elastic.index = "git_enrich"
+        self.enrich.elastic.index_url = INDEX_URL
+        self.enrich.elastic.max_items_bulk = 1000
+        self.enrich.elastic.max_items_clause = 1000
+        self.enrich.elastic.get_last_date.return_value = None
+        self.enrich.elastic.bulk_update.side_effect = lambda items, field_id: len(items)
+
+    @httpretty.activate
+    @patch('grimoire_elk.enriched.git.time.sleep')
+    @patch('grimoire_elk.enriched.git.helpers.scan')
+    def test_composite(self, mock_scan, mock_sleep):
+        """Test whether authors dates are paginated and written as partial updates"""
+
+        queries = []
+        pages = [
+            # Authors with new commits
+            composite_page([{"key": {"author": "A"},
+                             "min": {"value_as_string": "2004-01-01T00:00:00.000Z"},
+                             "max": {"value_as_string": "2005-01-01T00:00:00.000Z"}}]),
+            composite_page([{"key": {"author": "B"},
+                             "min": {"value_as_string": "2003-01-01T00:00:00.000Z"},
+                             "max": {"value_as_string": "2003-01-01T00:00:00.000Z"}}]),
+            composite_page([]),
+            # Dates of these authors from all their commits
+            composite_page([{"key": {"author": "A"},
+                             "min": {"value_as_string": "2001-01-01T00:00:00.000Z"},
+                             "max": {"value_as_string": "2005-01-01T00:00:00.000Z"}},
+                            {"key": {"author": "B"},
+                             "min": {"value_as_string": "2002-01-01T00:00:00.000Z"},
+                             "max": {"value_as_string": "2003-01-01T00:00:00.000Z"}}]),
+            composite_page([])
+        ]
+
+        def search_callback(request, uri, headers):
+            queries.append(json.loads(request.body.decode('utf-8')))
+            return 200, headers, pages[len(queries) - 1]
+
+        httpretty.register_uri(httpretty.GET, "http://localhost:9200/",
+                               body=json.dumps({"version": {"number": "6.1.0"}}))
+        httpretty.register_uri(httpretty.POST, INDEX_URL + "/_search", body=search_callback)
+        mock_scan.return_value = iter(COMMITS)
+
+        self.enrich.enrich_demography(None)
+
+        # ES 6.1 doesn't return after_key, the last bucket key is used
+        self.assertEqual(len(queries), 5)
+        self.assertNotIn("after", queries[0]["aggs"]["author"]["composite"])
+        self.assertDictEqual(queries[1]["aggs"]["author"]["composite"]["after"], {"author": "A"})
+        self.assertDictEqual(queries[2]["aggs"]["author"]["composite"]["after"], {"author": "B"})
+        self.assertDictEqual(queries[4]["aggs"]["author"]["composite"]["after"], {"author": "B"})
+        self.assertDictEqual(queries[3]["query"]["bool"]["must"][1], {"terms": {"Author": ["A", "B"]}})
+
+        # All the commits of the authors are updated, not only the new ones
+        _, kwargs = mock_scan.call_args
+        self.assertDictEqual(kwargs['query'], {"query": {"bool": {"must": [{"terms": {"Author": ["A", "B"]}}]}}})
+
+        self.enrich.elastic.bulk_update.assert_called_once_with([
+            {"author_max_date": "2005-01-01T00:00:00.000Z",
+             "author_min_date": "2001-01-01T00:00:00.000Z", "_item_id": "c1"},
+            {"author_max_date": "2003-01-01T00:00:00.000Z",
+             "author_min_date": "2002-01-01T00:00:00.000Z", "_item_id": "c2"},
+            {"author_max_date": "2005-01-01T00:00:00.000Z",
+             "author_min_date": "2001-01-01T00:00:00.000Z", "_item_id": "c3"}
+        ], "_item_id")
+
+    @httpretty.activate
+    @patch('grimoire_elk.enriched.git.time.sleep')
+    @patch('grimoire_elk.enriched.git.helpers.scan')
+    def test_scan(self, mock_scan, mock_sleep):
+        """Test whether authors dates are computed reading the commits without composite aggregations"""
+
+        # ES 6.0 doesn't support composite aggregations
+        httpretty.register_uri(httpretty.GET, "http://localhost:9200/",
+                               body=json.dumps({"version": {"number": "6.0.1"}}))
+
+        new_dates = [
+            {"_id": "c3", "_source": {"Author": "A", "utc_commit": "2003-01-01T00:00:00"}},
+            {"_id": "c2", "_source": {"Author": "B", "utc_commit": "2002-01-01T00:00:00"}}
+        ]
+        dates = [
+            {"_id": "c1", "_source": {"Author": "A", "utc_commit": "2001-01-01T00:00:00"}},
+            {"_id": "c3", "_source": {"Author": "A", "utc_commit": "2003-01-01T00:00:00"}},
+            {"_id": "c2", "_source": {"Author": "B", "utc_commit": "2002-01-01T00:00:00"}}
+        ]
+        mock_scan.side_effect = [iter(new_dates), iter(dates), iter(COMMITS)]
+
+        self.enrich.enrich_demography(None)
+
+        self.enrich.elastic.bulk_update.assert_called_once_with([
+            {"author_max_date": "2003-01-01T00:00:00",
+             "author_min_date": "2001-01-01T00:00:00", "_item_id": "c1"},
+            {"author_max_date": "2002-01-01T00:00:00",
+             "author_min_date": "2002-01-01T00:00:00", "_item_id": "c2"},
+            {"author_max_date": "2003-01-01T00:00:00",
+             "author_min_date": "2001-01-01T00:00:00", "_item_id": "c3"}
+        ], "_item_id")
+
+    @patch('grimoire_elk.enriched.git.time.sleep')
+    @patch('grimoire_elk.enriched.git.helpers.scan')
+    def test_scan_es5(self, mock_scan, mock_sleep):
+        """Test whether ES 5 reads the commits without asking for the version"""
+
+        self.enrich.elastic.major = '5'
+        self.enrich.requests = MagicMock()
+        mock_scan.side_effect = [iter([]), iter([])]
+
+        self.enrich.enrich_demography(None)
+
+        self.assertEqual(self.enrich.requests.get.call_count, 0)
+        self.assertEqual(self.enrich.elastic.bulk_update.call_count, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
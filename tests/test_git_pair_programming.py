@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+import copy
+import json
+import sys
+import unittest
+
+from unittest.mock import MagicMock
+
+# Make sure we use our code and not any other could we have installed
+sys.path.insert(0, '..')
+
+from grimoire_elk.enriched.git import GitEnrich
+
+
+def read_commit():
+    with open("data/git.json") as f:
+        commit = json.load(f)[0]
+
+    commit['data']['Author'] = "John Smith and Jane Doe <pair@example.com>"
+    commit['data']['Signed-off-by'] = ["Linus <linus@example.org>",
+                                       "Greg <greg@example.com>"]
+    return commit
+
+
+class TestGitPairProgramming(unittest.TestCase):
+    """Unit tests for the commits generated with pair programming"""
+
+    def test_derived_commits(self):
+        """Test whether commits of other authors match a full enrichment"""
+
+        enrich = GitEnrich(pair_programming=True)
+        enrich.elastic = MagicMock()
+        enrich.elastic.index_url = "http://localhost:9200/git_enrich"
+        enrich.elastic.max_items_bulk = 1000
+        bulks = []
+        enrich.elastic.safe_put_bulk.side_effect = \
+            lambda url, bulk_json: bulks.append(bulk_json) or bulk_json.count('\n') // 2
+
+        ocean_backend = MagicMock()
+        ocean_backend.fetch.return_value = iter([read_commit()])
+
+        total = enrich.enrich_items(ocean_backend)
+        self.assertEqual(total, 4)
+
+        lines = bulks[0].strip().split('\n')
+        ids = [json.loads(line)['index']['_id'] for line in lines[0::2]]
+        eitems = [json.loads(line) for line in lines[1::2]]
+        uuid = eitems[0]['uuid']
+        self.assertListEqual(ids, [uuid, uuid + "_0"] + [uuid + "_%i" % i for i in range(2)])
+
+        for eitem in eitems[1:]:
+            self.assertEqual(eitem['git_uuid'], ids[eitems.index(eitem)])
+
+        # Enrich each author commit from scratch to compare
+        commit = read_commit()
+        commit['data']['authors'] = eitems[0]['authors']
+        commit['data']['Author'] = eitems[0]['authors'][0]
+        commit['data']['authors_signed_off'] = eitems[0]['authors_signed_off']
+        for eitem in eitems[1:]:
+            commit['data']['Author'] = eitem['Author']
+            if eitem['is_git_commit_multi_author']:
+                commit['data']['is_git_commit_multi_author'] = 1
+            if eitem['is_git_commit_signed_off']:
+                commit['data']['is_git_commit_signed_off'] = 1
+            expected = enrich.get_rich_item(copy.deepcopy(commit))
+            expected['git_uuid'] = eitem['git_uuid']
+            for field in ['metadata__enriched_on']:
+                expected.pop(field)
+                eitem.pop(field)
+            self.assertDictEqual(eitem, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest.mock import MagicMock, patch
+
+# Make sure we use our code and not any other could we have installed
+sys.path.insert(0, '..')
+
+from grimoire_elk.enriched.git import GitEnrich
+from grimoire_elk.enriched.github_logins import (GitHubLoginResolver,
+                                                 GitHubLoginsCache,
+                                                 GitHubTokens)
+
+
+COMMITS = {
+    "/repos/owner/repo/commits/c1": {"author": {"login": "alice"}, "committer": {"login": "bob"}},
+    "/repos/owner/repo/commits/c2": {"author": None, "committer": {"login": "bob"}}
+}
+
+ERRORS = {
+    "/repos/owner/repo/commits/c5": 500,
+    "/repos/owner/repo/commits/c6": 422
+}
+
+
+class GitHubHandler(BaseHTTPRequestHandler):
+    """Local stand-in for the GitHub commits API"""
+
+    requests = []
+
+    def do_GET(self):
+        self.requests.append((self.path, self.headers['Authorization']))
+        commit = COMMITS.get(self.path)
+        if self.path in ERRORS:
+            self.send_response(ERRORS[self.path])
+        else:
+            self.send_response(200 if commit else 404)
+        self.send_header('X-RateLimit-Remaining', '4000')
+        self.send_header('X-RateLimit-Reset', str(int(time.time()) + 3600))
+        self.end_headers()
+        if commit:
+            self.wfile.write(json.dumps(commit).encode('utf-8'))
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestGitHubLoginResolver(unittest.TestCase):
+    """Unit tests for GitHubLoginResolver using a local GitHub API"""
+
+    def setUp(self):
+        GitHubHandler.requests = []
+        self.server = HTTPServer(('localhost', 0), GitHubHandler)
+        self.api_url = "http://localhost:%i" % self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.tmp_dir, 'logins.sqlite')
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def test_get_login(self):
+        """Test whether logins are retrieved and cached, including negative results"""
+
+        resolver = GitHubLoginResolver(['token1'], GitHubLoginsCache(self.cache_path),
+                                       api_url=self.api_url)
+        resolver.prefetch([("Alice <alice@example.com>", "author", "c1", "owner/repo"),
+                           ("Bob <bob@example.com>", "committer", "c1", "owner/repo"),
+                           ("Nobody <nobody@example.com>", "author", "c3", "owner/repo")])
+
+        self.assertEqual(resolver.get_login("Alice <alice@example.com>", "author", "c1", "owner/repo"), "alice")
+        self.assertEqual(resolver.get_login("Bob <bob@example.com>", "committer", "c1", "owner/repo"), "bob")
+        self.assertIsNone(resolver.get_login("Nobody <nobody@example.com>", "author", "c3", "owner/repo"))
+        resolver.close()
+        self.assertEqual(len(GitHubHandler.requests), 3)
+        self.assertEqual(GitHubHandler.requests[0][1], "token token1")
+        self.assertEqual(resolver.tokens.rates['token1'][0], 4000)
+
+        # A new resolver reuses the logins of the previous run
+        resolver = GitHubLoginResolver(['token1'], GitHubLoginsCache(self.cache_path),
+                                       api_url=self.api_url)
+        self.assertEqual(resolver.get_login("Alice <alice@example.com>", "author", "c1", "owner/repo"), "alice")
+        self.assertIsNone(resolver.get_login("Nobody <nobody@example.com>", "author", "c3", "owner/repo"))
+        resolver.close()
+        self.assertEqual(len(GitHubHandler.requests), 3)
+
+    def test_negative_ttl(self):
+        """Test whether expired negative results are requested again"""
+
+        cache = GitHubLoginsCache(negative_ttl=0)
+        resolver = GitHubLoginResolver(['token1'], cache, api_url=self.api_url)
+        resolver.get_login("Nobody <nobody@example.com>", "author", "c2", "owner/repo")
+        time.sleep(0.01)
+        resolver.get_login("Nobody <nobody@example.com>", "author", "c2", "owner/repo")
+        resolver.close()
+
+        self.assertEqual(len(GitHubHandler.requests), 2)
+
+    def test_errors_not_cached(self):
+        """Test whether users of failed requests are requested again"""
+
+        resolver = GitHubLoginResolver(['token1'], api_url=self.api_url)
+        for commit in ["c5", "c6"]:
+            user = "User %s <%s@example.com>" % (commit, commit)
+            self.assertIsNone(resolver.get_login(user, "author", commit, "owner/repo"))
+            self.assertFalse(resolver.is_resolved(user))
+            resolver.get_login(user, "author", commit, "owner/repo")
+
+        self.assertIsNone(resolver.get_login("Nobody <nobody@example.com>", "author", "c3", "owner/repo"))
+        self.assertTrue(resolver.is_resolved("Nobody <nobody@example.com>"))
+        resolver.close()
+
+        self.assertEqual(len(GitHubHandler.requests), 5)
+
+
+class TestGitEnrichGitHubLogins(unittest.TestCase):
+    """Unit tests for the GitHub logins of the git enricher"""
+
+    ITEMS = [
+        {"origin": "https://github.com/owner/repo", "data": {
+            "commit": "c1", "Author": "Alice <alice@example.com>", "Commit": "Bob <bob@example.com>"}},
+        {"origin": "https://git.example.com/repo", "data": {
+            "commit": "c9", "Author": "Carol <carol@example.com>", "Commit": "Carol <carol@example.com>"}}
+    ]
+
+    @patch('grimoire_elk.enriched.git.SortingHat')
+    def test_prepare_identities(self, mock_sh):
+        """Test whether users already in SortingHat are not requested to GitHub"""
+
+        def github_identity(db, identity, source):
+            if identity['email'] == 'alice@example.com':
+                return {'name': 'Alice', 'email': 'alice@example.com', 'username': 'alice'}
+            return None
+
+        mock_sh.get_github_commit_username.side_effect = github_identity
+
+        enrich = GitEnrich()
+        enrich.sh_db = MagicMock()
+        enrich.set_github_token('token1')
+        enrich.github_resolver = MagicMock()
+
+        enrich.prepare_identities(self.ITEMS)
+
+        enrich.github_resolver.prefetch.assert_called_once_with([
+            ("Bob <bob@example.com>", "committer", "c1", "owner/repo")
+        ])
+        self.assertDictEqual(enrich.github_logins, {"Alice <alice@example.com>": "alice"})
+
+        # SortingHat is asked once per user, also for the users not found
+        enrich.prepare_identities(self.ITEMS)
+        self.assertEqual(mock_sh.get_github_commit_username.call_count, 2)
+
+        resolver = enrich.github_resolver
+        enrich.close_github_resolver()
+        resolver.close.assert_called_once_with()
+        self.assertIsNone(enrich.github_resolver)
+
+
+class TestGitHubTokens(unittest.TestCase):
+    """Unit tests for GitHubTokens"""
+
+    def test_acquire(self):
+        """Test whether the token with more pending requests is used"""
+
+        reset = str(int(time.time()) + 3600)
+        tokens = GitHubTokens(['token1', 'token2'], min_rate_to_sleep=10)
+        tokens.update('token1', {'X-RateLimit-Remaining': '5', 'X-RateLimit-Reset': reset})
+        tokens.update('token2', {'X-RateLimit-Remaining': '500', 'X-RateLimit-Reset': reset})
+
+        self.assertEqual(tokens.acquire(), 'token2')
+        self.assertEqual(tokens.rates['token2'][0], 499)
+
+    def test_acquire_reset(self):
+        """Test whether it waits until the rate limit is reset"""
+
+        tokens = GitHubTokens(['token1'], min_rate_to_sleep=10)
+        tokens.update('token1', {'X-RateLimit-Remaining': '0',
+                                 'X-RateLimit-Reset': str(int(time.time()))})
+
+        self.assertEqual(tokens.acquire(), 'token1')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+from unittest.mock import MagicMock, patch
+
+# Make sure we use our code and not any other could we have installed
+sys.path.insert(0, '..')
+sys.path.insert(0, '../utils')
+
+import index_mapping
+from index_mapping import Checkpoint, IndexCopy, Throttle
+
+
+def response(data):
+    res = MagicMock()
+    res.json.return_value = data
+    return res
+
+
+class StubElasticIn:
+    """Input index answering sliced and sorted scroll searches over docs"""
+
+    def __init__(self, docs, extra_total=0):
+        self.url = "http://in"
+        self.index_url = self.url + "/in_index"
+        self.requests = self
+        self.docs = docs
+        self.extra_total = extra_total  # items in the index not returned
+        self.scrolls = {}
+        self.searches = []
+
+    def post(self, url, data=None, headers=None):
+        query = json.loads(data)
+        if url.endswith("/_search/scroll"):
+            hits, size, pos = self.scrolls[query['scroll_id']]
+            self.scrolls[query['scroll_id']] = (hits, size, pos + size)
+            return response({"_scroll_id": query['scroll_id'],
+                             "hits": {"total": len(hits), "hits": hits[pos + size:pos + 2 * size]}})
+
+        self.searches.append(query)
+        docs = self.docs
+        if 'slice' in query:
+            docs = [doc for doc in docs if int(doc['uuid']) % query['slice']['max'] == query['slice']['id']]
+        for clause in query['query']['bool']['must']:
+            after = clause['range']['uuid']['gt']
+            docs = [doc for doc in docs if doc['uuid'] > after]
+        if query['sort'] != ["_doc"]:
+            docs = sorted(docs, key=lambda doc: doc['uuid'])
+
+        hits = [{"_id": doc['uuid'], "_source": dict(doc)} for doc in docs]
+        scroll_id = str(len(self.scrolls))
+        self.scrolls[scroll_id] = (hits, query['size'], 0)
+        return response({"_scroll_id": scroll_id,
+                         "hits": {"total": {"value": len(hits) + self.extra_total}, "hits": hits[:query['size']]}})
+
+    def delete(self, url, data=None, headers=None):
+        return response({"succeeded": True})
+
+
+class StubElasticOut:
+    """Output index storing the ids written, with an optional hook per bulk"""
+
+    def __init__(self, on_bulk=None):
+        self.index_url = "http://out/out_index"
+        self.requests = MagicMock()
+        self.on_bulk = on_bulk
+        self.written = []
+        self.lock = threading.Lock()
+
+    def safe_put_bulk(self, url, bulk_json, refresh=True):
+        lines = bulk_json.splitlines()
+        ids = [json.loads(line)['index']['_id'] for line in lines[::2]]
+        inserted = len(ids)
+        if self.on_bulk:
+            inserted = self.on_bulk(ids)
+        with self.lock:
+            self.written.extend(ids[:inserted])
+        return inserted
+
+
+def docs(total):
+    return [{"uuid": "%04i" % i, "origin": "o"} for i in range(total)]
+
+
+class TestIndexCopy(unittest.TestCase):
+    """Unit tests for the parallel copy of indexes"""
+
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp(prefix='gelk_')
+        self.checkpoint_path = os.path.join(self.tmp_path, 'checkpoint.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def index_copy(self, elastic_in, elastic_out, slices=1, writers=1, limit=2):
+        return IndexCopy(elastic_in, elastic_out, MagicMock(), 'uuid', slices=slices, writers=writers,
+                         checkpoint_path=self.checkpoint_path, limit=limit)
+
+    def test_copy(self):
+        """Test whether all the slices are copied and verified"""
+
+        elastic_in = StubElasticIn(docs(10))
+        elastic_out = StubElasticOut()
+
+        self.assertTrue(self.index_copy(elastic_in, elastic_out, slices=3, writers=2).copy())
+        self.assertListEqual(sorted(elastic_out.written), [doc['uuid'] for doc in docs(10)])
+
+        with open(self.checkpoint_path) as fd:
+            state = json.load(fd)
+        self.assertEqual(state['copy'], "http://in/in_index -> http://out/out_index (3 slices)")
+        self.assertDictEqual(state['slices']['0'], {'last': '0009', 'copied': 4, 'done': True})
+
+    def test_checkpoint_resume(self):
+        """Test whether a copy is resumed after the last id copied of each slice"""
+
+        elastic_in = StubElasticIn(docs(10))
+        elastic_out = StubElasticOut()
+        copy_id = "http://in/in_index -> http://out/out_index (1 slices)"
+        with open(self.checkpoint_path, 'w') as fd:
+            json.dump({'copy': copy_id, 'slices': {'0': {'last': '0005', 'copied': 6, 'done': False}}}, fd)
+
+        self.assertTrue(self.index_copy(elastic_in, elastic_out).copy())
+        self.assertListEqual(elastic_out.written, ['0006', '0007', '0008', '0009'])
+        self.assertDictEqual(Checkpoint(self.checkpoint_path, copy_id).get(0),
+                             {'last': '0009', 'copied': 10, 'done': True})
+
+        # Slices already copied are not read again
+        elastic_in.searches = []
+        self.assertTrue(self.index_copy(elastic_in, StubElasticOut()).copy())
+        self.assertEqual(len(elastic_in.searches), 1)  # only the count of the verification
+
+    def test_checkpoint_other_copy(self):
+        """Test whether the copy stops if the checkpoint is from other copy"""
+
+        with open(self.checkpoint_path, 'w') as fd:
+            json.dump({'copy': "http://in/other -> http://out/out_index (1 slices)", 'slices': {}}, fd)
+
+        with self.assertRaises(SystemExit) as ctx:
+            self.index_copy(StubElasticIn(docs(10)), StubElasticOut())
+        self.assertEqual(ctx.exception.code, 1)
+
+    def test_copy_slice_failed_write(self):
+        """Test whether the checkpoint only moves forward when the previous pages are written"""
+
+        later_written = threading.Event()
+
+        def on_bulk(ids):
+            if ids[0] == '0002':
+                # Fail once the pages read after it are written
+                later_written.wait(5)
+                return len(ids) - 1
+            if ids[0] == '0006':
+                later_written.set()
+            return len(ids)
+
+        elastic_in = StubElasticIn(docs(10))
+        elastic_out = StubElasticOut(on_bulk)
+        index_copy = self.index_copy(elastic_in, elastic_out, writers=3)
+
+        self.assertFalse(index_copy.copy())
+        self.assertIn('0006', elastic_out.written)
+        self.assertDictEqual(index_copy.checkpoint.get(0), {'last': '0001', 'copied': 2, 'done': False})
+
+        # The copy is resumed from the page not written
+        elastic_out = StubElasticOut()
+        self.assertTrue(self.index_copy(elastic_in, elastic_out).copy())
+        self.assertListEqual(elastic_out.written, ['%04i' % i for i in range(2, 10)])
+
+    def test_verify_mismatch(self):
+        """Test whether the copy fails if the items copied are not the ones in the index"""
+
+        elastic_in = StubElasticIn(docs(10), extra_total=1)
+        elastic_out = StubElasticOut()
+
+        self.assertFalse(self.index_copy(elastic_in, elastic_out, slices=2).copy())
+        self.assertEqual(len(elastic_out.written), 10)
+
+    @patch('index_mapping.export_items', return_value=False)
+    @patch('index_mapping.get_params')
+    def test_main_verify_mismatch(self, mock_params, mock_export):
+        """Test whether the tool exits with status 1 if the copy is not verified"""
+
+        mock_params.return_value = MagicMock(debug=False, limit=10)
+
+        with self.assertRaises(SystemExit) as ctx:
+            index_mapping.main()
+        self.assertEqual(ctx.exception.code, 1)
+
+        mock_export.return_value = True
+        index_mapping.main()
+
+
+class TestThrottle(unittest.TestCase):
+    """Unit tests for the items per second limit"""
+
+    def setUp(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def test_pacing(self):
+        """Test whether items are paced to the items per second"""
+
+        with patch('index_mapping.time.time', side_effect=lambda: self.now), \
+                patch('index_mapping.time.sleep', side_effect=self.sleep):
+            throttle = Throttle(items_sec=100)
+            throttle.wait(50)
+            throttle.wait(50)
+            throttle.wait(100)
+            self.assertListEqual(self.sleeps, [0.5, 0.5])
+
+            # Time spent out of the throttle counts
+            self.now += 5
+            throttle.wait(100)
+            self.assertListEqual(self.sleeps, [0.5, 0.5])
+
+    def test_no_limit(self):
+        """Test whether items are not paced without a limit"""
+
+        with patch('index_mapping.time.sleep', side_effect=self.sleep):
+            throttle = Throttle()
+            for _ in range(10):
+                throttle.wait(1000)
+        self.assertListEqual(self.sleeps, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
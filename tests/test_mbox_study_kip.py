@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+import sys
+import unittest
+
+from unittest.mock import MagicMock
+
+# Make sure we use our code and not any other could we have installed
+sys.path.insert(0, '..')
+
+from grimoire_elk.enriched.mbox_study_kip import kafka_kip
+
+
+MESSAGES = [
+    {"uuid": "1", "Subject": "[DISCUSS] KIP-10: New feature", "email_date": "2018-01-01T00:00:00+00:00"},
+    {"uuid": "2", "Subject": "Re: [DISCUSS] KIP-10: New feature", "email_date": "2018-01-05T00:00:00+00:00"},
+    {"uuid": "3", "Subject": "[VOTE] KIP-10: New feature", "email_date": "2018-01-10T00:00:00+00:00",
+     "body_extract": "+1 (binding)"},
+    {"uuid": "4", "Subject": "Re: [VOTE] KIP-10: New feature", "email_date": "2018-01-11T00:00:00+00:00",
+     "body_extract": "+1"},
+    {"uuid": "5", "Subject": "Re: [VOTE] KIP-10: New feature", "email_date": "2018-01-12T00:00:00+00:00",
+     "body_extract": "+1 binding"},
+    {"uuid": "6", "Subject": "[DISCUSS] KIP 20 Other feature", "email_date": "2018-02-01T00:00:00+00:00"},
+    {"uuid": "7", "Subject": "Create a space template for KIP", "email_date": "2018-02-01T00:00:00+00:00"}
+]
+
+
+class TestKafkaKip(unittest.TestCase):
+    """Unit tests for the Kafka KIP study"""
+
+    def test_kafka_kip(self):
+        """Test whether KIP messages are read once and only kip fields are updated"""
+
+        enrich = MagicMock()
+        enrich.get_field_unique_id.return_value = "uuid"
+        enrich.fetch.side_effect = lambda _filter, _source: iter([dict(message) for message in MESSAGES])
+        updates = []
+        enrich.elastic.bulk_update.side_effect = lambda eitems, field_id: updates.extend(eitems)
+
+        kafka_kip(enrich)
+
+        enrich.fetch.assert_called_once_with({"name": "Subject", "value": "*KIP*", "type": "wildcard"},
+                                             _source=["uuid", "Subject", "email_date", "body_extract"])
+        self.assertEqual(enrich.elastic.bulk_update.call_count, 1)
+        args, _ = enrich.elastic.bulk_update.call_args
+        self.assertEqual(args[1], "uuid")
+
+        # The eitems sent are a generator, consumed by the bulk_update side effect
+        updates = {eitem["uuid"]: eitem for eitem in updates}
+        self.assertListEqual(sorted(updates), ["1", "2", "3", "4", "5", "6"])
+        for eitem in updates.values():
+            self.assertTrue(all(field == "uuid" or field.startswith("kip") for field in eitem))
+
+        self.assertEqual(updates["1"]["kip"], 10)
+        self.assertEqual(updates["1"]["kip_start_end"], "discuss_start")
+        self.assertEqual(updates["2"]["kip_start_end"], "discuss_end")
+        self.assertEqual(updates["2"]["kip_discuss_time_days"], 4)
+        self.assertEqual(updates["3"]["kip_start_end"], "voting_start")
+        self.assertEqual(updates["5"]["kip_start_end"], "voting_end")
+        self.assertEqual(updates["4"]["kip_binding"], 1)
+        self.assertEqual(updates["5"]["kip_result"], 1)
+        self.assertEqual(updates["5"]["kip_status"], "adopted")
+        for uuid in ["1", "2", "3", "4", "5"]:
+            self.assertEqual(updates[uuid]["kip_final_status"], "adopted")
+
+        self.assertEqual(updates["6"]["kip"], 20)
+        self.assertEqual(updates["6"]["kip_status"], "inactive")
+        self.assertEqual(updates["6"]["kip_final_status"], None)
+
+
+if __name__ == '__main__':
+    unittest.main()
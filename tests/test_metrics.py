@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# Make sure we use our code and not any other could we have installed
+sys.path.insert(0, '..')
+
+from grimoire_elk.metrics import Metrics, metrics, timed
+
+
+class TestMetrics(unittest.TestCase):
+    """Unit tests for the metrics of the stages of a run"""
+
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp(prefix='gelk_metrics_')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def test_stages(self):
+        """Test whether the runs of a stage are accumulated"""
+
+        stats = Metrics()
+        stats.add('es_bulk', 1.5, items=10, nbytes=100)
+        with stats.timer('es_bulk') as timing:
+            timing.items = 5
+            timing.nbytes = 50
+
+        summary = stats.summary()['stages']['es_bulk']
+        self.assertEqual(summary['calls'], 2)
+        self.assertEqual(summary['items'], 15)
+        self.assertEqual(summary['bytes'], 150)
+        self.assertGreaterEqual(summary['time'], 1.5)
+
+    def test_latencies(self):
+        """Test whether latencies are added to cumulative buckets"""
+
+        stats = Metrics(buckets=(0.1, 1))
+        for seconds in [0.05, 0.5, 0.7, 5]:
+            stats.observe('es', seconds)
+
+        latency = stats.summary()['latencies']['es']
+        self.assertEqual(latency['count'], 4)
+        self.assertAlmostEqual(latency['sum'], 6.25)
+        self.assertListEqual(latency['buckets'], [['0.1', 1], ['1', 3], ['+Inf', 4]])
+
+    def test_latencies_buckets_order(self):
+        """Test whether buckets are kept in increasing bound order"""
+
+        stats = Metrics(buckets=(10, 0.5, 2, 0.1))
+        stats.observe('es', 1)
+
+        buckets = stats.summary()['latencies']['es']['buckets']
+        self.assertListEqual(buckets, [['0.1', 0], ['0.5', 0], ['2', 1], ['10', 1], ['+Inf', 1]])
+
+    def test_timed(self):
+        """Test whether the calls of a decorated function are timed, even if they fail"""
+
+        metrics.reset()
+
+        @timed('sh_query', latency='sql')
+        def query(fail=False):
+            if fail:
+                raise RuntimeError
+            return 1
+
+        self.assertEqual(query(), 1)
+        with self.assertRaises(RuntimeError):
+            query(fail=True)
+
+        summary = metrics.summary()
+        self.assertEqual(summary['stages']['sh_query']['calls'], 2)
+        self.assertEqual(summary['latencies']['sql']['count'], 2)
+        metrics.reset()
+
+    def test_export(self):
+        """Test whether the summary is written in JSON and Prometheus formats"""
+
+        stats = Metrics(buckets=(1, 0.1))
+        stats.add('enrich', 2, items=10)
+        stats.observe('es', 0.5)
+
+        json_path = os.path.join(self.tmp_path, 'metrics.json')
+        stats.write_json(json_path)
+        with open(json_path) as fd:
+            self.assertDictEqual(json.load(fd), stats.summary())
+
+        prom_path = os.path.join(self.tmp_path, 'metrics.prom')
+        stats.write_prometheus(prom_path)
+        with open(prom_path) as fd:
+            lines = fd.read().splitlines()
+        self.assertIn('grimoire_elk_stage_seconds_total{stage="enrich"} 2', lines)
+        self.assertIn('grimoire_elk_stage_items_total{stage="enrich"} 10', lines)
+        buckets = [line for line in lines if line.startswith('grimoire_elk_latency_seconds_bucket')]
+        self.assertListEqual(buckets, ['grimoire_elk_latency_seconds_bucket{call="es",le="0.1"} 0',
+                                       'grimoire_elk_latency_seconds_bucket{call="es",le="1"} 1',
+                                       'grimoire_elk_latency_seconds_bucket{call="es",le="+Inf"} 1'])
+        self.assertIn('grimoire_elk_latency_seconds_count{call="es"} 1', lines)
+        self.assertFalse(os.path.exists(prom_path + '.tmp'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+import os
+import pstats
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+from unittest.mock import MagicMock
+
+# Make sure we use our code and not any other could we have installed
+sys.path.insert(0, '..')
+
+from grimoire_elk.elk import do_studies
+from grimoire_elk.profiling import Profiler, profiler
+
+
+def busy_function(seconds):
+    end = time.time() + seconds
+    while time.time() < end:
+        sum(range(1000))
+
+
+def build_large_list():
+    items = [{'id': i, 'title': 'item %i' % i} for i in range(50000)]
+    time.sleep(0.2)
+    return len(items)
+
+
+class TestProfiler(unittest.TestCase):
+    """Unit tests for the profiling of the stages of a run"""
+
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp(prefix='gelk_profile_')
+
+    def tearDown(self):
+        profiler.configure()
+        shutil.rmtree(self.tmp_path)
+
+    def test_disabled(self):
+        """Test whether nothing is written without a mode"""
+
+        with Profiler(directory=self.tmp_path).stage('enrich', 'git'):
+            busy_function(0.01)
+
+        self.assertListEqual(os.listdir(self.tmp_path), [])
+        with self.assertRaises(ValueError):
+            Profiler('unknown')
+
+    def test_cpu(self):
+        """Test whether a pstats file is written for each run of a stage"""
+
+        cpu_profiler = Profiler('cpu', self.tmp_path)
+        for _ in range(2):
+            with cpu_profiler.stage('enrich', 'git'):
+                busy_function(0.05)
+
+        self.assertListEqual(sorted(os.listdir(self.tmp_path)), ['enrich_git-2.pstats', 'enrich_git.pstats'])
+        stats = pstats.Stats(os.path.join(self.tmp_path, 'enrich_git.pstats'))
+        self.assertIn('busy_function', [func[2] for func in stats.stats])
+
+    def test_sample(self):
+        """Test whether the sampled stacks are written in collapsed format"""
+
+        with Profiler('sample', self.tmp_path).stage('feed', 'git'):
+            busy_function(0.2)
+
+        with open(os.path.join(self.tmp_path, 'feed_git.folded')) as fd:
+            lines = fd.read().splitlines()
+
+        self.assertGreater(len(lines), 0)
+        stack, count = lines[0].rsplit(' ', 1)
+        self.assertIn('busy_function (test_profiling.py', stack)
+        self.assertGreater(int(count), 0)
+
+    def test_memory(self):
+        """Test whether allocations freed before the end of the stage are reported"""
+
+        with Profiler('memory', self.tmp_path).stage('enrich', 'askbot'):
+            build_large_list()
+
+        with open(os.path.join(self.tmp_path, 'enrich_askbot.txt')) as fd:
+            report = fd.read()
+
+        self.assertTrue(report.startswith('Peak traced memory:'))
+        self.assertIn('build_large_list', report)
+
+    def test_studies(self):
+        """Test whether each study is profiled"""
+
+        def enrich_demography(enrich_backend, no_incremental):
+            busy_function(0.01)
+
+        def enrich_onion(enrich_backend, no_incremental):
+            busy_function(0.01)
+
+        enrich_backend = MagicMock()
+        enrich_backend.studies = [enrich_demography, enrich_onion]
+        enrich_backend.studies_deps = {}
+
+        profiler.configure('cpu', self.tmp_path)
+        do_studies(enrich_backend)
+
+        self.assertListEqual(sorted(os.listdir(self.tmp_path)),
+                             ['study_enrich_demography.pstats', 'study_enrich_onion.pstats'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+import sys
+import threading
+import unittest
+
+from unittest.mock import MagicMock
+
+# Make sure we use our code and not any other could we have installed
+sys.path.insert(0, '..')
+
+from grimoire_elk.raw.elastic import ElasticOcean
+
+
+class DropOcean(ElasticOcean):
+    """Ocean dropping the items with odd ids"""
+
+    def drop_item(self, item):
+        return item['id'] % 2 == 1
+
+
+def perceval_items(total, fail=False, fetched=None):
+    for i in range(total):
+        if fetched is not None:
+            fetched.append(i)
+        yield {"id": i, "uuid": str(i), "updated_on": 1514764800 + i, "timestamp": 1514764800}
+    if fail:
+        raise RuntimeError("upstream error")
+
+
+def mock_ocean(workers, ocean_class=ElasticOcean):
+    ocean = ocean_class(None)
+    ocean.feed_workers = workers
+    ocean.elastic = MagicMock()
+    ocean.elastic.max_items_bulk = 10
+    ocean.packs = []
+    ocean.serializers = set()
+    lock = threading.Lock()
+
+    def bulk_upload(items, field_id):
+        ocean.packs.append([item["id"] for item in items])
+        return len(items)
+
+    def bulk_body(items, field_id):
+        with lock:
+            ocean.serializers.add(threading.current_thread().name)
+        return [item["id"] for item in items]
+
+    def bulk_upload_body(bulk_json):
+        ocean.packs.append(bulk_json)
+        return len(bulk_json)
+
+    ocean.elastic.bulk_upload.side_effect = bulk_upload
+    ocean.elastic.bulk_body.side_effect = bulk_body
+    ocean.elastic.bulk_upload_body.side_effect = bulk_upload_body
+    return ocean
+
+
+class TestFeedItems(unittest.TestCase):
+    """Unit tests for feeding raw items to ES"""
+
+    def test_feed_sequential(self):
+        """Test whether items are uploaded in packs and dropped items are filtered"""
+
+        ocean = mock_ocean(0, DropOcean)
+        ocean.feed_items(perceval_items(45))
+
+        self.assertEqual(len(ocean.packs), 3)
+        self.assertListEqual(sum(ocean.packs, []), list(range(0, 45, 2)))
+
+    def test_feed_threaded(self):
+        """Test whether the same items are uploaded in order using several workers"""
+
+        ocean = mock_ocean(3, DropOcean)
+        ocean.project = "project"
+        items = list(perceval_items(45))
+        ocean.feed_items(iter(items))
+
+        self.assertEqual(len(ocean.packs), 3)
+        self.assertListEqual(sum(ocean.packs, []), list(range(0, 45, 2)))
+        self.assertNotIn(threading.current_thread().name, ocean.serializers)
+        self.assertEqual(ocean.elastic.bulk_upload.call_count, 0)
+        self.assertEqual(items[0]["project"], "project")
+        self.assertEqual(items[0]["metadata__updated_on"], "2018-01-01T00:00:00+00:00")
+
+    def test_feed_threaded_bounded(self):
+        """Test whether fetching waits for the uploads when the queue is full"""
+
+        ocean = mock_ocean(1)
+        fetched = []
+        uploading = threading.Event()
+        release = threading.Event()
+
+        def bulk_upload_body(bulk_json):
+            uploading.set()
+            release.wait(5)
+            return len(bulk_json)
+
+        ocean.elastic.bulk_upload_body.side_effect = bulk_upload_body
+        feeder = threading.Thread(target=ocean.feed_items, args=(perceval_items(100, fetched=fetched),))
+        feeder.start()
+
+        uploading.wait(5)
+        # One pack uploading, two in the queue and one being filled
+        feeder.join(0.5)
+        self.assertTrue(feeder.is_alive())
+        self.assertLessEqual(len(fetched), 41)
+
+        release.set()
+        feeder.join(5)
+        self.assertEqual(len(fetched), 100)
+        self.assertEqual(ocean.elastic.bulk_upload_body.call_count, 10)
+
+    def test_feed_threaded_upstream_error(self):
+        """Test whether fetching errors are raised once pending packs are uploaded"""
+
+        ocean = mock_ocean(2)
+
+        with self.assertRaisesRegex(RuntimeError, "upstream error"):
+            ocean.feed_items(perceval_items(25, fail=True))
+
+        self.assertListEqual(sum(ocean.packs, []), list(range(20)))
+
+    def test_feed_threaded_upload_error(self):
+        """Test whether uploading errors stop the fetching and are raised"""
+
+        ocean = mock_ocean(2)
+        ocean.elastic.bulk_upload_body.side_effect = ValueError("ES error")
+        fetched = []
+
+        with self.assertRaisesRegex(ValueError, "ES error"):
+            ocean.feed_items(perceval_items(1000, fetched=fetched))
+
+        self.assertLess(len(fetched), 1000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from unittest.mock import MagicMock
+
+# Make sure we use our code and not any other could we have installed
+sys.path.insert(0, '..')
+
+from grimoire_elk.raw.elastic import ElasticOcean
+from grimoire_elk.raw_store import RawStore, ReplayOceanBackend
+
+
+def raw_item(uuid, origin, timestamp, updated_on=None, **data):
+    return {"uuid": uuid, "origin": origin, "offset": int(uuid),
+            "metadata__timestamp": timestamp, "metadata__updated_on": updated_on or timestamp,
+            "data": data}
+
+
+ITEMS = [
+    raw_item("1", "https://github.com/org/repo1", "2018-01-10T00:00:00+00:00", product="a"),
+    raw_item("2", "https://github.com/org/repo1", "2018-01-20T00:00:00+00:00", product="b",
+             updated_on="2018-02-10T00:00:00+00:00"),
+    raw_item("3", "https://github.com/org/repo2", "2018-01-15T00:00:00+00:00", product="a"),
+    raw_item("4", "https://github.com/org/repo1", "2018-02-05T00:00:00+00:00", product="a",
+             updated_on="2018-01-05T00:00:00+00:00"),
+    raw_item("5", "https://github.com/org/repo1", "2018-02-06T00:00:00+00:00", product="a")
+]
+
+
+class TestRawStore(unittest.TestCase):
+    """Unit tests for the local raw store"""
+
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp(prefix='gelk_')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def test_segments(self):
+        """Test whether items are written in compressed segments partitioned by origin and month"""
+
+        store = RawStore(self.tmp_path, segment_items=1)
+        for item in ITEMS:
+            store.append(item)
+        store.flush()
+
+        self.assertListEqual(store.origins(), ["https://github.com/org/repo1", "https://github.com/org/repo2"])
+        partition = os.path.join(self.tmp_path, "https%3A%2F%2Fgithub.com%2Forg%2Frepo1", "2018-02")
+        segments = sorted(name for name in os.listdir(partition) if name.endswith(".ndjson.gz"))
+        self.assertEqual(len(segments), 2)
+
+        uuids_file = os.path.join(partition, segments[0].replace(".ndjson.gz", ".uuids"))
+        with open(uuids_file) as f:
+            self.assertEqual(f.read(), "4\n")
+
+    def test_read(self):
+        """Test whether items are read in the order they were stored, once in their last position"""
+
+        store = RawStore(self.tmp_path, segment_items=2)
+        for item in ITEMS[:3]:
+            store.append(item)
+        store.flush()
+
+        # A later feed writes new segments
+        store = RawStore(self.tmp_path)
+        for item in ITEMS[3:] + [dict(ITEMS[0], data={"product": "c"})]:
+            store.append(item)
+        store.flush()
+
+        items = list(store.read("https://github.com/org/repo1"))
+        self.assertListEqual([item["uuid"] for item in items], ["2", "1", "4", "5"])
+        self.assertEqual(items[1]["data"]["product"], "c")
+
+        items = list(store.read())
+        self.assertListEqual([item["uuid"] for item in items], ["2", "1", "4", "5", "3"])
+        self.assertListEqual(list(store.read("https://github.com/org/unknown")), [])
+
+    def test_read_without_uuids_files(self):
+        """Test whether items stored again are found in segments without uuids files"""
+
+        store = RawStore(self.tmp_path)
+        for item in ITEMS[:2] + [dict(ITEMS[0], data={"product": "c"})]:
+            store.append(item)
+        store.flush()
+
+        for root, _, names in os.walk(self.tmp_path):
+            for name in names:
+                if name.endswith(".uuids"):
+                    os.remove(os.path.join(root, name))
+
+        items = list(store.read())
+        self.assertListEqual([item["uuid"] for item in items], ["2", "1"])
+        self.assertEqual(items[1]["data"]["product"], "c")
+
+    def test_read_from_date(self):
+        """Test whether only the items retrieved since from_date are read"""
+
+        store = RawStore(self.tmp_path)
+        for item in ITEMS:
+            store.append(item)
+        store.flush()
+
+        from_date = datetime.datetime(2018, 1, 15)
+        items = list(store.read("https://github.com/org/repo1", from_date=from_date))
+        self.assertListEqual([item["uuid"] for item in items], ["2", "4", "5"])
+
+        # Any date field of the items can be used, reading all the partitions
+        from_date = datetime.datetime(2018, 2, 1)
+        items = list(store.read("https://github.com/org/repo1", from_date=from_date,
+                                date_field="metadata__updated_on"))
+        self.assertListEqual([item["uuid"] for item in items], ["2", "5"])
+
+    def test_clear(self):
+        """Test whether the items of an origin are removed"""
+
+        store = RawStore(self.tmp_path)
+        for item in ITEMS:
+            store.append(item)
+        store.flush()
+        store.append(ITEMS[0])
+
+        store.clear("https://github.com/org/repo1")
+        store.flush()
+
+        self.assertListEqual([item["uuid"] for item in store.read()], ["3"])
+
+        store.clear()
+        self.assertListEqual(list(store.read()), [])
+
+    def test_feed(self):
+        """Test whether the items fed to the raw index are also stored"""
+
+        ocean = ElasticOcean(None)
+        ocean.elastic = MagicMock()
+        ocean.elastic.max_items_bulk = 2
+        ocean.elastic.bulk_upload.side_effect = lambda items, field_id: len(items)
+        ocean.set_raw_store(RawStore(self.tmp_path))
+
+        items = [dict(item, updated_on=1514764800, timestamp=1514764800) for item in ITEMS[:2]]
+        ocean.feed_items(iter(items))
+
+        stored = list(RawStore(self.tmp_path).read())
+        self.assertListEqual([item["uuid"] for item in stored], ["1", "2"])
+        self.assertEqual(stored[0]["metadata__timestamp"], "2018-01-01T00:00:00+00:00")
+
+    def test_replay(self):
+        """Test whether the items of the ocean backend origin are replayed with its filters"""
+
+        store = RawStore(self.tmp_path)
+        for item in ITEMS:
+            store.append(item)
+        store.flush()
+
+        ocean_backend = MagicMock()
+        ocean_backend.perceval_backend.origin = "https://github.com/org/repo1"
+        ocean_backend.from_date = None
+        ocean_backend.offset = 2
+        ocean_backend.filter_raw = {"name": "data.product", "value": "a"}
+        ocean_backend.get_incremental_date.return_value = "metadata__updated_on"
+
+        replay = ReplayOceanBackend(ocean_backend, store)
+        self.assertListEqual([item["uuid"] for item in replay.fetch()], ["4", "5"])
+        self.assertIs(replay.elastic, ocean_backend.elastic)
+        self.assertEqual(ocean_backend.fetch.call_count, 0)
+
+        # from_date is compared with the incremental date and the offset is ignored
+        ocean_backend.from_date = datetime.datetime(2018, 2, 1)
+        ocean_backend.filter_raw = None
+        self.assertListEqual([item["uuid"] for item in replay.fetch()], ["2", "5"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+import json
+import sys
+import unittest
+
+import httpretty
+
+from unittest.mock import MagicMock, patch
+
+# Make sure we use our code and not any other could we have installed
+sys.path.insert(0, '..')
+
+from grimoire_elk.elk import (get_items_from_uuid,
+                              get_items_from_uuids,
+                              IdentitiesOceanBackend,
+                              refresh_identities,
+                              refresh_identities_incremental,
+                              SH_REFRESH_META)
+
+
+EITEMS = [
+    {"uuid": "1", "grimoire_creation_date": "2018-01-01T00:00:00",
+     "author_id": "id1", "author_uuid": "uuid1"},
+    {"uuid": "2", "grimoire_creation_date": "2018-01-02T00:00:00",
+     "author_id": "id2", "author_uuid": "uuid2"},
+    {"uuid": "3", "grimoire_creation_date": "2018-01-03T00:00:00",
+     "author_id": "id3", "author_uuid": "uuid3"}
+]
+
+
+def mock_enrich_backend(last_refresh=None):
+    """Enrich backend with the items in EITEMS in its enriched index"""
+
+    enrich_backend = MagicMock()
+    del enrich_backend.roles
+    enrich_backend.get_field_unique_id.return_value = "uuid"
+    enrich_backend.get_field_date.return_value = "grimoire_creation_date"
+    enrich_backend.get_field_author.return_value = "author"
+    enrich_backend.fetch.side_effect = lambda _filter, _source: iter(EITEMS)
+    enrich_backend.get_item_sh_from_id.side_effect = \
+        lambda eitem, roles: {"author_org_name": "org_" + eitem["author_id"]}
+    enrich_backend.elastic.max_items_clause = 1000
+    enrich_backend.elastic.max_items_terms = 65536
+
+    metadata = {SH_REFRESH_META: last_refresh} if last_refresh else {}
+    enrich_backend.elastic.get_metadata.return_value = metadata
+
+    return enrich_backend
+
+
+class TestRefreshIdentities(unittest.TestCase):
+    """Unit tests for identities refresh"""
+
+    def test_partial_items(self):
+        """Test whether only the identities fields are generated"""
+
+        enrich_backend = mock_enrich_backend()
+
+        eitems = list(refresh_identities(enrich_backend))
+        self.assertListEqual(eitems, [{"uuid": "1", "author_org_name": "org_id1"},
+                                      {"uuid": "2", "author_org_name": "org_id2"},
+                                      {"uuid": "3", "author_org_name": "org_id3"}])
+
+        _, kwargs = enrich_backend.fetch.call_args
+        self.assertListEqual(kwargs['_source'], ["uuid", "grimoire_creation_date",
+                                                 "author_id", "author_uuid"])
+
+    def test_incremental_no_previous_refresh(self):
+        """Test whether all the items are refreshed the first time"""
+
+        enrich_backend = mock_enrich_backend()
+
+        eitems = list(refresh_identities_incremental(enrich_backend))
+        self.assertEqual(len(eitems), 3)
+        enrich_backend.fetch.assert_called_with(None, _source=unittest.mock.ANY)
+
+    @patch('grimoire_elk.elk.SortingHat')
+    def test_incremental_filter(self, mock_sh):
+        """Test whether modified identities are filtered in Elasticsearch"""
+
+        mock_sh.get_modified_identities.return_value = (["uuid1"], ["id3"])
+
+        enrich_backend = mock_enrich_backend('2018-01-01T00:00:00')
+
+        list(refresh_identities_incremental(enrich_backend))
+
+        args, _ = enrich_backend.fetch.call_args
+        self.assertListEqual(args[0], [{"name": "author_uuid", "value": ["uuid1"]},
+                                       {"name": "author_id", "value": ["id3"]}])
+
+    @patch('grimoire_elk.elk.SortingHat')
+    def test_incremental_match(self, mock_sh):
+        """Test whether lots of modified identities are matched while reading"""
+
+        mock_sh.get_modified_identities.return_value = (["uuid1"], ["id3"])
+
+        enrich_backend = mock_enrich_backend('2018-01-01T00:00:00')
+        enrich_backend.elastic.max_items_terms = 1
+
+        eitems = list(refresh_identities_incremental(enrich_backend))
+        self.assertListEqual(eitems, [{"uuid": "1", "author_org_name": "org_id1"},
+                                      {"uuid": "3", "author_org_name": "org_id3"}])
+        enrich_backend.fetch.assert_called_with(None, _source=unittest.mock.ANY)
+
+    @patch('grimoire_elk.elk.SortingHat')
+    def test_incremental_no_changes(self, mock_sh):
+        """Test whether nothing is refreshed when there are no changes"""
+
+        mock_sh.get_modified_identities.return_value = ([], [])
+
+        enrich_backend = mock_enrich_backend('2018-01-01T00:00:00')
+
+        eitems = list(refresh_identities_incremental(enrich_backend))
+        self.assertListEqual(eitems, [])
+        self.assertEqual(enrich_backend.fetch.call_count, 0)
+
+
+class TestItemsFromUuids(unittest.TestCase):
+    """Unit tests for the retrieval of the raw items of a merged uuid"""
+
+    def setUp(self):
+        self.enrich_url = "http://localhost:9200/git_enriched"
+        self.raw_url = "http://localhost:9200/git_raw"
+        self.searches = []
+        self.mgets = []
+
+        self.enrich_backend = MagicMock()
+        self.enrich_backend.get_fields_uuid.return_value = ["author_uuid", "committer_uuid"]
+        self.enrich_backend.get_item_id.side_effect = lambda eitem: eitem["_id"]
+        self.enrich_backend.elastic.major = '6'
+        self.enrich_backend.elastic.index_url = self.enrich_url
+        self.enrich_backend.elastic.max_items_bulk = 2
+
+        self.ocean_backend = MagicMock()
+        self.ocean_backend.elastic.index_url = self.raw_url
+        self.ocean_backend.elastic.max_items_bulk = 2
+
+    def register(self, pages):
+        def search_callback(request, uri, headers):
+            self.assertEqual(request.headers.get('Content-Type'), "application/json")
+            self.searches.append(json.loads(request.body.decode('utf-8')))
+            hits = pages[len(self.searches) - 1]
+            return 200, headers, json.dumps({"hits": {"hits": hits}})
+
+        def mget_callback(request, uri, headers):
+            self.assertEqual(request.headers.get('Content-Type'), "application/json")
+            ids = [doc["_id"] for doc in json.loads(request.body.decode('utf-8'))["docs"]]
+            self.mgets.append(ids)
+            docs = [{"_id": _id, "found": True, "_source": {"id": _id}} for _id in ids]
+            return 200, headers, json.dumps({"docs": docs})
+
+        httpretty.register_uri(httpretty.POST, self.enrich_url + "/_search", body=search_callback)
+        httpretty.register_uri(httpretty.POST, self.raw_url + "/_mget", body=mget_callback)
+
+    @httpretty.activate
+    def test_get_items_from_uuids(self):
+        """Test whether all pages are read for all the uuids and raw ids are deduplicated"""
+
+        self.register([
+            [{"_id": "1", "sort": ["1"]}, {"_id": "1", "sort": ["1"]}],
+            [{"_id": "2", "sort": ["2"]}, {"_id": "3", "sort": ["3"]}],
+            []
+        ])
+
+        items = get_items_from_uuids(["uuid1", "uuid2"], self.enrich_backend, self.ocean_backend)
+
+        # Raw items are read as they are consumed
+        self.assertDictEqual(next(items), {"id": "1"})
+        self.assertListEqual(self.mgets, [["1", "2"]])
+
+        self.assertListEqual(list(items), [{"id": "2"}, {"id": "3"}])
+        self.assertListEqual(self.mgets, [["1", "2"], ["3"]])
+        self.assertEqual(len(self.searches), 3)
+        self.assertNotIn("search_after", self.searches[0])
+        self.assertListEqual(self.searches[1]["search_after"], ["1"])
+        self.assertListEqual(self.searches[2]["search_after"], ["3"])
+        self.assertListEqual(self.searches[0]["query"]["bool"]["should"],
+                             [{"terms": {"author_uuid": ["uuid1", "uuid2"]}},
+                              {"terms": {"committer_uuid": ["uuid1", "uuid2"]}}])
+
+    @httpretty.activate
+    def test_get_items_from_uuid(self):
+        """Test whether the raw items of a single uuid are read"""
+
+        self.register([[{"_id": "1", "sort": ["1"]}], []])
+
+        items = list(get_items_from_uuid("uuid1", self.enrich_backend, self.ocean_backend))
+
+        self.assertListEqual(items, [{"id": "1"}])
+        self.assertDictEqual(self.searches[0]["query"]["bool"]["should"][0],
+                             {"terms": {"author_uuid": ["uuid1"]}})
+
+
+class TestIdentitiesOceanBackend(unittest.TestCase):
+    """Unit tests for the ocean backend loading identities while fetching"""
+
+    @patch('grimoire_elk.elk.SortingHat')
+    def test_fetch(self, mock_sh):
+        """Test whether identities are added to SortingHat before their items are returned"""
+
+        raw_items = [{"author": "a"}, {"author": "b"}, {"author": "a"}]
+        events = []
+
+        ocean_backend = MagicMock()
+        ocean_backend.fetch.return_value = iter(raw_items)
+        ocean_backend.origin = "origin"
+
+        enrich_backend = MagicMock()
+        enrich_backend.get_connector_name.return_value = "git"
+        enrich_backend.get_identities.side_effect = lambda item: [{"name": item["author"]}]
+        mock_sh.add_identities.side_effect = \
+            lambda db, identities, backend: events.append([i["name"] for i in identities])
+
+        fused_backend = IdentitiesOceanBackend(ocean_backend, enrich_backend, batch_size=2)
+        self.assertEqual(fused_backend.origin, "origin")
+
+        for item in fused_backend.fetch():
+            events.append(item["author"])
+
+        self.assertListEqual(events, [["a", "b"], "a", "b", "a"])
+        self.assertEqual(fused_backend.identities_count, 2)
+        ocean_backend.fetch.assert_called_once_with()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+import sys
+import threading
+import unittest
+
+# Make sure we use our code and not any other could we have installed
+sys.path.insert(0, '..')
+
+from grimoire_elk.elk import do_studies
+from grimoire_elk.errors import ELKError
+
+
+class StudiesBackend:
+    """Enrich backend with studies recording their execution"""
+
+    def __init__(self):
+        self.events = []
+        self.lock = threading.Lock()
+        self.both_started = threading.Barrier(2, timeout=5)
+        self.studies = [self.study_a, self.study_b, self.study_c]
+        self.studies_deps = {}
+
+    def record(self, event):
+        with self.lock:
+            self.events.append(event)
+
+    def study_a(self, enrich_backend, no_incremental=False):
+        self.record('a')
+        self.both_started.wait()
+
+    def study_b(self, enrich_backend, no_incremental=False):
+        self.record('b')
+        self.both_started.wait()
+
+    def study_c(self, enrich_backend, no_incremental=False):
+        self.record('c')
+
+
+class TestStudies(unittest.TestCase):
+    """Unit tests for the studies scheduler"""
+
+    def test_concurrent(self):
+        """Test whether independent studies are executed at the same time"""
+
+        backend = StudiesBackend()
+        report = do_studies(backend, workers=2)
+
+        self.assertSetEqual(set(backend.events), {'a', 'b', 'c'})
+        self.assertSetEqual({study['status'] for study in report.values()}, {'done'})
+        self.assertListEqual(sorted(report.keys()), ['study_a', 'study_b', 'study_c'])
+
+    def test_dependencies(self):
+        """Test whether a study is executed after the studies it depends on"""
+
+        backend = StudiesBackend()
+        backend.studies_deps = {'study_c': ['study_a', 'study_b']}
+        report = do_studies(backend, workers=3)
+
+        self.assertEqual(backend.events[-1], 'c')
+        self.assertEqual(report['study_c']['status'], 'done')
+
+    def test_errors(self):
+        """Test whether a failed study doesn't stop the rest and skips its dependants"""
+
+        backend = StudiesBackend()
+        backend.both_started = threading.Barrier(1)
+
+        def study_a(enrich_backend, no_incremental=False):
+            raise RuntimeError("study error")
+        study_a.__name__ = 'study_a'
+        backend.studies[0] = study_a
+        backend.studies_deps = {'study_c': ['study_a']}
+
+        report = do_studies(backend)
+
+        self.assertEqual(report['study_a']['status'], 'failed')
+        self.assertEqual(report['study_b']['status'], 'done')
+        self.assertEqual(report['study_c']['status'], 'skipped')
+        self.assertListEqual(backend.events, ['b'])
+
+    def test_wrong_dependencies(self):
+        """Test whether unknown and circular dependencies are detected"""
+
+        backend = StudiesBackend()
+        backend.studies_deps = {'study_c': ['study_d']}
+        with self.assertRaises(ELKError):
+            do_studies(backend)
+
+        backend.studies_deps = {'study_a': ['study_b'], 'study_b': ['study_a']}
+        backend.both_started = threading.Barrier(1)
+        with self.assertRaises(ELKError):
+            do_studies(backend)
+        self.assertListEqual(backend.events, ['c'])
+
+
+if __name__ == '__main__':
+    unittest.main()
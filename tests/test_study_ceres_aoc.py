@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+import copy
+import json
+import sys
+import unittest
+
+from unittest.mock import MagicMock, patch
+
+from cereslib.dfutils.filter import FilterRows
+from cereslib.enrich.enrich import FileType, FilePath, ToUTF8
+from cereslib.events.events import Git
+
+# Make sure we use our code and not any other could we have installed
+sys.path.insert(0, '..')
+
+from grimoire_elk.enriched.study_ceres_aoc import AreasOfCode, ESPandasConnector
+
+
+def read_commits():
+    with open("data/git.json") as f:
+        commits = json.load(f)
+
+    for commit in commits:
+        commit['metadata__timestamp'] = "2018-01-01T00:00:00"
+        commit['metadata__updated_on'] = "2018-01-01T00:00:00"
+    # Files with binary changes and without action
+    commits[1]['data']['files'].append({"action": "M", "added": "-", "removed": "-",
+                                        "file": "//bin/data.bin"})
+    commits[1]['data']['files'].append({"file": "merged/file.py", "added": "1"})
+    return commits
+
+
+def mock_git_enrich():
+    git_enrich = MagicMock()
+    git_enrich.get_item_project.return_value = {"project": "main", "project_1": "main"}
+    git_enrich.get_item_sh.return_value = {}
+    git_enrich.get_grimoire_fields.return_value = {}
+    git_enrich.get_identity_domain.return_value = "example.com"
+
+    return git_enrich
+
+
+def areas_of_code_cereslib(items_block, git_enrich):
+    """Areas of code events generated by cereslib, to compare with"""
+
+    events_df = Git(items_block, git_enrich).eventize(2)
+    events_df = FilterRows(events_df).filter_(["filepath"], "-")
+    events_df = FileType(events_df).enrich('filepath')
+    events_df = FilePath(events_df).enrich('filepath')
+    events_df = ToUTF8(events_df).enrich(["owner"])
+
+    return events_df
+
+
+class TestAreasOfCode(unittest.TestCase):
+    """Unit tests for the areas of code study"""
+
+    def test_process(self):
+        """Test whether events are the same as the ones generated by cereslib"""
+
+        git_enrich = mock_git_enrich()
+        aoc = AreasOfCode(None, None, 100, git_enrich)
+
+        results = aoc.process(read_commits())
+        expected = areas_of_code_cereslib(read_commits(), git_enrich)
+
+        events = results.out_items.drop(columns=['metadata__enriched_on']).reset_index(drop=True)
+        expected = expected.drop(columns=['metadata__enriched_on']).reset_index(drop=True)
+
+        self.assertEqual(results.processed, len(expected))
+        self.assertListEqual(list(events.columns), list(expected.columns))
+        self.assertListEqual(events.to_dict('records'), expected.to_dict('records'))
+
+    def test_read_block(self):
+        """Test whether items are read with search_after"""
+
+        pages = [
+            {"hits": {"hits": [{"_source": {"uuid": "1"}, "sort": [1, "1"]},
+                               {"_source": {"uuid": "2"}, "sort": [1, "2"]}]}},
+            {"hits": {"hits": [{"_source": {"uuid": "3"}, "sort": [2, "3"]}]}},
+            {"hits": {"hits": []}}
+        ]
+        queries = []
+
+        def search(index, body):
+            queries.append(copy.deepcopy(body))
+            return pages[len(queries) - 1]
+
+        es_conn = MagicMock()
+        es_conn.search.side_effect = search
+
+        conn = ESPandasConnector(es_conn, "git_raw")
+        blocks = list(conn.read_block(2))
+
+        self.assertListEqual(blocks, [[{"uuid": "1"}, {"uuid": "2"}], [{"uuid": "3"}]])
+        self.assertEqual(queries[0]['size'], 2)
+        self.assertListEqual(queries[0]['sort'], [{"metadata__timestamp": {"order": "asc"}},
+                                                  {"uuid": {"order": "asc"}}])
+        self.assertNotIn('search_after', queries[0])
+        self.assertListEqual(queries[1]['search_after'], [1, "2"])
+        self.assertListEqual(queries[2]['search_after'], [2, "3"])
+
+    @patch('grimoire_elk.enriched.ceres_base.helpers.bulk')
+    def test_write(self, mock_bulk):
+        """Test whether bulk actions are generated from the events"""
+
+        docs = []
+        mock_bulk.side_effect = lambda es_conn, actions: (docs.extend(actions) or len(docs), [])
+
+        git_enrich = mock_git_enrich()
+        events = AreasOfCode(None, None, 100, git_enrich).process(read_commits()).out_items
+
+        conn = ESPandasConnector(MagicMock(), "git_aoc", read_only=False)
+        conn.write(events)
+
+        self.assertEqual(len(docs), len(events))
+        expected = events.to_dict("index")
+        for doc, row in zip(docs, expected.values()):
+            self.assertEqual(doc['_index'], "git_aoc")
+            self.assertEqual(doc['_id'], row['perceval_uuid'] + "_" + row['filepath'] + "_" + row['fileaction'])
+            self.assertDictEqual(doc['_source'], row)
+
+
+if __name__ == '__main__':
+    unittest.main()
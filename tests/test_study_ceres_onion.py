@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015-2018 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+
+import copy
+import sys
+import unittest
+
+from unittest.mock import MagicMock, patch
+
+# Make sure we use our code and not any other could we have installed
+sys.path.insert(0, '..')
+
+from grimoire_elk.enriched.study_ceres_onion import ESOnionConnector
+
+
+TIMEFRAME = "2018-01-01T00:00:00.000Z"
+
+# (author_uuid, org, project, author_name, hash, metadata__timestamp)
+COMMITS = [
+    ("uuid1", "org1", "proj1", "Alice", "h1", "2018-02-01T00:00:00.000Z"),
+    ("uuid1", "org1", "proj1", "Alice", "h2", "2018-02-02T00:00:00.000Z"),
+    ("uuid1", "org1", "proj2", "Alice", "h3", "2018-02-03T00:00:00.000Z"),
+    ("uuid2", "org2", "proj1", "Bob", "h4", "2018-02-04T00:00:00.000Z"),
+    ("uuid3", None, "proj2", "Carol", "h5", "2018-02-05T00:00:00.000Z"),
+    ("uuid3", None, None, "Carol", "h6", "2018-02-06T00:00:00.000Z")
+]
+
+
+def composite_buckets():
+    """Buckets of the authors composite aggregation for COMMITS"""
+
+    buckets = {}
+    for uuid, org, project, name, commit, ts in COMMITS:
+        key = (uuid, org, project)
+        bucket = buckets.setdefault(key, {"key": {"author_uuid": uuid,
+                                                  "author_org_name": org,
+                                                  "project": project},
+                                          "hashes": set(), "ts": [], "name": name})
+        bucket["hashes"].add(commit)
+        bucket["ts"].append(ts)
+
+    return [{"key": bucket["key"],
+             "contributions": {"value": len(bucket["hashes"])},
+             "latest_ts": {"value_as_string": max(bucket["ts"])},
+             "author_name": {"buckets": [{"key": bucket["name"]}]}}
+            for bucket in buckets.values()]
+
+
+def mock_es(version, page_size=2):
+    """Elasticsearch connection returning the quarters and authors of COMMITS"""
+
+    es = MagicMock()
+    es.info.return_value = {"version": {"number": version}}
+    buckets = composite_buckets()
+    queries = []
+
+    def search(index, body, **kwargs):
+        queries.append(copy.deepcopy(body))
+        if "timeframe" in body["aggs"]:
+            return {"hits": {"total": 0, "hits": []},
+                    "aggregations": {"timeframe": {"buckets": [{"key_as_string": TIMEFRAME,
+                                                                "doc_count": len(COMMITS)}]}}}
+        composite = body["aggs"]["authors"]["composite"]
+        start = 0
+        if "after" in composite:
+            start = [bucket["key"] for bucket in buckets].index(composite["after"]) + 1
+        page = buckets[start:start + page_size]
+        authors = {"buckets": page}
+        if page:
+            authors["after_key"] = page[-1]["key"]
+        return {"hits": {"total": 0, "hits": []}, "aggregations": {"authors": authors}}
+
+    es.search.side_effect = search
+    es.queries = queries
+    return es
+
+
+def scan_hits(es, query, index, _source):
+    for uuid, org, project, name, commit, ts in COMMITS:
+        source = {"author_uuid": uuid, "author_name": name, "hash": commit, "metadata__timestamp": ts}
+        if org:
+            source["author_org_name"] = org
+        if project:
+            source["project"] = project
+        yield {"_source": source}
+
+
+class TestESOnionConnector(unittest.TestCase):
+    """Unit tests for the onion connector"""
+
+    def read_slices(self, es):
+        conn = ESOnionConnector(es_conn=es, es_index="git_enriched", contribs_field="hash")
+
+        slices = {}
+        for df in conn.read_block():
+            rows = df.to_dict("records")
+            self.assertEqual(len({(row["project"], row["author_org_name"]) for row in rows}), 1)
+            slices[(rows[0]["project"], rows[0]["author_org_name"])] = rows
+
+        return slices
+
+    def assert_slices(self, slices):
+        def contributions(rows):
+            return {row["author_uuid"]: row["contributions"] for row in rows}
+
+        self.assertListEqual(sorted(slices.keys()),
+                             [("_Global_", "_Global_"), ("_Global_", "org1"), ("_Global_", "org2"),
+                              ("proj1", "_Global_"), ("proj1", "org1"), ("proj1", "org2"),
+                              ("proj2", "_Global_"), ("proj2", "org1")])
+
+        self.assertDictEqual(contributions(slices[("_Global_", "_Global_")]),
+                             {"uuid1": 3, "uuid2": 1, "uuid3": 2})
+        self.assertDictEqual(contributions(slices[("_Global_", "org1")]), {"uuid1": 3})
+        self.assertDictEqual(contributions(slices[("_Global_", "org2")]), {"uuid2": 1})
+        self.assertDictEqual(contributions(slices[("proj1", "_Global_")]), {"uuid1": 2, "uuid2": 1})
+        self.assertDictEqual(contributions(slices[("proj1", "org1")]), {"uuid1": 2})
+        self.assertDictEqual(contributions(slices[("proj2", "_Global_")]), {"uuid1": 1, "uuid3": 1})
+
+        for rows in slices.values():
+            for row in rows:
+                self.assertEqual(row["timeframe"], TIMEFRAME)
+        global_rows = slices[("_Global_", "_Global_")]
+        self.assertEqual(global_rows[0]["metadata__timestamp"], "2018-02-06T00:00:00.000Z")
+        self.assertEqual(slices[("proj1", "_Global_")][0]["metadata__timestamp"], "2018-02-04T00:00:00.000Z")
+        self.assertDictEqual({row["author_uuid"]: row["author_name"] for row in global_rows},
+                             {"uuid1": "Alice", "uuid2": "Bob", "uuid3": "Carol"})
+
+    def test_read_block_composite(self):
+        """Test whether each quarter is read with a single paged aggregation"""
+
+        es = mock_es("6.8.0")
+        slices = self.read_slices(es)
+
+        self.assert_slices(slices)
+        # Quarters and 3 pages of authors plus the last empty one
+        self.assertEqual(len(es.queries), 5)
+        self.assertEqual(es.queries[2]["aggs"]["authors"]["composite"]["after"],
+                         {"author_uuid": "uuid1", "author_org_name": "org1", "project": "proj2"})
+
+    @patch('grimoire_elk.enriched.study_ceres_onion.helpers.scan', side_effect=scan_hits)
+    def test_read_block_scan(self, mock_scan):
+        """Test whether authors are scanned for ES versions without composite aggregations"""
+
+        es = mock_es("5.6.0")
+        slices = self.read_slices(es)
+
+        self.assert_slices(slices)
+        self.assertEqual(len(es.queries), 1)
+        self.assertEqual(mock_scan.call_count, 1)
+
+    @patch('grimoire_elk.enriched.study_ceres_onion.helpers.scan', side_effect=scan_hits)
+    def test_read_block_scan_missing_bucket(self, mock_scan):
+        """Test whether authors are scanned for ES versions without missing_bucket in composite"""
+
+        es = mock_es("6.3.2")
+        slices = self.read_slices(es)
+
+        self.assert_slices(slices)
+        self.assertEqual(len(es.queries), 1)
+        self.assertEqual(mock_scan.call_count, 1)
+
+    def test_read_block_from_date(self):
+        """Test whether only quarters with items modified since from_date are read"""
+
+        es = mock_es("6.8.0")
+        conn = ESOnionConnector(es_conn=es, es_index="git_enriched", contribs_field="hash")
+        list(conn.read_block(from_date="2018-02-05T00:00:00"))
+
+        quarters_query = es.queries[0]
+        self.assertDictEqual(quarters_query["query"]["bool"]["filter"][0],
+                             {"range": {"metadata__timestamp": {"gte": "2018-02-05T00:00:00"}}})
+
+    @patch.object(ESOnionConnector, '_bulk')
+    def test_write_refresh_quarters(self, mock_bulk):
+        """Test whether the items of a quarter are deleted before writing its first slice"""
+
+        es = mock_es("6.8.0")
+        es.delete_by_query.return_value = {"deleted": 2}
+        in_conn = ESOnionConnector(es_conn=es, es_index="git_enriched", contribs_field="hash")
+        out_conn = ESOnionConnector(es_conn=es, es_index="git_onion", contribs_field="hash",
+                                    read_only=False)
+
+        for df in in_conn.read_block():
+            out_conn.write(df)
+
+        self.assertEqual(mock_bulk.call_count, 8)
+        self.assertEqual(es.delete_by_query.call_count, 1)
+        _, kwargs = es.delete_by_query.call_args
+        self.assertEqual(kwargs["index"], ["git_onion"])
+        self.assertDictEqual(kwargs["body"], {"query": {"bool": {"filter": [{"term": {"timeframe": TIMEFRAME}}]}}})
+
+        # A new run refreshes the quarter again
+        out_conn = ESOnionConnector(es_conn=es, es_index="git_onion", contribs_field="hash",
+                                    read_only=False)
+        for df in in_conn.read_block():
+            out_conn.write(df)
+        self.assertEqual(es.delete_by_query.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -26,7 +26,13 @@
 import argparse
 import json
 import logging
+import os
 import sys
+import threading
+import time
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 
@@ -34,6 +40,7 @@ from grimoire_elk.elastic import ElasticSearch
 from grimoire_elk.utils import get_connectors, get_connector_name_from_cls_name
 
 DEFAULT_LIMIT = 1000
+SCROLL_TIME = "5m"
 
 
 def get_params():
@@ -56,6 +63,14 @@ def get_params():
                         help='Initial value for starting the search-after')
     parser.add_argument('-c', '--copy', dest='copy', action='store_true',
                         help='Copy the indexes without modifying mappings')
+    parser.add_argument('--slices', default=1, type=int,
+                        help='Number of slices of the input index read in parallel (default 1)')
+    parser.add_argument('--writers', default=1, type=int,
+                        help='Number of bulk requests to the output index sent in parallel (default 1)')
+    parser.add_argument('--checkpoint',
+                        help='JSON file with the progress of each slice. If it exists, the copy is resumed')
+    parser.add_argument('--max-items-sec', type=float,
+                        help='Max items per second written to the output index')
     args = parser.parse_args()
 
     return args
@@ -296,10 +311,277 @@ def fetch(elastic, backend, limit=None, search_after_value=None, scroll=True):
     return
 
 
+class Checkpoint:
+    """ Progress of each slice of a copy, saved in a JSON file to resume it.
+
+    For each slice it keeps the last unique id copied (slices are read
+    sorted by it), the items copied and whether the slice is done.
+    """
+
+    def __init__(self, path, copy_id):
+        self.path = path
+        self.lock = threading.Lock()
+        self.state = {'copy': copy_id, 'slices': {}}
+
+        if path and os.path.exists(path):
+            with open(path) as fd:
+                state = json.load(fd)
+            if state['copy'] != copy_id:
+                logging.error("Checkpoint %s is from other copy: %s", path, state['copy'])
+                sys.exit(1)
+            self.state = state
+            logging.info("Resuming the copy from %s", path)
+
+    def get(self, slice_id):
+        with self.lock:
+            return dict(self.state['slices'].get(str(slice_id), {'last': None, 'copied': 0, 'done': False}))
+
+    def update(self, slice_id, last=None, copied=0, done=False):
+        with self.lock:
+            progress = self.state['slices'].setdefault(str(slice_id), {'last': None, 'copied': 0, 'done': False})
+            if last is not None:
+                progress['last'] = last
+            progress['copied'] += copied
+            progress['done'] = done
+            if self.path:
+                # Don't leave a partial file if the copy is killed while saving
+                tmp_path = self.path + '.tmp'
+                with open(tmp_path, 'w') as fd:
+                    json.dump(self.state, fd)
+                os.replace(tmp_path, self.path)
+
+
+class Throttle:
+    """ Limit the items per second processed by several threads """
+
+    def __init__(self, items_sec=None):
+        self.items_sec = items_sec
+        self.lock = threading.Lock()
+        self.next_time = time.time()
+
+    def wait(self, items):
+        if not self.items_sec:
+            return
+
+        with self.lock:
+            now = time.time()
+            start = max(now, self.next_time)
+            self.next_time = start + items / self.items_sec
+        if start > now:
+            time.sleep(start - now)
+
+
+def get_total(res_json):
+    """ Total hits of a search response (an object since ES 7) """
+
+    total = res_json['hits']['total']
+    return total['value'] if isinstance(total, dict) else total
+
+
+def get_slice_query(slice_id, slices, uid_field=None, after=None, size=DEFAULT_LIMIT):
+    """ Query of the items of a slice. With uid_field, they are sorted by it
+    (after the value `after` if given), otherwise in index order """
+
+    query = {
+        "size": size,
+        "query": {
+            "bool": {
+                "must": []
+            }
+        },
+        "sort": ["_doc"]
+    }
+
+    # max must be greater than 1 in sliced scrolls
+    if slices > 1:
+        query['slice'] = {"id": slice_id, "max": slices}
+    if uid_field:
+        query['sort'] = [{uid_field: "asc"}]
+        if after is not None:
+            query['query']['bool']['must'].append({"range": {uid_field: {"gt": after}}})
+
+    return query
+
+
+def clear_scroll(elastic, scroll_id):
+    headers = {"Content-Type": "application/json"}
+    elastic.requests.delete(elastic.url + "/_search/scroll", data=json.dumps({"scroll_id": [scroll_id]}),
+                            headers=headers)
+
+
+def fetch_slice(elastic, slice_id, slices, uid_field=None, after=None, size=DEFAULT_LIMIT):
+    """ Pages of hits of a slice of the index, read with a scroll """
+
+    headers = {"Content-Type": "application/json"}
+    query = get_slice_query(slice_id, slices, uid_field, after, size)
+    url = elastic.index_url + "/_search?scroll=%s" % SCROLL_TIME
+
+    res = elastic.requests.post(url, data=json.dumps(query), headers=headers)
+    res.raise_for_status()
+    rjson = res.json()
+    scroll_id = rjson.get('_scroll_id')
+
+    try:
+        while rjson['hits']['hits']:
+            yield rjson['hits']['hits']
+
+            scroll_data = {"scroll": SCROLL_TIME, "scroll_id": scroll_id}
+            res = elastic.requests.post(elastic.url + "/_search/scroll", data=json.dumps(scroll_data),
+                                        headers=headers)
+            res.raise_for_status()
+            rjson = res.json()
+            scroll_id = rjson.get('_scroll_id', scroll_id)
+    finally:
+        if scroll_id:
+            clear_scroll(elastic, scroll_id)
+
+
+def count_slice(elastic, slice_id, slices):
+    """ Number of items in a slice of the index """
+
+    headers = {"Content-Type": "application/json"}
+    query = get_slice_query(slice_id, slices, size=1)
+    url = elastic.index_url + "/_search?scroll=%s" % SCROLL_TIME
+
+    res = elastic.requests.post(url, data=json.dumps(query), headers=headers)
+    res.raise_for_status()
+    rjson = res.json()
+    if '_scroll_id' in rjson:
+        clear_scroll(elastic, rjson['_scroll_id'])
+
+    return get_total(rjson)
+
+
+class IndexCopy:
+    """ Copy in parallel the items of elastic_in to elastic_out.
+
+    Each of the `slices` slices of the input index is read by its own
+    thread, and the pages read are written by `writers` threads. With
+    checkpoint_path, the progress of each slice is saved there and an
+    interrupted copy is resumed from it. At the end, the items copied
+    from each slice are checked against the items in the slice.
+    """
+
+    def __init__(self, elastic_in, elastic_out, backend, uid_field, slices=1, writers=1,
+                 checkpoint_path=None, max_items_sec=None, limit=DEFAULT_LIMIT):
+        self.elastic_in = elastic_in
+        self.elastic_out = elastic_out
+        self.backend = backend
+        self.uid_field = uid_field
+        self.slices = slices
+        self.writers = writers
+        self.limit = limit
+
+        copy_id = "%s -> %s (%i slices)" % (elastic_in.index_url, elastic_out.index_url, slices)
+        self.checkpoint = Checkpoint(checkpoint_path, copy_id)
+        self.throttle = Throttle(max_items_sec)
+        self.writers_pool = None
+
+    def copy(self):
+        """ Copy the items. Returns True if all of them were copied """
+
+        with ThreadPoolExecutor(max_workers=self.writers) as self.writers_pool, \
+                ThreadPoolExecutor(max_workers=self.slices) as readers_pool:
+            futures = [readers_pool.submit(self.copy_slice, slice_id) for slice_id in range(self.slices)]
+
+            failed = 0
+            for slice_id, future in enumerate(futures):
+                try:
+                    future.result()
+                except Exception as ex:
+                    logging.error("Error copying slice %i: %s", slice_id, ex)
+                    failed += 1
+
+        if failed:
+            logging.error("%i slices not copied. Run the copy again to resume it", failed)
+            return False
+
+        self.elastic_out.requests.post(self.elastic_out.index_url + "/_refresh")
+
+        return self.verify()
+
+    def copy_slice(self, slice_id):
+        """ Copy a slice, writing its pages with the writers pool.
+
+        The checkpoint of the slice is moved forward only when all the pages
+        read before have been written, so a resumed copy doesn't miss any item.
+        """
+        progress = self.checkpoint.get(slice_id)
+        if progress['done']:
+            logging.info("Slice %i already copied (%i items)", slice_id, progress['copied'])
+            return
+
+        # Sorting by the unique id is only needed to resume the copy
+        sort_field = self.uid_field if self.checkpoint.path else None
+        pending = deque()  # (future, last uid, items) of each page in reading order
+
+        def done_pages(wait_first=False):
+            while pending and (wait_first or pending[0][0].done()):
+                future, last, items = pending.popleft()
+                future.result()
+                self.checkpoint.update(slice_id, last, items)
+                wait_first = False
+
+        for hits in fetch_slice(self.elastic_in, slice_id, self.slices, sort_field, progress['last'], self.limit):
+            future = self.writers_pool.submit(self.write_items, hits)
+            pending.append((future, hits[-1]['_source'][self.uid_field], len(hits)))
+            # Don't read more pages than the ones the writers can take
+            done_pages(wait_first=len(pending) >= 2 * self.writers)
+
+        while pending:
+            done_pages(wait_first=True)
+
+        self.checkpoint.update(slice_id, done=True)
+        logging.info("Slice %i copied (%i items)", slice_id, self.checkpoint.get(slice_id)['copied'])
+
+    def write_items(self, hits):
+        """ Write a page of hits, failing if any of them is not written """
+
+        bulk_json = ""
+        for hit in hits:
+            item = hit['_source']
+            try:
+                self.backend._fix_item(item)
+            except Exception:
+                pass
+            bulk_json += '{"index" : {"_id" : "%s" } }\n' % (item[self.uid_field])
+            bulk_json += json.dumps(item) + "\n"
+
+        self.throttle.wait(len(hits))
+        # The output index is refreshed once at the end of the copy
+        url = self.elastic_out.index_url + '/items/_bulk'
+        inserted = self.elastic_out.safe_put_bulk(url, bulk_json, refresh=False)
+        if inserted != len(hits):
+            raise RuntimeError("%i of %i items not written to %s" % (len(hits) - inserted, len(hits), url))
+
+        return inserted
+
+    def verify(self):
+        """ Check the items copied from each slice against the items in it """
+
+        copied_ok = True
+        for slice_id in range(self.slices):
+            total = count_slice(self.elastic_in, slice_id, self.slices)
+            copied = self.checkpoint.get(slice_id)['copied']
+            if copied != total:
+                logging.error("Slice %i: %i items copied, %i items in %s", slice_id, copied, total,
+                              self.elastic_in.index_url)
+                copied_ok = False
+            else:
+                logging.debug("Slice %i: %i items copied", slice_id, copied)
+
+        return copied_ok
+
+
 def export_items(elastic_url, in_index, out_index, elastic_url_out=None,
                  search_after=False, search_after_value=None, limit=None,
-                 copy=False):
-    """ Export items from in_index to out_index using the correct mapping """
+                 copy=False, slices=1, writers=1, checkpoint=None, max_items_sec=None):
+    """ Export items from in_index to out_index using the correct mapping.
+
+    Unless search_after is used, the items are copied with IndexCopy
+    (see it for slices, writers, checkpoint and max_items_sec).
+    Returns whether all the items were copied.
+    """
 
     if not limit:
         limit = DEFAULT_LIMIT
@@ -343,17 +625,22 @@ def export_items(elastic_url, in_index, out_index, elastic_url_out=None,
     if search_after:
         total = elastic_out.bulk_upload(fetch(elastic_in, backend, limit,
                                               search_after_value, scroll=False), uid_field)
-    else:
-        total = elastic_out.bulk_upload(fetch(elastic_in, backend, limit), uid_field)
+        logging.info("Total items copied: %i", total)
+        return True
 
-    logging.info("Total items copied: %i", total)
+    index_copy = IndexCopy(elastic_in, elastic_out, backend, uid_field, slices, writers,
+                           checkpoint, max_items_sec, limit)
+    copied_ok = index_copy.copy()
 
+    logging.info("Total items copied: %i", sum(index_copy.checkpoint.get(slice_id)['copied']
+                                               for slice_id in range(slices)))
+    return copied_ok
 
-if __name__ == '__main__':
 
-    ARGS = get_params()
+def main():
+    args = get_params()
 
-    if ARGS.debug:
+    if args.debug:
         logging.basicConfig(level=logging.DEBUG, format='%(asctime)s %(message)s')
         logging.debug("Debug mode activated")
     else:
@@ -361,9 +648,15 @@ if __name__ == '__main__':
     logging.getLogger("urllib3").setLevel(logging.WARNING)
     logging.getLogger("requests").setLevel(logging.WARNING)
 
-    if ARGS.limit:
-        ElasticSearch.max_items_bulk = ARGS.limit
+    if args.limit:
+        ElasticSearch.max_items_bulk = args.limit
 
-    export_items(ARGS.elastic_url, ARGS.in_index, ARGS.out_index,
-                 ARGS.elastic_url_write, ARGS.search_after, ARGS.search_after_value,
-                 ARGS.limit, ARGS.copy)
+    if not export_items(args.elastic_url, args.in_index, args.out_index,
+                        args.elastic_url_write, args.search_after, args.search_after_value,
+                        args.limit, args.copy, args.slices, args.writers, args.checkpoint,
+                        args.max_items_sec):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
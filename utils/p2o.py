@@ -27,9 +27,12 @@ import logging
 from datetime import datetime
 from os import sys
 
-from grimoire_elk.elk import feed_backend, enrich_backend
+from grimoire_elk.batch import read_jobs, run_batch, run_job
 from grimoire_elk.elastic import ElasticSearch
 from grimoire_elk.elastic_items import ElasticItems
+from grimoire_elk.metrics import metrics
+from grimoire_elk.profiling import profiler
+from grimoire_elk.raw.elastic import ElasticOcean
 from grimoire_elk.utils import get_params, config_logging
 
 
@@ -41,45 +44,27 @@ if __name__ == '__main__':
 
     config_logging(args.debug)
 
-    url = args.elastic_url
+    if args.profile:
+        profiler.configure(args.profile, args.profile_dir)
 
-    clean = args.no_incremental
-    if args.fetch_cache:
-        clean = True
+    failed_jobs = 0
 
     try:
-        if args.backend:
+        if args.backend or args.batch:
             # Configure elastic bulk size and scrolling
             if args.bulk_size:
                 ElasticSearch.max_items_bulk = args.bulk_size
             if args.scroll_size:
                 ElasticItems.scroll_size = args.scroll_size
-            if not args.enrich_only:
-                feed_backend(url, clean, args.fetch_cache,
-                             args.backend, args.backend_args,
-                             args.index, args.index_enrich, args.project,
-                             args.arthur)
-                logging.info("Backend feed completed")
-
-            if args.enrich or args.enrich_only:
-                unaffiliated_group = None
-                enrich_backend(url, clean, args.backend, args.backend_args,
-                               args.index, args.index_enrich,
-                               args.db_projects_map, args.json_projects_map,
-                               args.db_sortinghat,
-                               args.no_incremental, args.only_identities,
-                               args.github_token,
-                               args.studies, args.only_studies,
-                               args.elastic_url_enrich, args.events_enrich,
-                               args.db_user, args.db_password, args.db_host,
-                               args.refresh_projects, args.refresh_identities,
-                               args.author_id, args.author_uuid,
-                               args.filter_raw, args.filters_raw_prefix,
-                               args.jenkins_rename_file, unaffiliated_group,
-                               args.pair_programming)
-                logging.info("Enrich backend completed")
-            elif args.events_enrich:
-                logging.info("Enrich option is needed for events_enrich")
+            if args.feed_workers:
+                ElasticOcean.feed_workers = args.feed_workers
+
+        if args.batch:
+            report = run_batch(args, read_jobs(args.batch), args.batch_workers)
+            failed_jobs = len([result for result in report if result['status'] == 'failed'])
+        elif args.backend:
+            run_job(args, args.backend, args.backend_args,
+                    args.index, args.index_enrich, args.project)
         else:
             logging.error("You must configure a backend")
 
@@ -90,3 +75,12 @@ if __name__ == '__main__':
     total_time_min = (datetime.now() - app_init).total_seconds() / 60
 
     logging.info("Finished in %.2f min" % (total_time_min))
+
+    metrics.log_summary()
+    if args.metrics_json:
+        metrics.write_json(args.metrics_json)
+    if args.metrics_prometheus:
+        metrics.write_prometheus(args.metrics_prometheus)
+
+    if failed_jobs:
+        sys.exit(1)